@@ -6,189 +6,183 @@ Erstellt eine geografische Karte für die Fritz-Kola Supply-Chain-Analyse
 生成Fritz-Kola供应链分析的地理地图
 """
 
-import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend - wichtig für Server/ohne Display
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-import numpy as np
 import sys
 import os
 
-print("Initializing matplotlib...")
+# Shared gallery tooling lives in <repo>/tools
+TOOLS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'tools'))
+if TOOLS_DIR not in sys.path:
+    sys.path.insert(0, TOOLS_DIR)
 
-# Try to use cartopy for better maps, fallback to basic matplotlib if not available
-HAS_CARTOPY = False
-try:
-    import cartopy.crs as ccrs
-    import cartopy.feature as cfeature
-    HAS_CARTOPY = True
-    print("Cartopy available - will use geographic features")
-except ImportError:
-    print("Warning: cartopy not available, using basic map. Install with: pip install cartopy")
-except Exception as e:
-    print(f"Warning: cartopy import failed: {e}, using basic map")
-    HAS_CARTOPY = False
+import base_map
+import density
+import feature_cache
+import gazetteer
+import geodesic
+import instrument
+import label_placer
+import lazy_deps
+import map_cache
+import map_layers
+import network
+import render_engine
+import route_metrics
 
-def create_supply_chain_map():
+# matplotlib and cartopy are imported on first render (see tools/lazy_deps.py)
+# so that importing this module to read its data stays fast.
+
+# Coordinates (Hamburg, Germany)
+HAMBURG_LAT, HAMBURG_LON = 53.5511, 9.9937
+
+PRODUCT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Nodes and routes of each map (see tools/network.py for the file layout)
+SUPPLY_CHAIN_NETWORK = os.path.join(PRODUCT_DIR, 'fritz-kola-supply-chain.json')
+MANUFACTURER_NETWORK = os.path.join(PRODUCT_DIR, 'fritz-kola-manufacturer.json')
+ROUTE_METRICS_NETWORK = SUPPLY_CHAIN_NETWORK
+
+# Optional large point file (CSV or GeoJSON) of retail points, drawn as a
+# density layer on the supply chain map when present (see tools/density.py)
+SUPPLY_CHAIN_POINTS = os.path.join(PRODUCT_DIR, 'fritz-kola-retail-points.csv')
+
+# Image written by each map, as included by fritz-kola.tex. The extension
+# follows MAP_FORMAT (png, pdf or svg, see tools/map_cache.py)
+SUPPLY_CHAIN_OUTPUT = 'fritz-kola-supply-chain-map.png'
+MANUFACTURER_OUTPUT = 'fritz-kola-manufacturer-map.png'
+
+# LaTeX tables \input by fritz-kola.tex (see tools/route_metrics.py)
+ROUTE_METRICS_OUTPUT = 'fritz-kola-route-metrics.tex'
+
+# Marker style per node type
+SUPPLY_CHAIN_STYLES = {
+    'production': {'color': 'red'},
+    'distribution': {'color': 'blue'},
+    'market': {'color': 'green'},
+}
+
+# Product title font, shared by both maps
+TITLE_STYLE = {'fontsize': 14, 'fontweight': 'bold', 'pad': 20}
+
+# Static background: extent, features, gridlines and legend. Rendered once
+# and reused by every map with the same style (see tools/base_map.py)
+SUPPLY_CHAIN_BASE_MAP = {
+    'name': 'central-europe',
+    'figsize': (14, 10),
+    'dpi': 300,
+    'extent': [5, 15, 47, 56],  # Central Europe
+    'geo': True,
+    'label_fontsize': 10,
+    'legend': {
+        'entries': [
+            {'color': 'red', 's': 300, 'linewidths': 1.5,
+             'label': 'Production / Produktion / 生产'},
+            {'color': 'blue', 's': 150, 'linewidths': 1.5,
+             'label': 'Distribution Center / Vertriebszentrum / 分销中心'},
+            {'color': 'green', 's': 100, 'linewidths': 1.5,
+             'label': 'Market / Markt / 市场'},
+            {'line': True, 'color': 'blue', 'linestyle': '--', 'linewidth': 1.5,
+             'label': 'Supply Route / Lieferroute / 供应路线'},
+        ],
+        'loc': 'upper left', 'fontsize': 9, 'framealpha': 0.9,
+        'title': 'Legend / Legende / 图例', 'title_fontsize': 10,
+    },
+    'title': TITLE_STYLE,
+}
+
+# Render parameters, part of the map cache key
+SUPPLY_CHAIN_PARAMS = {
+    'base_map': SUPPLY_CHAIN_BASE_MAP,
+    'route_step_deg': 0.1,  # great-circle vertex spacing of the routes
+    # Nodes of these types are binned instead of drawn one by one once there
+    # are more than min_nodes of them; the points file is always binned
+    'density': {
+        'mode': 'hexbin',  # or 'grid'
+        'types': ['market'],
+        'min_nodes': 2000,
+        'bins_across': density.BINS_ACROSS,
+        'cmap': 'Greens',
+        'log': True,
+        'label': 'Retail points per cell / Verkaufsstellen pro Zelle / 每格零售点数',
+    },
+}
+
+# Zoom range of the web map tiles (see tools/tiles.py)
+SUPPLY_CHAIN_TILES = {'min_zoom': 4, 'max_zoom': 10}
+
+def create_supply_chain_map(output_dir='.'):
     """Create a supply chain map showing manufacturer location and distribution"""
     
-    print("Creating supply chain map...")
-    
-    if HAS_CARTOPY:
-        try:
-            print("Using cartopy for geographic features...")
-            # Use cartopy for a real geographic map
-            fig = plt.figure(figsize=(14, 10))
-            ax = plt.axes(projection=ccrs.PlateCarree())
-            
-            # Set map extent (Central Europe)
-            ax.set_extent([5, 15, 47, 56], crs=ccrs.PlateCarree())
-            
-            # Add map features with error handling
-            try:
-                print("Adding map features...")
-                ax.add_feature(cfeature.COASTLINE, linewidth=0.5)
-                ax.add_feature(cfeature.BORDERS, linewidth=0.5)
-                ax.add_feature(cfeature.LAND, alpha=0.5, color='lightgray')
-                ax.add_feature(cfeature.OCEAN, alpha=0.3, color='lightblue')
-                ax.gridlines(draw_labels=True, linewidth=0.5, alpha=0.5, linestyle='--')
-            except Exception as e:
-                print(f"Warning: Could not load all cartopy features: {e}")
-                # Continue without some features
-                pass
-        except Exception as e:
-            print(f"Error with cartopy, falling back to basic map: {e}")
-            HAS_CARTOPY = False
-    
-    if not HAS_CARTOPY:
-        # Fallback: Basic matplotlib map
-        print("Using basic matplotlib map...")
-        fig, ax = plt.subplots(figsize=(14, 10))
-        ax.set_xlim(5, 15)
-        ax.set_ylim(47, 56)
-        ax.set_aspect('equal')
-        ax.grid(True, alpha=0.3, linestyle='--')
-        ax.set_xlabel('Longitude / Längengrad / 经度', fontsize=10)
-        ax.set_ylabel('Latitude / Breitengrad / 纬度', fontsize=10)
+    output_file = map_cache.output_path(output_dir, SUPPLY_CHAIN_OUTPUT)
+    key = map_cache.cache_key(
+        inputs={'network': map_cache.file_digest(SUPPLY_CHAIN_NETWORK),
+                'points': (map_cache.file_digest(SUPPLY_CHAIN_POINTS)
+                           if os.path.exists(SUPPLY_CHAIN_POINTS) else None),
+                'styles': SUPPLY_CHAIN_STYLES,
+                'backend': render_engine.select(SUPPLY_CHAIN_BASE_MAP).name},
+        params=SUPPLY_CHAIN_PARAMS,
+        sources=[__file__, render_engine.__file__, base_map.__file__, feature_cache.__file__,
+                 map_layers.__file__, network.__file__, label_placer.__file__, geodesic.__file__,
+                 density.__file__, gazetteer.__file__, gazetteer.GAZETTEER_FILE],
+    )
+    return map_cache.cached_render(output_file, key, _render_supply_chain_map)
+
+def _render_supply_chain_map(output_file):
+    """Render the supply chain map to output_file"""
     
-    # Coordinates (Hamburg, Germany)
-    hamburg_lat, hamburg_lon = 53.5511, 9.9937
+    print("Creating supply chain map...")
+    params = SUPPLY_CHAIN_PARAMS
+    net = network.load_network(SUPPLY_CHAIN_NETWORK)
+    plt = lazy_deps.pyplot()
     
-    # Major distribution centers and markets
-    locations = {
-        'Hamburg (Production)': {
-            'coords': (hamburg_lon, hamburg_lat),
-            'type': 'production',
-            'color': 'red',
-            'size': 300
-        },
-        'Berlin': {
-            'coords': (13.4050, 52.5200),
-            'type': 'distribution',
-            'color': 'blue',
-            'size': 150
-        },
-        'Munich': {
-            'coords': (11.5820, 48.1351),
-            'type': 'distribution',
-            'color': 'blue',
-            'size': 150
-        },
-        'Cologne': {
-            'coords': (6.9603, 50.9375),
-            'type': 'distribution',
-            'color': 'blue',
-            'size': 150
-        },
-        'Amsterdam': {
-            'coords': (4.9041, 52.3676),
-            'type': 'market',
-            'color': 'green',
-            'size': 100
-        },
-        'Vienna': {
-            'coords': (16.3738, 48.2082),
-            'type': 'market',
-            'color': 'green',
-            'size': 100
-        },
-        'Zurich': {
-            'coords': (8.5417, 47.3769),
-            'type': 'market',
-            'color': 'green',
-            'size': 100
-        }
-    }
+    # Background with features, gridlines and legend, shared by all products
+    # (a cached raster for PNG, drawn live for PDF and SVG), from the backend
+    # chosen for this job (see tools/render_engine.py)
+    template = render_engine.canvas(params['base_map'], output_file)
     
-    # Plot locations
-    for name, info in locations.items():
-        lon, lat = info['coords']
-        color = info['color']
-        size = info['size']
-        
-        if HAS_CARTOPY:
-            ax.scatter(lon, lat, c=color, s=size, alpha=0.7, 
-                      transform=ccrs.PlateCarree(), 
-                      edgecolors='black', linewidths=1.5, zorder=5)
-            # Add labels
-            ax.text(lon + 0.2, lat + 0.1, name, 
-                   transform=ccrs.PlateCarree(), 
-                   fontsize=8, ha='left', va='bottom',
-                   bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.7))
-        else:
-            ax.scatter(lon, lat, c=color, s=size, alpha=0.7, 
-                      edgecolors='black', linewidths=1.5, zorder=5)
-            ax.text(lon + 0.2, lat + 0.1, name, 
-                   fontsize=8, ha='left', va='bottom',
-                   bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.7))
+    # Product layers go on an overlay aligned with the background;
+    # transform is the lon/lat source CRS on cartopy axes, else None
+    fig, ax, transform = template.overlay()
     
-    # Draw supply chain routes
-    routes = [
-        (hamburg_lon, hamburg_lat, 13.4050, 52.5200, 'Berlin'),
-        (hamburg_lon, hamburg_lat, 11.5820, 48.1351, 'Munich'),
-        (hamburg_lon, hamburg_lat, 6.9603, 50.9375, 'Cologne'),
-        (6.9603, 50.9375, 4.9041, 52.3676, 'Amsterdam'),
-        (11.5820, 48.1351, 16.3738, 48.2082, 'Vienna'),
-        (11.5820, 48.1351, 8.5417, 47.3769, 'Zurich'),
-    ]
+    # Types with too many nodes for one marker each go into the density layer
+    binned = net.types < 0
+    for type_name in params['density']['types']:
+        mask = net.type_mask(type_name)
+        if mask.sum() > params['density']['min_nodes']:
+            binned |= mask
+    shown = ~binned
     
-    for route in routes:
-        x1, y1, x2, y2, name = route
-        if HAS_CARTOPY:
-            ax.plot([x1, x2], [y1, y2], 'b--', linewidth=1.5, alpha=0.5,
-                   transform=ccrs.PlateCarree(), zorder=3)
-        else:
-            ax.plot([x1, x2], [y1, y2], 'b--', linewidth=1.5, alpha=0.5, zorder=3)
+    obstacles = [template.legend] if template.legend else []
+    if binned.any() or os.path.exists(SUPPLY_CHAIN_POINTS):
+        with instrument.stage('density', nodes=int(binned.sum())):
+            _draw_density(ax, transform, net.lons[binned], net.lats[binned], obstacles)
     
-    # Create legend
-    legend_elements = [
-        plt.scatter([], [], c='red', s=300, edgecolors='black', linewidths=1.5, 
-                   label='Production / Produktion / 生产'),
-        plt.scatter([], [], c='blue', s=150, edgecolors='black', linewidths=1.5,
-                   label='Distribution Center / Vertriebszentrum / 分销中心'),
-        plt.scatter([], [], c='green', s=100, edgecolors='black', linewidths=1.5,
-                   label='Market / Markt / 市场'),
-        plt.Line2D([0], [0], color='blue', linestyle='--', linewidth=1.5,
-                  label='Supply Route / Lieferroute / 供应路线')
-    ]
+    with instrument.stage('artists', nodes=int(shown.sum()), edges=net.n_edges):
+        # Plot locations, one scatter call per location type
+        map_layers.plot_points(ax, net.lons[shown], net.lats[shown], net.node_types()[shown],
+                               SUPPLY_CHAIN_STYLES, sizes=net.sizes[shown], transform=transform,
+                               alpha=0.7, edgecolors='black', linewidths=1.5, zorder=5)
     
-    ax.legend(handles=legend_elements, loc='upper left', fontsize=9,
-             title='Legend / Legende / 图例', title_fontsize=10,
-             framealpha=0.9)
+        # Draw supply chain routes along great circles, as a single LineCollection
+        paths = geodesic.great_circle_paths(*net.edge_coords(), step_deg=params['route_step_deg'])
+        map_layers.add_paths(ax, paths, transform=transform, colors='blue', linestyles='--',
+                             linewidths=1.5, alpha=0.5, zorder=3)
     
     # Title (trilingual)
     title = ('Fritz-Kola Supply Chain Map / '
              'Fritz-Kola Supply-Chain-Karte / '
              'Fritz-Kola 供应链地图')
-    ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+    template.set_title(ax, title, **TITLE_STYLE)
     
-    plt.tight_layout()
+    # Labels keep clear of the legend and the density colorbar (see tools/label_placer.py)
+    with instrument.stage('labels'):
+        label_placer.place_labels(ax, net.lons[shown], net.lats[shown], net.names[shown],
+                                  net.sizes[shown], transform=transform, fontsize=8,
+                                  obstacles=obstacles)
     
     # Save figure
-    output_file = 'fritz-kola-supply-chain-map.png'
     print(f"Saving map to {output_file}...")
     try:
-        plt.savefig(output_file, dpi=300, bbox_inches='tight', facecolor='white')
+        template.composite(fig, output_file)
         print(f"✓ Map saved successfully to {output_file}")
         plt.close(fig)  # Close figure to free memory
     except Exception as e:
@@ -197,100 +191,132 @@ def create_supply_chain_map():
     
     return output_file
 
-def create_manufacturer_location_map():
-    """Create a detailed map showing manufacturer location in Hamburg"""
+def _draw_density(ax, transform, lons, lats, obstacles):
+    """Bin the given nodes and the retail points file into one density layer"""
     
-    fig, ax = plt.subplots(figsize=(12, 10))
+    options = SUPPLY_CHAIN_PARAMS['density']
+    extent = SUPPLY_CHAIN_PARAMS['base_map']['extent']
+    grid = density.make_grid(options['mode'], extent, bins_across=options['bins_across'])
+    grid.add(lons, lats)
+    if os.path.exists(SUPPLY_CHAIN_POINTS):
+        n_points = density.aggregate_file(grid, SUPPLY_CHAIN_POINTS)
+        print(f"Binned {n_points} retail points from {os.path.basename(SUPPLY_CHAIN_POINTS)}")
+    if grid.total == 0:
+        return None
     
-    # Hamburg area coordinates
-    hamburg_center_lat, hamburg_center_lon = 53.5511, 9.9937
-    
-    # Set map extent (Hamburg region) - adjusted to prevent overlap
-    lat_range = 0.25
-    lon_range = 0.35
-    ax.set_xlim(hamburg_center_lon - lon_range, hamburg_center_lon + lon_range)
-    ax.set_ylim(hamburg_center_lat - lat_range, hamburg_center_lat + lat_range)
-    ax.set_aspect('equal')
+    layer = grid.draw(ax, transform, cmap=options['cmap'],
+                      norm=density.count_norm(grid, options['log']), alpha=0.8, zorder=2)
+    cax = density.add_colorbar(ax, layer, options['label'])
+    extent = cax.get_tightbbox(ax.figure.canvas.get_renderer())
+    obstacles.append((extent.x0, extent.y0, extent.x1, extent.y1))
+    return layer
+
+# Marker style per node type
+MANUFACTURER_STYLES = {
+    'production': {'color': 'red', 'marker': 'o'},
+    'port': {'color': 'blue', 'marker': 's'},
+    'city-center': {'color': 'green', 'marker': '^'},
+}
+
+# Hamburg area coordinates and map extent (Hamburg region)
+MANUFACTURER_CENTER = (HAMBURG_LON, HAMBURG_LAT)
+MANUFACTURER_LON_RANGE, MANUFACTURER_LAT_RANGE = 0.35, 0.25
+
+# Static background of the manufacturer map (see tools/base_map.py)
+MANUFACTURER_BASE_MAP = {
+    'name': 'hamburg',
+    'figsize': (12, 10),
+    'dpi': 300,
+    'extent': [MANUFACTURER_CENTER[0] - MANUFACTURER_LON_RANGE,
+               MANUFACTURER_CENTER[0] + MANUFACTURER_LON_RANGE,
+               MANUFACTURER_CENTER[1] - MANUFACTURER_LAT_RANGE,
+               MANUFACTURER_CENTER[1] + MANUFACTURER_LAT_RANGE],
+    'geo': False,
+    'label_fontsize': 11,
+    'legend': {
+        'entries': [
+            {'color': 'red', 's': 400, 'marker': 'o', 'linewidths': 2,
+             'label': 'Production Facility / Produktionsstätte / 生产设施'},
+            {'color': 'blue', 's': 200, 'marker': 's', 'linewidths': 2,
+             'label': 'Port / Hafen / 港口'},
+            {'color': 'green', 's': 150, 'marker': '^', 'linewidths': 2,
+             'label': 'City Center / Stadtzentrum / 市中心'},
+        ],
+        'loc': 'upper right', 'fontsize': 9, 'framealpha': 0.9,
+        'title': 'Legend / Legende / 图例', 'title_fontsize': 10,
+    },
+    'title': TITLE_STYLE,
+}
+
+# Render parameters, part of the map cache key
+MANUFACTURER_PARAMS = {
+    'base_map': MANUFACTURER_BASE_MAP,
+    'center': MANUFACTURER_CENTER,
+}
+
+# Zoom range of the web map tiles (see tools/tiles.py)
+MANUFACTURER_TILES = {'min_zoom': 9, 'max_zoom': 15}
+
+def create_manufacturer_location_map(output_dir='.'):
+    """Create a detailed map showing manufacturer location in Hamburg"""
     
-    # Draw Hamburg outline (simplified)
-    hamburg_box = mpatches.Rectangle(
-        (hamburg_center_lon - 0.2, hamburg_center_lat - 0.15),
-        0.4, 0.3,
-        linewidth=2, edgecolor='navy', facecolor='lightblue', alpha=0.3
+    output_file = map_cache.output_path(output_dir, MANUFACTURER_OUTPUT)
+    key = map_cache.cache_key(
+        inputs={'network': map_cache.file_digest(MANUFACTURER_NETWORK),
+                'styles': MANUFACTURER_STYLES,
+                'backend': render_engine.select(MANUFACTURER_BASE_MAP).name},
+        params=MANUFACTURER_PARAMS,
+        sources=[__file__, render_engine.__file__, base_map.__file__, map_layers.__file__,
+                 network.__file__, label_placer.__file__, gazetteer.__file__,
+                 gazetteer.GAZETTEER_FILE],
     )
-    ax.add_patch(hamburg_box)
-    
-    # Key locations in Hamburg - adjusted to prevent overlap
-    locations = {
-        'Fritz-Kola Production': {
-            'coords': (9.9937, 53.5511),  # Original location
-            'color': 'red',
-            'size': 400,
-            'marker': 'o',
-            'offset': (15, 25)  # Annotation offset
-        },
-        'Hamburg Port': {
-            'coords': (9.9786, 53.5438),  # Original location (southwest)
-            'color': 'blue',
-            'size': 200,
-            'marker': 's',
-            'offset': (-20, -25)  # Annotation offset (left and down)
-        },
-        'City Center': {
-            'coords': (10.005, 53.5506),  # Slightly shifted east to avoid overlap
-            'color': 'green',
-            'size': 150,
-            'marker': '^',
-            'offset': (15, -25)  # Annotation offset (right and down)
-        }
-    }
+    return map_cache.cached_render(output_file, key, _render_manufacturer_location_map)
+
+def _render_manufacturer_location_map(output_file):
+    """Render the manufacturer location map to output_file"""
     
-    # Plot locations
-    for name, info in locations.items():
-        lon, lat = info['coords']
-        ax.scatter(lon, lat, c=info['color'], s=info['size'], 
-                  marker=info['marker'], alpha=0.7, 
-                  edgecolors='black', linewidths=2, zorder=5)
-        # Use custom offset to prevent label overlap
-        offset_x, offset_y = info['offset']
-        ax.annotate(name, (lon, lat), xytext=(offset_x, offset_y), 
-                   textcoords='offset points', fontsize=9,
-                   bbox=dict(boxstyle='round,pad=0.5', facecolor='white', alpha=0.8),
-                   arrowprops=dict(arrowstyle='->', connectionstyle='arc3,rad=0.2', 
-                                  lw=1.5, color='black', alpha=0.6))
+    params = MANUFACTURER_PARAMS
+    net = network.load_network(MANUFACTURER_NETWORK)
+    plt = lazy_deps.pyplot()
+    import matplotlib.patches as mpatches
     
-    # Add grid
-    ax.grid(True, alpha=0.3, linestyle='--')
-    ax.set_xlabel('Longitude / Längengrad / 经度', fontsize=11)
-    ax.set_ylabel('Latitude / Breitengrad / 纬度', fontsize=11)
+    # Grid, axis labels and legend come from the backend's background
+    template = render_engine.canvas(params['base_map'], output_file)
+    fig, ax, _ = template.overlay()
     
-    # Legend
-    legend_elements = [
-        plt.scatter([], [], c='red', s=400, marker='o', edgecolors='black', linewidths=2,
-                   label='Production Facility / Produktionsstätte / 生产设施'),
-        plt.scatter([], [], c='blue', s=200, marker='s', edgecolors='black', linewidths=2,
-                   label='Port / Hafen / 港口'),
-        plt.scatter([], [], c='green', s=150, marker='^', edgecolors='black', linewidths=2,
-                   label='City Center / Stadtzentrum / 市中心')
-    ]
+    with instrument.stage('artists', nodes=len(net), edges=net.n_edges):
+        # Draw Hamburg outline (simplified)
+        hamburg_center_lon, hamburg_center_lat = params['center']
+        hamburg_box = mpatches.Rectangle(
+            (hamburg_center_lon - 0.2, hamburg_center_lat - 0.15),
+            0.4, 0.3,
+            linewidth=2, edgecolor='navy', facecolor='lightblue', alpha=0.3
+        )
+        ax.add_patch(hamburg_box)
     
-    ax.legend(handles=legend_elements, loc='upper right', fontsize=9,
-             title='Legend / Legende / 图例', title_fontsize=10,
-             framealpha=0.9)
+        # Plot locations, one scatter call per marker style
+        map_layers.plot_points(ax, net.lons, net.lats, net.node_types(), MANUFACTURER_STYLES,
+                               sizes=net.sizes, alpha=0.7, edgecolors='black',
+                               linewidths=2, zorder=5)
     
     # Title
     title = ('Fritz-Kola Manufacturer Location / '
              'Fritz-Kola Herstellerstandort / '
              'Fritz-Kola 制造商位置')
-    ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+    template.set_title(ax, title, **TITLE_STYLE)
     
-    plt.tight_layout()
+    # Labels keep clear of the background's legend (see tools/label_placer.py)
+    with instrument.stage('labels'):
+        label_placer.place_labels(ax, net.lons, net.lats, net.names, net.sizes,
+                                  fontsize=9, pad=0.5, box_alpha=0.8, gap=12,
+                                  arrowprops=dict(arrowstyle='->', connectionstyle='arc3,rad=0.2',
+                                                  lw=1.5, color='black', alpha=0.6),
+                                  obstacles=[template.legend] if template.legend else ())
     
     # Save figure
-    output_file = 'fritz-kola-manufacturer-map.png'
     print(f"Saving manufacturer map to {output_file}...")
     try:
-        plt.savefig(output_file, dpi=300, bbox_inches='tight', facecolor='white')
+        template.composite(fig, output_file)
         print(f"✓ Manufacturer map saved successfully to {output_file}")
         plt.close(fig)  # Close figure to free memory
     except Exception as e:
@@ -299,24 +325,76 @@ def create_manufacturer_location_map():
     
     return output_file
 
+# Table parameters, part of the cache key
+ROUTE_METRICS_PARAMS = {
+    'matrix_types': ['production', 'distribution'],  # sites of the distance matrix
+    'source_type': 'production',  # delivery paths start at the nearest of these
+    'max_matrix': 8,
+    'max_rows': 25,
+    'directed': True,  # follow routes only in their from -> to direction
+    'label': 'route',
+}
+
+def create_route_metrics_table(output_dir='.'):
+    """Create the distance and delivery-path tables of the supply chain network"""
+    
+    output_file = map_cache.output_path(output_dir, ROUTE_METRICS_OUTPUT)
+    key = map_cache.cache_key(
+        inputs={'network': map_cache.file_digest(ROUTE_METRICS_NETWORK)},
+        params=ROUTE_METRICS_PARAMS,
+        sources=[__file__, route_metrics.__file__, geodesic.__file__, network.__file__,
+                 gazetteer.__file__, gazetteer.GAZETTEER_FILE],
+    )
+    return map_cache.cached_render(output_file, key, _render_route_metrics_table)
+
+def _render_route_metrics_table(output_file):
+    """Write the route metric tables to output_file"""
+    
+    params = ROUTE_METRICS_PARAMS
+    net = network.load_network(ROUTE_METRICS_NETWORK)
+    with instrument.stage('route metrics', nodes=len(net), edges=net.n_edges):
+        route_metrics.write_route_tables(net, output_file,
+                                         matrix_types=tuple(params['matrix_types']),
+                                         source_type=params['source_type'],
+                                         max_matrix=params['max_matrix'],
+                                         max_rows=params['max_rows'],
+                                         directed=params['directed'],
+                                         label=params['label'])
+    print(f"✓ Route metrics saved to {output_file}")
+    return output_file
+
+# Map kinds rendered by this product, used by tools/build_maps.py
+MAPS = {
+    'supply-chain': create_supply_chain_map,
+    'manufacturer': create_manufacturer_location_map,
+    'route-metrics': create_route_metrics_table,
+}
+
 if __name__ == '__main__':
     try:
         print("=" * 60)
         print("Fritz-Kola Map Generator")
         print("=" * 60)
         
-        print("\n[1/2] Generating supply chain map...")
+        print("Initializing matplotlib...")
+        lazy_deps.pyplot()
+        
+        print("\n[1/3] Generating supply chain map...")
         create_supply_chain_map()
         
-        print("\n[2/2] Generating manufacturer location map...")
+        print("\n[2/3] Generating manufacturer location map...")
         create_manufacturer_location_map()
         
+        print("\n[3/3] Generating route metrics tables...")
+        create_route_metrics_table()
+        
         print("\n" + "=" * 60)
         print("✓ SUCCESS! Maps generated successfully.")
         print("=" * 60)
         print("\nGenerated files:")
-        print("  - fritz-kola-supply-chain-map.png")
-        print("  - fritz-kola-manufacturer-map.png")
+        print(f"  - {os.path.basename(map_cache.output_path('.', SUPPLY_CHAIN_OUTPUT))}")
+        print(f"  - {os.path.basename(map_cache.output_path('.', MANUFACTURER_OUTPUT))}")
+        print(f"  - {ROUTE_METRICS_OUTPUT}")
         print("\nYou can now include these images in your LaTeX document.")
         
     except Exception as e:
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Draft and final variants of the raster images included by the documents
+Entwurfs- und Endfassungen der in den Dokumenten eingebundenen Rasterbilder
+文档所引用栅格图像的草稿版与终稿版
+
+\\includegraphics embeds an image file as it is: a 960 x 1280 photo shown
+at 0.6\\textwidth or a 4200 px wide map PNG goes into every PDF at full
+size, and every XeLaTeX pass reads it again. For each included raster
+image (.png, .jpg) this module writes a variant sized to the width it is
+shown at:
+
+    draft   DRAFT_DPI at the printed width, stronger JPEG compression;
+            for fast previews and small PDFs
+    final   at most FINAL_DPI at the printed width, re-encoded with
+            optimized (progressive) JPEG or PNG, metadata stripped
+
+Images are never enlarged, and a final variant that would come out larger
+than its source is the source itself. The printed width is read from
+width=<f>\\textwidth (or \\linewidth, \\columnwidth, cm, mm, in, pt) and
+the text width from the document's paper size and geometry margins.
+
+Variants are stored under <MAP_CACHE_DIR>/assets/, keyed by the source's
+content hash, the target width in pixels and the quality settings, so an
+unchanged image is never processed twice. build_gallery.py makes them in
+its worker pool and compiles each document in a shadow directory where the
+images are replaced by their variants (see shadow_tree).
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import time
+
+import map_cache
+
+ASSET_CACHE_DIR = os.path.join(map_cache.CACHE_DIR, 'assets')
+
+# Bump when the variant encoding changes
+ASSET_FORMAT = 1
+
+RASTER_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+DRAFT_DPI = 96
+FINAL_DPI = 300
+
+QUALITIES = {
+    'draft': {'dpi': DRAFT_DPI, 'jpeg_quality': 60},
+    'final': {'dpi': FINAL_DPI, 'jpeg_quality': 90},
+}
+
+# Paper widths in inches, by documentclass option
+PAPER_WIDTHS_IN = {'a4paper': 8.27, 'a5paper': 5.83, 'b5paper': 6.93,
+                   'letterpaper': 8.5, 'legalpaper': 8.5, 'executivepaper': 7.25}
+
+# Text width when the document does not say (A4 with 2.5 cm margins)
+DEFAULT_TEXT_WIDTH_IN = 6.3
+
+LENGTH_UNITS_IN = {'in': 1.0, 'cm': 1 / 2.54, 'mm': 1 / 25.4, 'pt': 1 / 72.27, 'bp': 1 / 72.0}
+
+LENGTH_PATTERN = re.compile(r'^\s*([\d.]+)\s*(in|cm|mm|pt|bp)\s*$')
+WIDTH_PATTERN = re.compile(r'(?:^|,)\s*width\s*=\s*([^,\]]+)')
+
+
+def _length_in(text):
+    """'2.5cm' -> inches, or None"""
+    match = LENGTH_PATTERN.match(text)
+    return float(match.group(1)) * LENGTH_UNITS_IN[match.group(2)] if match else None
+
+
+def text_width_in(tex_text):
+    """
+    \\textwidth of a document in inches, from its paper size and the
+    \\geometry{} or \\usepackage[...]{geometry} options it sets
+    """
+    paper = None
+    docclass = re.search(r'\\documentclass\s*\[([^\]]*)\]', tex_text)
+    if docclass:
+        paper = next((PAPER_WIDTHS_IN[o.strip()] for o in docclass.group(1).split(',')
+                      if o.strip() in PAPER_WIDTHS_IN), None)
+    options = {}
+    for group in re.findall(r'\\geometry\s*\{([^}]*)\}', tex_text) + \
+            re.findall(r'\\usepackage\s*\[([^\]]*)\]\s*\{geometry\}', tex_text):
+        for option in group.split(','):
+            key, _, value = option.partition('=')
+            options[key.strip()] = value.strip()
+    if 'textwidth' in options and _length_in(options['textwidth']):
+        return _length_in(options['textwidth'])
+    paper = PAPER_WIDTHS_IN.get(next((k for k in options if k in PAPER_WIDTHS_IN), None), paper)
+    margin = options.get('hmargin') or options.get('margin')
+    left = _length_in(options.get('left', margin or ''))
+    right = _length_in(options.get('right', margin or ''))
+    if paper and left is not None and right is not None:
+        return paper - left - right
+    return DEFAULT_TEXT_WIDTH_IN
+
+
+def printed_width_in(options, text_width):
+    """Width in inches an \\includegraphics[options] is printed at, or None if not given"""
+    match = WIDTH_PATTERN.search(options or '')
+    if not match:
+        return None
+    value = match.group(1).strip()
+    relative = re.match(r'^([\d.]*)\s*\\(textwidth|linewidth|columnwidth|hsize)$', value)
+    if relative:
+        return float(relative.group(1) or 1) * text_width
+    return _length_in(value)
+
+
+def is_raster(path):
+    return os.path.splitext(path)[1].lower() in RASTER_EXTENSIONS
+
+
+def target_pixels(width_in, quality):
+    """Pixel width of a variant, or None to keep the source width"""
+    if width_in is None:
+        return None
+    return int(math.ceil(width_in * QUALITIES[quality]['dpi']))
+
+
+def variant_path(source, width_in, quality):
+    """Cache path of a variant; the source must exist"""
+    payload = {
+        'format': ASSET_FORMAT,
+        'source': map_cache.file_digest(os.path.abspath(source)),
+        'pixels': target_pixels(width_in, quality),
+        'quality': QUALITIES[quality],
+    }
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+    suffix = os.path.splitext(source)[1].lower()
+    return os.path.join(ASSET_CACHE_DIR, key[:2], key + suffix)
+
+
+def _encode(image, path, suffix, quality):
+    if suffix == '.png':
+        image.save(path, format='png', optimize=True)
+    else:
+        image.save(path, format='jpeg', quality=QUALITIES[quality]['jpeg_quality'],
+                   optimize=True, progressive=True)
+
+
+def make_variant(source, width_in, quality):
+    """
+    Write the variant of source for the given printed width and quality
+    unless it is cached already; returns a result dict like build_maps.run_job
+    """
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    output = variant_path(source, width_in, quality)
+    result = {'ok': True, 'output': output, 'cached': os.path.exists(output)}
+    if not result['cached']:
+        suffix = os.path.splitext(source)[1].lower()
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        tmp = f"{output}.{os.getpid()}.tmp{suffix}"
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            if suffix != '.png' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            pixels = target_pixels(width_in, quality)
+            resized = bool(pixels and pixels < image.width)
+            if resized:
+                height = max(1, round(image.height * pixels / image.width))
+                image = image.resize((pixels, height), Image.LANCZOS)
+            _encode(image, tmp, suffix, quality)
+        # A final variant never grows the file: then the source is the variant
+        if quality == 'final' and not resized and os.path.getsize(tmp) >= os.path.getsize(source):
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, output)
+    result['bytes'] = os.path.getsize(output)
+    result['source_bytes'] = os.path.getsize(source)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+# Entries never mirrored into a shadow tree, besides hidden ones
+SHADOW_SKIP = ('__pycache__',)
+
+# Files xelatex writes next to a document; a shadow tree has its own
+LATEX_OUTPUTS = ('.aux', '.log', '.out', '.toc', '.lof', '.lot', '.pdf', '.xdv', '.synctex.gz')
+
+
+def _latex_output(entry, source_dir):
+    stem, ext = os.path.splitext(entry.name)
+    if entry.name.endswith('.synctex.gz'):
+        stem, ext = entry.name[:-len('.synctex.gz')], '.synctex.gz'
+    return ext in LATEX_OUTPUTS and os.path.exists(os.path.join(source_dir, stem + '.tex'))
+
+
+def shadow_tree(source_dir, shadow_dir, replacements, real_dirs=()):
+    """
+    Mirror source_dir into shadow_dir with symbolic links. Files in
+    replacements ({source path: variant path}) link to their variant;
+    directories holding one of them, or listed in real_dirs, are created
+    and mirrored entry by entry, all others are linked as a whole. What
+    xelatex writes into shadow_dir (.aux, .log, .pdf) stays there.
+    """
+    needed = {os.path.dirname(p) for p in replacements} | set(real_dirs)
+    os.makedirs(shadow_dir, exist_ok=True)
+    for entry in os.scandir(shadow_dir):
+        if entry.is_symlink():
+            os.remove(entry.path)
+    for entry in os.scandir(source_dir):
+        if entry.name.startswith('.') or entry.name in SHADOW_SKIP:
+            continue
+        target = os.path.join(shadow_dir, entry.name)
+        if entry.is_dir():
+            inner = entry.path + os.sep
+            if any(d == entry.path or d.startswith(inner) for d in needed):
+                shadow_tree(entry.path, target, replacements, real_dirs)
+                continue
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+        elif _latex_output(entry, source_dir):
+            continue
+        elif os.path.lexists(target):
+            os.remove(target)  # a copy from an earlier build without symlinks
+        _link(replacements.get(entry.path, entry.path), target)
+
+
+def _link(source, target):
+    try:
+        os.symlink(source, target)
+    except OSError:
+        # No symlinks (Windows without developer mode): copy instead
+        if os.path.isdir(source):
+            shutil.copytree(source, target)
+        else:
+            shutil.copyfile(source, target)
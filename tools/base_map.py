@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Reusable base-map templates: render the static background once
+Wiederverwendbare Kartenvorlagen: statischer Hintergrund nur einmal gerendert
+可复用底图模板：静态背景只渲染一次
+
+Most of a map's render time goes into parts that do not depend on the
+product: the extent, Natural Earth features, gridlines and their labels,
+axis labels and the legend. A template is that static background rendered
+once per extent and style to an RGBA raster, together with the layout it
+was drawn with (axes position, limits, legend box).
+
+A product map is then drawn on a transparent overlay figure with an axes at
+exactly the same position and limits, holding only the product's layers
+(markers, routes, labels, title), and alpha-composited onto the background.
+The layout is fixed by the template, so the overlay needs no tight_layout
+and no feature loading.
+
+Templates are kept in memory for the rest of the process (batch runs) and
+as PNG + JSON in <MAP_CACHE_DIR>/basemaps/ across runs, keyed by the style,
+the source files that draw them and the library versions.
+
+PDF and SVG maps (MAP_FORMAT, see map_cache.py) cannot be composited from a
+raster. For them for_output() returns a VectorBackground instead: the same
+background drawn live with the same layout, with the product layers added
+to it and saved as vector graphics. Only the dense layers (land and ocean
+polygons, large marker and route layers) are rasterized.
+"""
+
+import json
+import os
+
+import fonts
+import instrument
+import lazy_deps
+import map_cache
+
+BASEMAP_CACHE_DIR = os.path.join(map_cache.CACHE_DIR, 'basemaps')
+
+# Templates already rendered or loaded in this process, keyed by cache key
+_templates = {}
+
+# Resolution of the rasterized layers of PDF and SVG maps. The figures are
+# scaled to about half their size by \includegraphics, so this prints at
+# about twice the dpi; the style's 'raster_dpi' overrides it
+VECTOR_RASTER_DPI = 150
+
+# The legend is drawn above every product layer (markers, routes, density)
+LEGEND_ZORDER = 10
+
+
+class Template:
+    """
+    Rendered background of one map style.
+
+    image    : (height, width, 4) uint8 RGBA array
+    dpi      : dots per inch the image was rendered at
+    position : axes position [x0, y0, width, height] in figure fractions
+    xlim/ylim: axes limits in the axes' own (projection) coordinates
+    geo      : whether the axes is a cartopy PlateCarree GeoAxes
+    legend   : legend box (x0, y0, x1, y1) in pixels, or None
+    legend_style: the style's legend, drawn by overlay() at that box so it
+               covers the product layers; the image leaves it out
+    title_y  : title height in axes fractions after layout (it sits above
+               gridline labels, which the overlay does not have)
+    failure  : why a part of the background is missing, or None; such a
+               template is neither stored nor reused
+    """
+
+    def __init__(self, image, dpi, position, xlim, ylim, geo, legend=None, title_y=1.0,
+                 failure=None, legend_style=None):
+        self.image = image
+        self.dpi = dpi
+        self.position = list(position)
+        self.xlim = tuple(xlim)
+        self.ylim = tuple(ylim)
+        self.geo = geo
+        self.legend = tuple(legend) if legend is not None else None
+        self.title_y = title_y
+        self.failure = failure
+        self.legend_style = legend_style
+
+    @property
+    def figsize(self):
+        height, width = self.image.shape[:2]
+        return (width / self.dpi, height / self.dpi)
+
+    def meta(self):
+        return {'dpi': self.dpi, 'position': self.position, 'xlim': self.xlim,
+                'ylim': self.ylim, 'geo': self.geo, 'legend': self.legend,
+                'title_y': self.title_y, 'legend_style': self.legend_style}
+
+    def overlay(self):
+        """
+        Transparent figure and axes aligned with the background.
+
+        Returns (fig, ax, transform) where transform is the lon/lat data
+        transform to pass to the plotting calls (None for plain axes). The
+        legend is on the axes already, pinned to the box measured on the
+        background, and stays above whatever is drawn afterwards.
+        """
+        plt = lazy_deps.pyplot()
+        fig = plt.figure(figsize=self.figsize, dpi=self.dpi)
+        fig.patch.set_alpha(0.0)
+        transform = None
+        if self.geo:
+            ccrs, _ = lazy_deps.cartopy_modules()
+            ax = fig.add_axes(self.position, projection=ccrs.PlateCarree())
+            transform = ccrs.PlateCarree()
+        else:
+            ax = fig.add_axes(self.position)
+        ax.set_xlim(*self.xlim)
+        ax.set_ylim(*self.ylim)
+        ax.set_aspect('auto')  # the position already has the background's aspect
+        ax.set_axis_off()
+        if self.legend_style and self.legend:
+            height, width = self.image.shape[:2]
+            _add_legend(plt, ax, self.legend_style, loc='lower left', borderaxespad=0,
+                        bbox_to_anchor=(self.legend[0] / width, self.legend[1] / height),
+                        bbox_transform=fig.transFigure)
+        return fig, ax, transform
+
+    def set_title(self, ax, label, **kwargs):
+        """Set the overlay title at the place the background reserved for it"""
+        return ax.set_title(label, y=self.title_y, **kwargs)
+
+    def composite(self, fig, output_file):
+        """Rasterize the overlay figure, composite it onto the background, save a PNG"""
+        import numpy as np
+        from PIL import Image
+
+        with instrument.stage('rasterize'):
+            fig.canvas.draw()
+            overlay = np.asarray(fig.canvas.buffer_rgba())
+        if overlay.shape != self.image.shape:
+            raise ValueError(f"Overlay size {overlay.shape[:2]} does not match "
+                             f"the template {self.image.shape[:2]}")
+        with instrument.stage('encode', format='png'):
+            image = Image.alpha_composite(Image.fromarray(self.image), Image.fromarray(overlay))
+            image.convert('RGB').save(output_file, dpi=(self.dpi, self.dpi),
+                                      compress_level=map_cache.png_compress_level())
+        return output_file
+
+
+class VectorBackground:
+    """
+    Background of one map style drawn live, for PDF and SVG output.
+
+    Offers the interface of Template (overlay, set_title, composite, legend),
+    but overlay() returns the background figure itself, so the product
+    layers are drawn on it and everything is saved in one vector file.
+    """
+
+    # Layout dpi of the live figure; the saved file is resolution-independent
+    LAYOUT_DPI = 72
+
+    def __init__(self, style):
+        self.style = style
+        self.dpi = style.get('raster_dpi', VECTOR_RASTER_DPI)
+        self.legend = None  # live legend, label_placer finds it on the axes
+
+    def overlay(self):
+        """Background figure and axes ready for the product layers: (fig, ax, transform)"""
+        fig, ax, failure = _draw(self.style, dpi=self.LAYOUT_DPI, vector=True)
+        if failure:
+            map_cache.mark_incomplete(failure)
+        transform = None
+        if hasattr(ax, 'projection'):
+            ccrs, _ = lazy_deps.cartopy_modules()
+            transform = ccrs.PlateCarree()
+        return fig, ax, transform
+
+    def set_title(self, ax, label, **kwargs):
+        """Replace the layout placeholder with the product title"""
+        kwargs.setdefault('alpha', None)
+        return ax.set_title(label, **kwargs)
+
+    def composite(self, fig, output_file):
+        """Save the figure as PDF or SVG, by the extension of output_file"""
+        import matplotlib
+
+        fmt = os.path.splitext(output_file)[1][1:].lower()
+        # No creation date, so an unchanged map gives an identical file
+        metadata = {'CreationDate': None} if fmt == 'pdf' else {'Date': None}
+        # The layout is final; without this savefig runs a whole extra draw
+        # pass for the placeholder engine tight_layout leaves behind
+        fig.set_layout_engine(None)
+        # The CJK font is embedded as a subset of the glyphs used (fonts.py)
+        with instrument.stage('encode', format=fmt), \
+                matplotlib.rc_context(fonts.vector_rc()):
+            fig.savefig(output_file, format=fmt, dpi=self.dpi, metadata=metadata)
+        return output_file
+
+
+def _legend_handles(plt, entries):
+    """Proxy artists for the legend entries of a style"""
+    handles = []
+    for entry in entries:
+        entry = dict(entry)
+        if entry.pop('line', False):
+            handles.append(plt.Line2D([0], [0], **entry))
+        else:
+            entry.setdefault('edgecolors', 'black')
+            handles.append(plt.scatter([], [], c=entry.pop('color'), **entry))
+    return handles
+
+
+def _add_legend(plt, ax, legend, **overrides):
+    """Draw a style's legend on ax, above the product layers"""
+    options = {k: v for k, v in legend.items() if k != 'entries'}
+    options.update(overrides)
+    artist = ax.legend(handles=_legend_handles(plt, legend['entries']), **options)
+    artist.set_zorder(LEGEND_ZORDER)
+    return artist
+
+
+def _draw_geo(plt, style, vector=False):
+    """
+    Cartopy axes with pre-clipped Natural Earth features and labelled
+    gridlines; for vector output the land and ocean polygons are rasterized.
+    Returns (fig, ax, failure), failure describing missing features or None.
+    """
+    import feature_cache
+
+    ccrs, cfeature = lazy_deps.cartopy_modules()
+    print("Using cartopy for geographic features...")
+    fig = plt.figure(figsize=style['figsize'])
+    try:
+        ax = plt.axes(projection=ccrs.PlateCarree())
+        ax.set_extent(style['extent'], crs=ccrs.PlateCarree())
+    except Exception:
+        # _draw falls back to a plain figure; don't leave this one open
+        plt.close(fig)
+        raise
+
+    # Pre-clipped to the extent and cached on disk (see feature_cache.py)
+    try:
+        print("Adding map features...")
+        with instrument.stage('features'):
+            feature_cache.add_features(ax, [
+                (cfeature.COASTLINE, {'linewidth': 0.5}),
+                (cfeature.BORDERS, {'linewidth': 0.5}),
+                (cfeature.LAND, {'alpha': 0.5, 'color': 'lightgray', 'rasterized': vector}),
+                (cfeature.OCEAN, {'alpha': 0.3, 'color': 'lightblue', 'rasterized': vector}),
+            ], style['extent'])
+        ax.gridlines(draw_labels=True, linewidth=0.5, alpha=0.5, linestyle='--')
+    except Exception as e:
+        print(f"Warning: Could not load all cartopy features: {e}")
+        return fig, ax, f"cartopy features: {e}"
+    return fig, ax, None
+
+
+def _draw_plain(plt, style):
+    """Plain matplotlib axes in lon/lat with a grid and axis labels"""
+    print("Using basic matplotlib map...")
+    fig, ax = plt.subplots(figsize=style['figsize'])
+    west, east, south, north = style['extent']
+    ax.set_xlim(west, east)
+    ax.set_ylim(south, north)
+    ax.set_aspect('equal')
+    ax.grid(True, alpha=0.3, linestyle='--')
+    fontsize = style.get('label_fontsize', 10)
+    ax.set_xlabel('Longitude / Längengrad / 经度', fontsize=fontsize)
+    ax.set_ylabel('Latitude / Breitengrad / 纬度', fontsize=fontsize)
+    return fig, ax
+
+
+def _draw(style, dpi, vector=False):
+    """
+    Draw the static background of a style and fix its layout: (fig, ax,
+    failure), failure saying what could not be drawn, or None
+    """
+    plt = lazy_deps.pyplot()
+    fig = failure = None
+    if style.get('geo'):
+        try:
+            fig, ax, failure = _draw_geo(plt, style, vector)
+        except Exception as e:
+            print(f"Error with cartopy, falling back to basic map: {e}")
+            fig, failure = None, f"cartopy: {e}"
+    if fig is None:
+        fig, ax = _draw_plain(plt, style)
+
+    legend = style.get('legend')
+    if legend:
+        _add_legend(plt, ax, legend)
+
+    fig.set_dpi(dpi)
+    fig.patch.set_facecolor('white')
+    # Reserve the room of a product title so tight_layout leaves it free;
+    # the transparent placeholder is laid out but leaves no pixels
+    ax.set_title('Xg', alpha=0.0, **style.get('title', {}))
+    with instrument.stage('tight_layout'):
+        fig.tight_layout()
+    return fig, ax, failure
+
+
+def _render(style):
+    """Draw the static background of a style and rasterize it to a Template"""
+    import numpy as np
+
+    plt = lazy_deps.pyplot()
+    fig, ax, failure = _draw(style, style['dpi'])
+
+    # The legend is left to the overlay, and measured once the draw has
+    # settled the layout (GeoAxes apply their aspect only then)
+    legend = ax.get_legend()
+    if legend is not None:
+        legend.set_visible(False)
+    with instrument.stage('rasterize'):
+        fig.canvas.draw()
+    title_y = ax.title.get_position()[1]
+
+    legend_box = None
+    if legend is not None:
+        extent = legend.get_window_extent(fig.canvas.get_renderer())
+        legend_box = (extent.x0, extent.y0, extent.x1, extent.y1)
+
+    image = np.array(fig.canvas.buffer_rgba())
+    template = Template(image, style['dpi'], ax.get_position().bounds, ax.get_xlim(),
+                        ax.get_ylim(), hasattr(ax, 'projection'), legend_box, title_y, failure,
+                        style.get('legend'))
+    plt.close(fig)
+    return template
+
+
+def _load(path):
+    import numpy as np
+    from PIL import Image
+
+    with open(path + '.json', encoding='utf-8') as f:
+        meta = json.load(f)
+    with Image.open(path + '.png') as image:
+        pixels = np.asarray(image.convert('RGBA'))
+    return Template(pixels, **meta)
+
+
+def _save(template, path):
+    from PIL import Image
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    # Low compression: the file is read back often and written once
+    Image.fromarray(template.image).save(tmp + '.png', format='PNG', compress_level=1)
+    with open(tmp + '.json', 'w', encoding='utf-8') as f:
+        json.dump(template.meta(), f)
+    os.replace(tmp + '.png', path + '.png')
+    os.replace(tmp + '.json', path + '.json')
+
+
+def _resolve(style):
+    """Style as drawn here: geo only where cartopy is usable"""
+    return dict(style, geo=bool(style.get('geo')) and lazy_deps.has_cartopy())
+
+
+def get_template(style):
+    """
+    Background template for a map style, rendered on first use.
+
+    style is a dict describing everything static, and is the cache key
+    together with this file and feature_cache.py:
+
+        name      : label for log messages
+        figsize   : figure size in inches
+        dpi       : output resolution
+        extent    : [west, east, south, north]
+        geo       : draw cartopy features and gridlines (falls back to a
+                    plain lon/lat axes when cartopy is unusable)
+        label_fontsize: axis label size of the plain axes
+        legend    : ax.legend() options plus 'entries', a list of proxy
+                    marker styles ({'label', 'color', 's', 'marker', ...})
+                    or lines ({'line': True, 'label', 'color', ...})
+        title     : font options of the product title, whose room is
+                    reserved in the layout
+        raster_dpi: resolution of the rasterized layers in PDF and SVG
+                    output (default VECTOR_RASTER_DPI)
+    """
+    import feature_cache
+
+    style = _resolve(style)
+    key = map_cache.cache_key(
+        inputs={'template': style.get('name')},
+        params=style,
+        sources=[__file__, feature_cache.__file__],
+    )
+    template = _templates.get(key)
+    if template is not None:
+        return template
+
+    name = style.get('name', key[:12])
+    path = os.path.join(BASEMAP_CACHE_DIR, key[:2], key)
+    if map_cache.cache_enabled() and os.path.exists(path + '.png') and os.path.exists(path + '.json'):
+        with instrument.stage('template_load', template=name):
+            template = _load(path)
+        print(f"✓ Base map '{name}' loaded from cache ({key[:12]})")
+    else:
+        print(f"Rendering base map '{name}'...")
+        with instrument.stage('template_render', template=name):
+            template = _render(style)
+            if template.failure:
+                # Drawn again next time rather than kept without the missing layers
+                map_cache.mark_incomplete(template.failure)
+                return template
+            if map_cache.cache_enabled():
+                with instrument.stage('encode', format='png'):
+                    _save(template, path)
+    _templates[key] = template
+    return template
+
+
+def for_output(style, output_file):
+    """
+    Background to draw a map of the given style on, by the output format:
+    a cached Template for PNG, a VectorBackground for PDF and SVG.
+    """
+    if os.path.splitext(output_file)[1].lower() == '.png':
+        return get_template(style)
+    return VectorBackground(_resolve(style))
+
+
+def clear_memory():
+    """Drop the templates held in this process"""
+    _templates.clear()
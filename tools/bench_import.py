@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark cold import time of the map generators
+Misst die Kaltstart-Importzeit der Kartengeneratoren
+测量地图生成器的冷启动导入时间
+
+Each sample runs in a fresh interpreter. "lazy" imports the generator the way
+a tool that only reads its data would. "eager" additionally loads matplotlib
+and probes cartopy, which is what every import paid before the heavy imports
+were deferred.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_GENERATOR = os.path.join(REPO_ROOT, 'product-tex', 'germany', 'hamburg', 'generate_map.py')
+
+SNIPPETS = {
+    'lazy': "import generate_map",
+    'eager': "import generate_map, lazy_deps; lazy_deps.pyplot(); lazy_deps.has_cartopy()",
+}
+
+TIMER = """
+import time, sys, io, contextlib
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    {snippet}
+sys.stderr.write(repr(time.perf_counter() - start))
+"""
+
+
+def time_import(generator, snippet):
+    """Seconds a fresh interpreter spends on snippet, run next to the generator"""
+    code = TIMER.format(snippet=snippet)
+    proc = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=os.path.dirname(generator),
+        env=dict(os.environ, PYTHONPATH=os.path.dirname(generator)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    return float(proc.stderr.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('generator', nargs='?', default=DEFAULT_GENERATOR,
+                        help='path to a generate_map.py (default: Fritz-Kola)')
+    parser.add_argument('-n', '--runs', type=int, default=5,
+                        help='fresh interpreters per variant (default: 5)')
+    parser.add_argument('--max-ratio', type=float, default=0.5,
+                        help='fail if lazy/eager exceeds this ratio (default: 0.5)')
+    args = parser.parse_args(argv)
+
+    generator = os.path.abspath(args.generator)
+    results = {}
+    for name, snippet in SNIPPETS.items():
+        samples = [time_import(generator, snippet) for _ in range(args.runs)]
+        results[name] = statistics.median(samples)
+        print(f"{name:>6}: median {results[name] * 1000:8.1f} ms "
+              f"(min {min(samples) * 1000:.1f}, max {max(samples) * 1000:.1f}, n={args.runs})")
+
+    ratio = results['lazy'] / results['eager']
+    print(f"\nCold import is {ratio:.1%} of the eager cost "
+          f"({results['eager'] / results['lazy']:.1f}x faster)")
+    if ratio > args.max_ratio:
+        print(f"✗ Ratio above the allowed {args.max_ratio:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the map generators on synthetic supply chains of growing size
+Misst die Kartengeneratoren mit synthetischen Lieferketten wachsender Größe
+用规模递增的合成供应链对地图生成器做基准测试
+
+For every map kind of a generator (its MAPS registry) a synthetic network
+of each requested size is written over the map's extent, with the node
+types of the map's styles. Each (map, path, size) case then renders in a
+fresh interpreter on each render backend (MAP_BACKEND, see
+render_engine.py): cartopy, plain matplotlib and the agg draft path,
+recording wall time, peak RSS and the output file size. --formats png pdf
+also measures each case as a vector PDF (MAP_FORMAT).
+
+By default the feature and base-map caches are warm (filled by an
+unmeasured first run) and only the rendered-map cache is cleared between
+runs; --cold disables every cache. Results can be saved as a baseline and
+compared against one; the command fails when a case got slower, larger in
+memory or bigger on disk than the baseline by more than --threshold, when
+a baseline case has no result, and whenever a case fails to render. A
+warm run over several backends also records their mean PNG time on the
+maps measured with all of them, which render_engine.select() uses to pick
+the fastest backend of sufficient fidelity.
+
+Each generator must follow the naming of generate_map.py: for a map kind
+'supply-chain' it reads SUPPLY_CHAIN_NETWORK, SUPPLY_CHAIN_STYLES and
+SUPPLY_CHAIN_BASE_MAP.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import render_engine
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_PRODUCT = os.path.join(REPO_ROOT, 'product-tex', 'germany', 'hamburg')
+
+# Share of each node type, in the order of the map's styles (largest last)
+TYPE_SHARES = (0.01, 0.09, 0.9)
+TYPE_SIZES = (300, 150, 100)
+
+# Metrics compared against the baseline, with the smallest change that counts
+METRICS = {
+    'seconds': 0.05,
+    'peak_rss_mb': 5.0,
+    'file_bytes': 4096,
+}
+
+
+def _prefix(kind):
+    return kind.upper().replace('-', '_')
+
+
+def synthetic_network(extent, types, n_nodes, routes_per_node=2, seed=0):
+    """Network file layout (see network.py) with random nodes inside extent"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    west, east, south, north = extent
+    shares = np.asarray(TYPE_SHARES[:len(types)], dtype=float)
+    codes = rng.choice(len(types), n_nodes, p=shares / shares.sum())
+    lons = rng.uniform(west, east, n_nodes)
+    lats = rng.uniform(south, north, n_nodes)
+    nodes = [
+        {'id': f"n{i}", 'name': f"Node {i}", 'type': types[code],
+         'coords': [round(float(lon), 5), round(float(lat), 5)],
+         'size': TYPE_SIZES[min(code, len(TYPE_SIZES) - 1)]}
+        for i, (code, lon, lat) in enumerate(zip(codes, lons, lats))
+    ]
+    n_edges = n_nodes * routes_per_node if n_nodes > 1 else 0
+    src = rng.integers(0, n_nodes, n_edges)
+    dst = rng.integers(0, n_nodes, n_edges)
+    edges = [[f"n{a}", f"n{b}"] for a, b in zip(src, dst) if a != b]
+    return {'nodes': nodes, 'edges': edges}
+
+
+def list_cases(product_dir, sizes, paths):
+    """(kind, path, n_nodes, extent, types) for every map of the generator"""
+    import build_maps
+
+    module = build_maps.load_generator(product_dir)
+    cases = []
+    for kind in getattr(module, 'MAPS', {}):
+        prefix = _prefix(kind)
+        base = getattr(module, prefix + '_BASE_MAP', None)
+        if base is None:
+            continue  # not a map (e.g. generated tables)
+        types = list(getattr(module, prefix + '_STYLES'))
+        # Maps without cartopy features render the same on cartopy and plain
+        kind_paths = [p for p in paths if p != 'cartopy' or base.get('geo')]
+        for path in kind_paths:
+            for n_nodes in sizes:
+                cases.append((kind, path, n_nodes, base['extent'], types))
+    return cases
+
+
+def run_worker(spec):
+    """Render one map in this process; print the measurements as JSON"""
+    import contextlib
+    import io
+    import resource
+    import time
+
+    import build_maps
+    import lazy_deps
+    import map_cache
+
+    result = {'ok': True}
+    with contextlib.redirect_stdout(io.StringIO()):
+        module = build_maps.load_generator(spec['product_dir'])
+        setattr(module, _prefix(spec['kind']) + '_NETWORK', spec['network'])
+        if spec['path'] == 'cartopy' and not lazy_deps.has_cartopy():
+            result = {'ok': False, 'skipped': 'cartopy not available'}
+        else:
+            map_cache.clear_rendered()
+            start = time.perf_counter()
+            output = module.MAPS[spec['kind']](output_dir=spec['output_dir'])
+            result['seconds'] = time.perf_counter() - start
+            result['file_bytes'] = os.path.getsize(output)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    print(json.dumps(result))
+
+
+def run_case(spec, env):
+    """Run one worker in a fresh interpreter and return its result dict"""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(spec)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    if proc.returncode != 0:
+        return {'ok': False, 'error': proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def benchmark(product_dir, sizes, paths, repeat, cold, workdir, formats=('png',)):
+    """
+    Measure every case; returns ({case id: {metric: value}}, {case id:
+    reason}) for the cases measured and those that failed or were skipped
+    """
+    env = dict(os.environ, MAP_CACHE_DIR=os.path.join(workdir, 'cache'))
+    env.pop('MAP_PROFILE', None)
+    env.pop('MAP_FIDELITY', None)
+    if cold:
+        env['MAP_CACHE'] = '0'
+
+    results = {}
+    failures = {}
+    cases = [case + (fmt,) for case in list_cases(product_dir, sizes, paths) for fmt in formats]
+    for kind, path, n_nodes, extent, types, fmt in cases:
+        # PNG cases keep the ids of baselines saved before --formats existed
+        case_id = f"{kind}/{path}/{n_nodes}" + ('' if fmt == 'png' else f"/{fmt}")
+        network_file = os.path.join(workdir, f"{kind}-{n_nodes}.json")
+        if not os.path.exists(network_file):
+            with open(network_file, 'w', encoding='utf-8') as f:
+                json.dump(synthetic_network(extent, types, n_nodes), f)
+        output_dir = os.path.join(workdir, 'out', kind, path, str(n_nodes), fmt)
+        os.makedirs(output_dir, exist_ok=True)
+        spec = {'product_dir': product_dir, 'kind': kind, 'path': path,
+                'network': network_file, 'output_dir': output_dir}
+        case_env = dict(env, MAP_BACKEND=path, MAP_CARTOPY='1' if path == 'cartopy' else '0',
+                        MAP_FORMAT=fmt)
+
+        if not cold:
+            run_case(spec, case_env)  # fill the feature and base-map caches
+        runs = [run_case(spec, case_env) for _ in range(repeat)]
+        failed = next((r for r in runs if not r.get('ok')), None)
+        if failed:
+            failures[case_id] = (f"skipped: {failed['skipped']}" if failed.get('skipped') else
+                                 'FAILED: ' + ' '.join(failed.get('error', [])))
+            print(f"{case_id:<32} {failures[case_id]}")
+            continue
+        results[case_id] = {
+            'seconds': statistics.median(r['seconds'] for r in runs),
+            'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+            'file_bytes': runs[-1]['file_bytes'],
+        }
+        r = results[case_id]
+        print(f"{case_id:<32} {r['seconds']:9.3f} s {r['peak_rss_mb']:9.1f} MB "
+              f"{r['file_bytes'] / 1024:9.1f} KiB")
+    return results, failures
+
+
+def backend_timings(results):
+    """
+    Mean PNG seconds per backend over the (kind, size) cases measured with
+    every backend in results, so the backends are compared on equal maps
+    """
+    by_case = {}
+    for case_id, metrics in results.items():
+        kind, path, n_nodes = case_id.split('/')[:3]
+        if case_id.count('/') == 2:
+            by_case.setdefault((kind, n_nodes), {})[path] = metrics['seconds']
+    paths = {path for times in by_case.values() for path in times}
+    common = [times for times in by_case.values() if set(times) == paths]
+    if len(paths) < 2 or not common:
+        return {}
+    return {path: statistics.mean(times[path] for times in common) for path in sorted(paths)}
+
+
+def compare(results, baseline, threshold, failures=None):
+    """
+    Print the change per case and return the list of regressions; a
+    baseline case without a result now (failed, skipped or not run) is one
+    """
+    failures = failures or {}
+    regressions = []
+    print(f"\n{'case':<32} {'metric':<12} {'baseline':>12} {'now':>12} {'change':>8}")
+    for case_id, metrics in results.items():
+        old = baseline.get(case_id)
+        if old is None:
+            print(f"{case_id:<32} (not in baseline)")
+            continue
+        for metric, min_delta in METRICS.items():
+            before, now = old.get(metric), metrics[metric]
+            if before is None:
+                continue
+            change = (now - before) / before if before else 0.0
+            flag = ''
+            if change > threshold and now - before > min_delta:
+                flag = '  REGRESSION'
+                regressions.append((case_id, metric, before, now))
+            print(f"{case_id:<32} {metric:<12} {before:12.3f} {now:12.3f} {change:+7.1%}{flag}")
+    for case_id in sorted(set(baseline) - set(results)):
+        regressions.append((case_id, None, None, None))
+        print(f"{case_id:<32} REGRESSION: no result ({failures.get(case_id, 'not run')})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('product', nargs='?', default=DEFAULT_PRODUCT,
+                        help='product directory with a generate_map.py (default: Fritz-Kola)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                        help='synthetic node counts (default: 10 100 1000)')
+    parser.add_argument('--paths', nargs='+', choices=list(render_engine.BACKENDS),
+                        default=list(render_engine.BACKENDS),
+                        help='render backends to measure (default: all)')
+    parser.add_argument('--formats', nargs='+', choices=['png', 'pdf', 'svg'],
+                        default=['png'], help='output formats to measure (default: png)')
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+                        help='measured runs per case, the median time counts (default: 3)')
+    parser.add_argument('--cold', action='store_true',
+                        help='disable all caches instead of warming them first')
+    parser.add_argument('--save-baseline', metavar='PATH',
+                        help='write the results as a baseline JSON file')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='compare against a baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fail on a relative regression above this (default: 0.2)')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(json.loads(args.worker))
+        return 0
+
+    product_dir = os.path.abspath(args.product)
+    mode = 'cold caches' if args.cold else 'warm caches'
+    print(f"Benchmarking {os.path.relpath(product_dir, REPO_ROOT)} ({mode}, "
+          f"median of {args.repeat})")
+    with tempfile.TemporaryDirectory(prefix='bench-maps-') as workdir:
+        results, failures = benchmark(product_dir, args.sizes, args.paths, args.repeat,
+                                      args.cold, workdir, args.formats)
+
+    timings = {} if args.cold else backend_timings(results)
+    if timings:
+        render_engine.record_timings(timings)
+        print("\nBackend timings for automatic selection: " +
+              ', '.join(f"{path} {seconds:.3f}s" for path, seconds in timings.items()) +
+              f" (written to {render_engine.TIMINGS_FILE})")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, failures)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%} "
+                  f"or without a result")
+            return 1
+        print(f"\nNo regression above {args.threshold:.0%}")
+
+    failed = [case_id for case_id, reason in failures.items() if reason.startswith('FAILED')]
+    if failed:
+        print(f"\n{len(failed)} case(s) failed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
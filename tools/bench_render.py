@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark per-artist versus batched plotting of large supply networks
+Vergleicht Einzel-Artists mit gebündeltem Zeichnen großer Liefernetze
+比较逐个绘制与批量绘制大型供应网络的性能
+
+Synthetic networks over the Central Europe extent are drawn once with one
+scatter/plot call per location and route (the old generator loop) and once
+with map_layers (one scatter per category, one LineCollection). Times cover
+artist creation plus rasterization with the Agg canvas.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import lazy_deps
+import map_layers
+
+EXTENT = [5, 15, 47, 56]
+CATEGORIES = {
+    'production': {'color': 'red'},
+    'distribution': {'color': 'blue'},
+    'market': {'color': 'green'},
+}
+SIZES = {'production': 300, 'distribution': 150, 'market': 100}
+
+
+def synthetic_network(n_nodes, routes_per_node=5, seed=0):
+    """Random nodes inside EXTENT and routes between random node pairs"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    west, east, south, north = EXTENT
+    lons = rng.uniform(west, east, n_nodes)
+    lats = rng.uniform(south, north, n_nodes)
+    categories = rng.choice(list(CATEGORIES), n_nodes, p=[0.01, 0.09, 0.9])
+    sizes = np.array([SIZES[c] for c in categories], dtype=float)
+    n_routes = n_nodes * routes_per_node
+    start = rng.integers(0, n_nodes, n_routes)
+    end = rng.integers(0, n_nodes, n_routes)
+    return lons, lats, categories, sizes, start, end
+
+
+def draw_loop(ax, lons, lats, categories, sizes, start, end):
+    """One artist per location and per route, as the generators used to do"""
+    for lon, lat, category, size in zip(lons, lats, categories, sizes):
+        ax.scatter(lon, lat, c=CATEGORIES[category]['color'], s=size, alpha=0.7,
+                   edgecolors='black', linewidths=1.5, zorder=5)
+    for i, j in zip(start, end):
+        ax.plot([lons[i], lons[j]], [lats[i], lats[j]], 'b--',
+                linewidth=1.5, alpha=0.5, zorder=3)
+
+
+def draw_batch(ax, lons, lats, categories, sizes, start, end):
+    """One scatter per category and a single LineCollection"""
+    map_layers.plot_points(ax, lons, lats, categories, CATEGORIES, sizes=sizes,
+                           alpha=0.7, edgecolors='black', linewidths=1.5, zorder=5)
+    map_layers.plot_routes(ax, lons[start], lats[start], lons[end], lats[end],
+                           colors='blue', linestyles='--', linewidths=1.5,
+                           alpha=0.5, zorder=3)
+
+
+def time_render(draw, network, dpi):
+    """Seconds to create the artists and rasterize the figure"""
+    plt = lazy_deps.pyplot()
+    fig, ax = plt.subplots(figsize=(14, 10), dpi=dpi)
+    ax.set_xlim(EXTENT[0], EXTENT[1])
+    ax.set_ylim(EXTENT[2], EXTENT[3])
+    start = time.perf_counter()
+    draw(ax, *network)
+    fig.canvas.draw()
+    elapsed = time.perf_counter() - start
+    plt.close(fig)
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000, 100000],
+                        help='node counts to benchmark (default: 10 1000 10000 100000)')
+    parser.add_argument('--routes-per-node', type=int, default=5,
+                        help='routes generated per node (default: 5)')
+    parser.add_argument('--loop-max', type=int, default=1000,
+                        help='skip the per-artist loop above this node count (default: 1000)')
+    parser.add_argument('--dpi', type=int, default=100,
+                        help='rasterization dpi (default: 100)')
+    args = parser.parse_args(argv)
+
+    lazy_deps.pyplot()  # keep import cost out of the first measurement
+    print(f"{'nodes':>8} {'routes':>8} {'loop [s]':>10} {'batch [s]':>10} {'speedup':>8}")
+    for n_nodes in args.sizes:
+        network = synthetic_network(n_nodes, args.routes_per_node)
+        batch = time_render(draw_batch, network, args.dpi)
+        if n_nodes <= args.loop_max:
+            loop = time_render(draw_loop, network, args.dpi)
+            loop_text, speedup = f"{loop:10.3f}", f"{loop / batch:7.1f}x"
+        else:
+            loop_text, speedup = f"{'skipped':>10}", f"{'-':>8}"
+        print(f"{n_nodes:>8} {len(network[4]):>8} {loop_text} {batch:10.3f} {speedup}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dependency-aware build of the gallery: map data -> image -> XeLaTeX PDF
+Abhängigkeitsgesteuerter Build der Galerie: Kartendaten -> PNG -> XeLaTeX-PDF
+依赖感知的画廊构建：地图数据 -> PNG -> XeLaTeX PDF
+
+Every product .tex and paper/main.tex is a target. Its \\includegraphics,
+\\input and \\include files are parsed into a dependency graph: a graphic
+written by a map generator (the <KIND>_OUTPUT of its MAPS registry) depends
+on that map's data files (<KIND>_NETWORK, <KIND>_POINTS), the generator and
+the shared tools; the PDF depends on the .tex and all graphics. The world
+overview of paper/main.tex (tools/build_overview.py) depends on the network
+files of every product.
+
+Each raster graphic (.png, .jpg) is first turned into a variant sized to the
+width the document shows it at (see tools/assets.py), and xelatex compiles
+in a shadow directory of its own under <MAP_CACHE_DIR>/shadow/ where the
+graphics are replaced by their variants. The final PDF is written next to
+the .tex as before; --draft builds <name>-draft.pdf from low-resolution
+variants, which compiles faster and gives a much smaller file.
+
+Nodes whose inputs are unchanged since the last successful build (compared
+by content hash, recorded in <MAP_CACHE_DIR>/build-state.json) are skipped.
+The rest run in parallel as soon as their dependencies are done: maps in a
+process pool, xelatex in threads. xelatex runs a second time only when the
+first pass changed the .aux file or asked for a rerun.
+
+    python tools/build_gallery.py                  # everything
+    python tools/build_gallery.py germany/hamburg  # one product
+    python tools/build_gallery.py paper            # paper/main.tex only
+    python tools/build_gallery.py -n               # show what would be rebuilt
+    python tools/build_gallery.py --format pdf     # maps as vector PDFs
+    python tools/build_gallery.py --draft          # quick, small preview PDFs
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import assets
+import build_maps
+import build_overview
+import map_cache
+
+REPO_ROOT = build_maps.REPO_ROOT
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PAPER_TEX = os.path.join(REPO_ROOT, 'paper', 'main.tex')
+STATE_FILE = os.path.join(map_cache.CACHE_DIR, 'build-state.json')
+SHADOW_DIR = os.path.join(map_cache.CACHE_DIR, 'shadow')
+
+# Extensions tried by graphicx for \includegraphics{name} without one
+GRAPHICS_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg')
+
+DEPENDENCY_PATTERN = re.compile(
+    r'\\(includegraphics|input|include)\s*(?:\[([^\]]*)\])?\s*\{([^}]+)\}')
+
+# Generator attributes naming the data files of a map kind, e.g. SUPPLY_CHAIN_NETWORK
+DATA_SUFFIXES = ('_NETWORK', '_POINTS')
+
+XELATEX_COMMAND = ['xelatex', '-interaction=nonstopmode', '-halt-on-error']
+
+
+class Node:
+    """
+    One build step.
+
+    kind   : 'map', 'overview', 'asset' or 'pdf'
+    inputs : files whose content decides whether the node is up to date
+    outputs: files the node writes
+    deps   : names of nodes that must finish first
+    """
+
+    def __init__(self, name, kind, inputs, outputs, deps=(), **extra):
+        self.name = name
+        self.kind = kind
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = set(deps)
+        self.extra = extra
+
+
+def strip_comments(text):
+    """Drop TeX comments (an unescaped % to the end of the line)"""
+    return re.sub(r'(?<!\\)%.*', '', text)
+
+
+def tex_references(tex_file, generated=()):
+    """
+    (command, options, path) of every \\includegraphics, \\input and
+    \\include in a .tex file. A graphic named without extension resolves to
+    a generated file first (generated: paths written by map nodes), then to
+    an existing one.
+    """
+    with open(tex_file, encoding='utf-8') as f:
+        text = strip_comments(f.read())
+    base = os.path.dirname(tex_file)
+    references = []
+    for command, options, name in DEPENDENCY_PATTERN.findall(text):
+        path = os.path.normpath(os.path.join(base, name.strip()))
+        if command == 'includegraphics':
+            if not os.path.splitext(path)[1]:
+                candidates = [path + ext for ext in GRAPHICS_EXTENSIONS]
+                path = next((p for p in candidates if p in generated),
+                            next((p for p in candidates if os.path.exists(p)), path + '.png'))
+        elif not path.endswith('.tex'):
+            path += '.tex'
+        references.append((command, options, path))
+    return references
+
+
+def tex_dependencies(tex_file, generated=()):
+    """Files a .tex file needs: graphics and \\input/\\include sources"""
+    return [path for _, _, path in tex_references(tex_file, generated)]
+
+
+def raster_graphics(tex_file, generated=()):
+    """
+    {path: printed width in inches} of the raster graphics of a .tex file;
+    None when a graphic is shown at its natural size somewhere
+    """
+    with open(tex_file, encoding='utf-8') as f:
+        text_width = assets.text_width_in(strip_comments(f.read()))
+    widths = {}
+    for command, options, path in tex_references(tex_file, generated):
+        if command != 'includegraphics' or not assets.is_raster(path):
+            continue
+        width = assets.printed_width_in(options, text_width)
+        # The widest use decides; None (natural size) beats any width
+        previous = widths.get(path, 0.0)
+        widths[path] = None if width is None or previous is None else max(width, previous)
+    return widths
+
+
+def tool_sources():
+    """Shared tooling every map depends on, with its bundled data (gazetteer)"""
+    return sorted(glob.glob(os.path.join(TOOLS_DIR, '*.py'))
+                  + glob.glob(os.path.join(TOOLS_DIR, 'data', '*')))
+
+
+def map_nodes(product_dir):
+    """One node per map of a product's generator, keyed by its output file"""
+    module = build_maps.load_generator(product_dir)
+    generator = os.path.join(product_dir, build_maps.GENERATOR_NAME)
+    product = build_maps.product_name(product_dir)
+    nodes = []
+    for kind in getattr(module, 'MAPS', {}):
+        prefix = kind.upper().replace('-', '_')
+        output = getattr(module, prefix + '_OUTPUT', None)
+        data_files = [getattr(module, prefix + suffix, None) for suffix in DATA_SUFFIXES]
+        inputs = [generator] + [path for path in data_files if path] + tool_sources()
+        outputs = [map_cache.output_path(product_dir, output)] if output else []
+        nodes.append(Node(f"map:{product}:{kind}", 'map', inputs, outputs,
+                          product_dir=product_dir, map_kind=kind))
+    return nodes
+
+
+def _relative(path):
+    return os.path.relpath(path, REPO_ROOT).replace(os.sep, '/')
+
+
+def asset_node(source, width_in, quality, producers):
+    """Node writing the variant of one raster graphic"""
+    pixels = assets.target_pixels(width_in, quality)
+    name = f"asset:{_relative(source)}@{pixels or 'full'}:{quality}"
+    outputs = [assets.variant_path(source, width_in, quality)] if os.path.exists(source) else []
+    deps = {producers[source]} if source in producers else set()
+    return Node(name, 'asset', [source, assets.__file__], outputs, deps,
+                source=source, width_in=width_in, quality=quality)
+
+
+def overview_node():
+    """Node of the gallery overview map, which reads every product's networks"""
+    product_dirs = build_maps.find_product_dirs()
+    inputs = build_overview.network_files(product_dirs) + tool_sources()
+    output = map_cache.output_path(build_overview.OVERVIEW_DIR, build_overview.OVERVIEW_OUTPUT)
+    return Node('overview', 'overview', inputs, [output])
+
+
+def pdf_output(tex_file, quality):
+    """<name>.pdf next to the .tex, <name>-draft.pdf for drafts"""
+    stem = os.path.splitext(tex_file)[0]
+    return stem + ('-draft.pdf' if quality == 'draft' else '.pdf')
+
+
+def pdf_node(tex_file, producers, quality='final'):
+    """
+    Node compiling tex_file, and the asset nodes of its raster graphics;
+    producers maps generated files to node names
+    """
+    inputs = [tex_file] + tex_dependencies(tex_file, producers) + [assets.__file__]
+    deps = {producers[path] for path in inputs if path in producers}
+    variants = {}
+    asset_nodes = []
+    for source, width_in in raster_graphics(tex_file, producers).items():
+        node = asset_node(source, width_in, quality, producers)
+        variants[source] = node.name
+        asset_nodes.append(node)
+    name = 'pdf:' + _relative(tex_file) + ('@draft' if quality == 'draft' else '')
+    node = Node(name, 'pdf', inputs, [pdf_output(tex_file, quality)], deps | set(variants.values()),
+                tex_file=tex_file, quality=quality, variants=variants)
+    return node, asset_nodes
+
+
+def product_tex_files(product_dir):
+    """Top-level documents of a product (files with \\documentclass)"""
+    documents = []
+    for path in sorted(glob.glob(os.path.join(product_dir, '*.tex'))):
+        with open(path, encoding='utf-8') as f:
+            if '\\documentclass' in strip_comments(f.read()):
+                documents.append(path)
+    return documents
+
+
+def build_graph(targets, quality='final'):
+    """Nodes for the requested targets: product dirs and/or .tex files"""
+    nodes = {}
+    producers = {}
+    tex_files = []
+    for target in targets:
+        if target.endswith('.tex'):
+            product_dir = os.path.dirname(target)
+            tex_files.append(target)
+        else:
+            product_dir = target
+            tex_files.extend(product_tex_files(product_dir))
+        if os.path.isfile(os.path.join(product_dir, build_maps.GENERATOR_NAME)):
+            for node in map_nodes(product_dir):
+                nodes[node.name] = node
+                for output in node.outputs:
+                    producers[output] = node.name
+    if PAPER_TEX in tex_files:
+        node = overview_node()
+        nodes[node.name] = node
+        producers[node.outputs[0]] = node.name
+    for tex_file in tex_files:
+        node, asset_nodes = pdf_node(tex_file, producers, quality)
+        nodes[node.name] = node
+        # Documents sharing a graphic at the same size share its asset node
+        for asset in asset_nodes:
+            nodes.setdefault(asset.name, asset)
+    return nodes
+
+
+def resolve_targets(names):
+    """Turn CLI names ('germany/hamburg', 'paper', paths) into absolute targets"""
+    if not names:
+        return build_maps.find_product_dirs() + [PAPER_TEX]
+    targets = []
+    for name in names:
+        if name == 'paper':
+            targets.append(PAPER_TEX)
+        elif os.path.exists(name):
+            targets.append(os.path.abspath(name))
+        elif os.path.isdir(os.path.join(build_maps.PRODUCT_ROOT, name)):
+            targets.append(os.path.join(build_maps.PRODUCT_ROOT, name))
+        else:
+            raise SystemExit(f"Unknown target: {name}")
+    return targets
+
+
+def load_state():
+    try:
+        with open(STATE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    tmp = f"{STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, STATE_FILE)
+
+
+def digests(paths):
+    """Content hash per path, None for missing files"""
+    return {os.path.relpath(p, REPO_ROOT): map_cache.file_digest(p) if os.path.exists(p) else None
+            for p in paths}
+
+
+def is_current(node, state):
+    """Whether node's inputs and outputs match the last successful build"""
+    recorded = state.get(node.name)
+    if not recorded or not node.outputs:
+        return False
+    return (recorded.get('inputs') == digests(node.inputs)
+            and recorded.get('outputs') == digests(node.outputs)
+            and all(os.path.exists(p) for p in node.outputs))
+
+
+def stale_nodes(nodes, state):
+    """
+    Nodes that are out of date or downstream of one that is. This is an upper
+    bound: a PDF whose graphics come out byte-identical is still skipped,
+    because run_graph checks every node again once its dependencies are done.
+    """
+    stale = {name for name, node in nodes.items() if not is_current(node, state)}
+    changed = True
+    while changed:
+        changed = False
+        for name, node in nodes.items():
+            if name not in stale and node.deps & stale:
+                stale.add(name)
+                changed = True
+    return stale
+
+
+def run_map(product_dir, kind):
+    """Process-pool entry point for one map node"""
+    return build_maps.run_job(product_dir, kind)
+
+
+def run_asset(source, width_in, quality):
+    """Process-pool entry point for one asset node"""
+    try:
+        return assets.make_variant(source, width_in, quality)
+    except (OSError, ValueError) as e:
+        return {'ok': False, 'error': f"{source}: {e}\n"}
+
+
+def _run_xelatex(tex_file):
+    cwd = os.path.dirname(tex_file)
+    name = os.path.basename(tex_file)
+    proc = subprocess.run(XELATEX_COMMAND + [name], cwd=cwd, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, errors='replace')
+    return proc.returncode, proc.stdout
+
+
+def shadow_document(tex_file, quality, replacements):
+    """
+    Path of tex_file in its shadow tree, which mirrors the repository with
+    the graphics in replacements swapped for their variants. Each document
+    and quality has a tree of its own, so documents compiling at the same
+    time never touch each other's files, and the .aux of the last build
+    is still there for the next one.
+    """
+    document = os.path.splitext(os.path.relpath(tex_file, REPO_ROOT))[0]
+    shadow_root = os.path.join(SHADOW_DIR, quality, document.replace(os.sep, '.'))
+    assets.shadow_tree(REPO_ROOT, shadow_root, replacements,
+                       real_dirs=[os.path.dirname(tex_file)])
+    return os.path.join(shadow_root, os.path.relpath(tex_file, REPO_ROOT))
+
+
+def run_pdf(tex_file, output, quality='final', replacements=None):
+    """
+    xelatex once in the shadow tree, and a second time when cross-references
+    need it; the PDF is then copied to output
+    """
+    start = time.perf_counter()
+    result = {'ok': False, 'passes': 0}
+    if shutil.which(XELATEX_COMMAND[0]) is None:
+        result['error'] = "xelatex not found on PATH (install TeX Live or MiKTeX)\n"
+        return result
+    tex_file = shadow_document(tex_file, quality, replacements or {})
+    aux = os.path.splitext(tex_file)[0] + '.aux'
+    before = map_cache.file_digest(aux) if os.path.exists(aux) else None
+    for attempt in range(2):
+        code, log = _run_xelatex(tex_file)
+        result['passes'] += 1
+        if code != 0:
+            result['error'] = log[-3000:]
+            break
+        after = map_cache.file_digest(aux) if os.path.exists(aux) else None
+        if after == before and 'Rerun to get' not in log:
+            result['ok'] = True
+            break
+        before = after
+    else:
+        result['ok'] = True
+    if result['ok']:
+        tmp = f"{output}.{os.getpid()}.tmp"
+        shutil.copyfile(os.path.splitext(tex_file)[0] + '.pdf', tmp)
+        os.replace(tmp, output)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_graph(nodes, state, workers=None, dry_run=False, force=False):
+    """Run out-of-date nodes in dependency order; returns (built, skipped, failed)"""
+    if dry_run:
+        stale = set(nodes) if force else stale_nodes(nodes, state)
+        for name in sorted(nodes):
+            print(f"{'rebuild' if name in stale else 'current':<8} {name}")
+        return [], [], []
+
+    pending = {name: set(n.deps & set(nodes)) for name, n in nodes.items()}
+    built, skipped, failed = [], [], []
+
+    workers = workers or os.cpu_count() or 1
+    # Maps and image variants share the process pool, xelatex runs in threads
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            ThreadPoolExecutor(max_workers=workers) as latex:
+        running = {}
+
+        def ready():
+            return [name for name, deps in pending.items() if not deps]
+
+        def fail(name, error):
+            failed.append((name, error))
+            print(f"[FAILED] {name}")
+            drop_dependents(name, pending, failed)
+
+        while pending or running:
+            for name in ready():
+                del pending[name]
+                node = nodes[name]
+                # Re-check now that upstream nodes have written their outputs
+                if not force and is_current(node, state):
+                    skipped.append(name)
+                    finish(name, pending)
+                    continue
+                try:
+                    if node.kind == 'map':
+                        future = pool.submit(run_map, node.extra['product_dir'],
+                                             node.extra['map_kind'])
+                    elif node.kind == 'overview':
+                        future = pool.submit(build_overview.run_job)
+                    elif node.kind == 'asset':
+                        future = pool.submit(run_asset, node.extra['source'],
+                                             node.extra['width_in'], node.extra['quality'])
+                    else:
+                        replacements = {source: nodes[asset].outputs[0]
+                                        for source, asset in node.extra['variants'].items()}
+                        future = latex.submit(run_pdf, node.extra['tex_file'], node.outputs[0],
+                                              node.extra['quality'], replacements)
+                except BrokenProcessPool as e:
+                    fail(name, f"worker pool broken: {e}\n")
+                    continue
+                running[future] = name
+            if not running:
+                if pending and not ready():
+                    # Nothing runs and nothing can start: a dependency cycle
+                    for name in sorted(pending):
+                        waiting = ', '.join(sorted(pending[name]))
+                        failed.append((name, f"dependency cycle, waiting on {waiting}\n"))
+                        print(f"[FAILED] {name} (waiting on {waiting})")
+                    pending.clear()
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died (killed, out of memory); the pool is unusable now
+                    result = {'ok': False, 'error': f"worker process died: {e}\n"}
+                node = nodes[name]
+                if result.get('ok'):
+                    if node.kind == 'asset':
+                        # The variant path follows the source's content
+                        node.outputs = [result['output']]
+                    state[name] = {'inputs': digests(node.inputs), 'outputs': digests(node.outputs)}
+                    save_state(state)
+                    built.append(name)
+                    detail = ''
+                    if node.kind == 'asset':
+                        detail = f", {result['source_bytes'] // 1024} -> {result['bytes'] // 1024} KB"
+                    elif 'passes' in result:
+                        detail = f", {result['passes']} xelatex pass{'es' if result['passes'] > 1 else ''}"
+                    print(f"[built]  {name} ({result.get('seconds', 0):.2f}s{detail})")
+                    finish(name, pending)
+                else:
+                    fail(name, result.get('error', ''))
+    return built, skipped, failed
+
+
+def finish(name, pending):
+    """Mark name done for every node waiting on it"""
+    for deps in pending.values():
+        deps.discard(name)
+
+
+def drop_dependents(name, pending, failed):
+    """Remove nodes that can no longer be built because name failed"""
+    for other in [n for n, deps in pending.items() if name in deps]:
+        del pending[other]
+        failed.append((other, f"dependency {name} failed\n"))
+        print(f"[FAILED] {other} (dependency {name} failed)")
+        drop_dependents(other, pending, failed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('targets', nargs='*',
+                        help="product directories or 'country/city', .tex files, or 'paper' "
+                             "(default: all products and paper/main.tex)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='parallel workers (default: CPU count)')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='list the nodes and whether they would be rebuilt')
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild every node of the selected targets')
+    parser.add_argument('--format', choices=map_cache.OUTPUT_FORMATS,
+                        help='file format of the maps (default: MAP_FORMAT, else png)')
+    parser.add_argument('--draft', action='store_true',
+                        help='build <name>-draft.pdf with low-resolution images')
+    args = parser.parse_args(argv)
+
+    if args.format:
+        # Read by map_cache.output_format() here and in the map workers
+        os.environ['MAP_FORMAT'] = args.format
+
+    start = time.perf_counter()
+    nodes = build_graph(resolve_targets(args.targets), 'draft' if args.draft else 'final')
+    state = load_state()
+    built, skipped, failed = run_graph(nodes, state, args.jobs, args.dry_run, args.force)
+    if args.dry_run:
+        return 0
+
+    print("\n" + "=" * 60)
+    print(f"Built: {len(built)}  Up to date: {len(skipped)}  Failed: {len(failed)}  "
+          f"({time.perf_counter() - start:.2f}s)")
+    print("=" * 60)
+    for name, error in failed:
+        print(f"\n--- {name} ---")
+        print(error.rstrip())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Build the maps of every product in the gallery in parallel
+Erstellt die Karten aller Produkte der Galerie parallel
+并行生成画廊中所有产品的地图
+
+Every product-tex/{country}/{city} directory that contains a generate_map.py
+is picked up. Each (product, map kind) pair listed in the generator's MAPS
+registry becomes one job in a process pool sized to the machine's cores.
+
+--profile writes per-stage timing and peak memory of every job as JSON lines
+(see instrument.py). --format pdf or --format svg writes vector maps
+instead of PNGs (see map_cache.py and base_map.py). --backend and
+--fidelity choose how the maps are drawn (see render_engine.py), for
+example --backend agg for quick drafts.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import instrument
+import map_cache
+import render_engine
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PRODUCT_ROOT = os.path.join(REPO_ROOT, 'product-tex')
+GENERATOR_NAME = 'generate_map.py'
+
+
+def find_product_dirs(root=PRODUCT_ROOT):
+    """Return every product-tex/{country}/{city} directory with a map generator"""
+    product_dirs = []
+    if not os.path.isdir(root):
+        return product_dirs
+    for country in sorted(os.listdir(root)):
+        country_dir = os.path.join(root, country)
+        if not os.path.isdir(country_dir):
+            continue
+        for city in sorted(os.listdir(country_dir)):
+            city_dir = os.path.join(country_dir, city)
+            if os.path.isfile(os.path.join(city_dir, GENERATOR_NAME)):
+                product_dirs.append(city_dir)
+    return product_dirs
+
+
+def product_name(product_dir):
+    """Short 'country/city' name used in progress output"""
+    return os.path.relpath(product_dir, PRODUCT_ROOT).replace(os.sep, '/')
+
+
+def load_generator(product_dir, reload=False):
+    """Import a product's generate_map.py under a unique module name"""
+    module_name = 'generate_map_' + product_name(product_dir).replace('/', '_').replace('-', '_')
+    if reload:
+        sys.modules.pop(module_name, None)
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    path = os.path.join(product_dir, GENERATOR_NAME)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            spec.loader.exec_module(module)
+    except Exception:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+def list_jobs(product_dirs):
+    """Expand product directories into (product_dir, map_kind) jobs"""
+    jobs = []
+    failures = []
+    for product_dir in product_dirs:
+        try:
+            module = load_generator(product_dir)
+        except Exception:
+            failures.append({
+                'product': product_name(product_dir),
+                'kind': '*',
+                'error': traceback.format_exc(),
+            })
+            continue
+        maps = getattr(module, 'MAPS', None)
+        if not maps:
+            failures.append({
+                'product': product_name(product_dir),
+                'kind': '*',
+                'error': f"{GENERATOR_NAME} does not define a MAPS registry\n",
+            })
+            continue
+        for kind in maps:
+            jobs.append((product_dir, kind))
+    return jobs, failures
+
+
+def run_job(product_dir, kind, backend=None, fidelity=None):
+    """
+    Render one map in a worker process and report the outcome; backend and
+    fidelity override MAP_BACKEND and MAP_FIDELITY for this job
+    """
+    log = io.StringIO()
+    start = time.perf_counter()
+    result = {'product': product_name(product_dir), 'kind': kind}
+    try:
+        with contextlib.redirect_stdout(log), render_engine.use(backend, fidelity), \
+                instrument.stage('job', product=result['product'], kind=kind):
+            module = load_generator(product_dir)
+            result['output'] = module.MAPS[kind](output_dir=product_dir)
+        result['ok'] = True
+    except Exception:
+        result['ok'] = False
+        result['error'] = log.getvalue() + traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def build(product_dirs, workers=None, backend=None, fidelity=None):
+    """
+    Render all jobs in a process pool and return (results, failures);
+    backend and fidelity are passed to every job (see run_job)
+    """
+    jobs, failures = list_jobs(product_dirs)
+    results = []
+    if not jobs:
+        return results, failures
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    print(f"Rendering {len(jobs)} maps from {len(product_dirs)} products "
+          f"with {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, product_dir, kind, backend, fidelity)
+                   for product_dir, kind in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = 'OK' if result['ok'] else 'FAILED'
+            print(f"  [{status}] {result['product']} {result['kind']} "
+                  f"({result['seconds']:.2f}s)")
+            if not result['ok']:
+                failures.append(result)
+    return results, failures
+
+
+def print_summary(results, failures, wall_seconds):
+    """Print throughput numbers and the list of failed jobs"""
+    rendered = sum(1 for r in results if r['ok'])
+    busy_seconds = sum(r['seconds'] for r in results)
+    print("\n" + "=" * 60)
+    print(f"Maps rendered:   {rendered}/{len(results)}")
+    print(f"Wall time:       {wall_seconds:.2f}s")
+    if wall_seconds > 0:
+        print(f"Throughput:      {rendered / wall_seconds:.2f} maps/s")
+        print(f"Parallel speedup: {busy_seconds / wall_seconds:.2f}x "
+              f"({busy_seconds:.2f}s of render time)")
+    print("=" * 60)
+
+    if failures:
+        print(f"\n✗ {len(failures)} job(s) failed:")
+        for failure in failures:
+            print(f"\n--- {failure['product']} [{failure['kind']}] ---")
+            print(failure['error'].rstrip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('products', nargs='*',
+                        help='product directories to build (default: all under product-tex/)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='re-render every map even if a cached copy exists')
+    parser.add_argument('--profile', nargs='?', const='1', metavar='PATH',
+                        help='emit per-stage timing and memory as JSON lines, '
+                             'to PATH if given, else to stderr')
+    parser.add_argument('--format', choices=map_cache.OUTPUT_FORMATS,
+                        help='file format of the maps (default: MAP_FORMAT, else png)')
+    parser.add_argument('--backend', choices=['auto'] + list(render_engine.BACKENDS),
+                        help='render backend (default: MAP_BACKEND, else auto)')
+    parser.add_argument('--fidelity', choices=render_engine.FIDELITIES,
+                        help='least fidelity the automatic backend choice must meet '
+                             '(default: MAP_FIDELITY, else per map style)')
+    args = parser.parse_args(argv)
+
+    if args.no_cache:
+        # Inherited by the worker processes, read by map_cache.cache_enabled()
+        os.environ['MAP_CACHE'] = '0'
+    if args.profile:
+        # Same mechanism as MAP_CACHE: the workers read MAP_PROFILE
+        os.environ['MAP_PROFILE'] = os.path.abspath(args.profile) if args.profile != '1' else '1'
+    if args.format:
+        os.environ['MAP_FORMAT'] = args.format
+
+    if args.products:
+        product_dirs = [os.path.abspath(p) for p in args.products]
+    else:
+        product_dirs = find_product_dirs()
+
+    if not product_dirs:
+        print("No product directories found.")
+        return 0
+
+    start = time.perf_counter()
+    results, failures = build(product_dirs, workers=args.jobs, backend=args.backend,
+                              fidelity=args.fidelity)
+    print_summary(results, failures, time.perf_counter() - start)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
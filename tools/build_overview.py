@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+World overview map of every product in the gallery, with clustered locations
+Weltübersichtskarte aller Produkte der Galerie mit gruppierten Standorten
+画廊全部产品的世界总览地图（地点聚类）
+
+    python tools/build_overview.py                       # paper/world-overview.png
+    python tools/build_overview.py --zoom 5 -o europe.png
+    python tools/build_overview.py --json tiles/overview-clusters.json
+
+Reads the network files of every map of every product (the <KIND>_NETWORK
+of each generator's MAPS registry) into the gallery cluster hierarchy (see
+tools/clusters.py) and draws one marker per cluster: a plain marker for a
+single location, a circle sized by the number of locations with that
+number on it otherwise, never wider than a cluster cell so neighbours stay
+apart. The cluster level follows the map's width in
+points, the unit of marker sizes, unless --zoom says otherwise.
+
+Only products whose network files changed since the last run are read
+again; the rest of the hierarchy is reused. The map itself goes through the
+map cache like the product maps, keyed by the hierarchy's contents.
+--json writes the clusters of every zoom level for a web map:
+{"zooms": {"<z>": [[lon, lat, locations, products], ...]}}.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import base_map
+import build_maps
+import clusters
+import fonts
+import instrument
+import lazy_deps
+import map_cache
+import render_engine
+
+OVERVIEW_OUTPUT = 'world-overview.png'
+OVERVIEW_DIR = os.path.join(build_maps.REPO_ROOT, 'paper')
+
+TITLE_STYLE = {'fontsize': 14, 'fontweight': 'bold', 'pad': 20}
+
+SITE_STYLE = {'color': 'red', 's': 40}
+CLUSTER_STYLE = {'color': 'darkorange', 's': 160}
+
+OVERVIEW_BASE_MAP = {
+    'name': 'world',
+    'figsize': (14, 7),
+    'dpi': 300,
+    'extent': [-180, 180, -60, 80],
+    'geo': True,
+    'label_fontsize': 10,
+    'legend': {
+        'entries': [
+            dict(SITE_STYLE, linewidths=1.0, label='Location / Standort / 地点'),
+            dict(CLUSTER_STYLE, linewidths=1.0,
+                 label='Cluster of locations / Standortgruppe / 地点聚类'),
+        ],
+        'loc': 'lower left', 'fontsize': 9, 'framealpha': 0.9,
+        'title': 'Legend / Legende / 图例', 'title_fontsize': 10,
+    },
+    'title': TITLE_STYLE,
+}
+
+# Render parameters, part of the map cache key
+OVERVIEW_PARAMS = {
+    'base_map': OVERVIEW_BASE_MAP,
+    'zoom': None,  # cluster level; default: from the map width
+    'site': SITE_STYLE,
+    'cluster': CLUSTER_STYLE,
+    'count_fontsize': 7,
+}
+
+
+def _count_label(count):
+    """'7', '950', '12k', '1.2M': short enough for the smallest cluster marker"""
+    for limit, suffix in ((1e6, 'M'), (1e3, 'k')):
+        if count >= limit:
+            value = count / limit
+            return f"{value:.1f}{suffix}" if value < 10 else f"{value:.0f}{suffix}"
+    return str(int(count))
+
+
+def product_networks(product_dirs):
+    """{product name: network files of all its maps}"""
+    products = {}
+    for product_dir in product_dirs:
+        with contextlib.redirect_stdout(io.StringIO()):
+            module = build_maps.load_generator(product_dir)
+        files = []
+        for kind in getattr(module, 'MAPS', {}):
+            path = getattr(module, kind.upper().replace('-', '_') + '_NETWORK', None)
+            if path and os.path.exists(path) and path not in files:
+                files.append(path)
+        products[build_maps.product_name(product_dir)] = files
+    return products
+
+
+def network_files(product_dirs):
+    """Every network file the overview reads, for dependency tracking"""
+    return sorted({p for files in product_networks(product_dirs).values() for p in files})
+
+
+def create_overview_map(index, output_file, params=OVERVIEW_PARAMS):
+    """Render the overview of a ClusterIndex through the map cache"""
+    key = map_cache.cache_key(
+        inputs={'clusters': index.digest,
+                'backend': render_engine.select(params['base_map']).name},
+        params=params,
+        sources=[__file__, clusters.__file__, render_engine.__file__, base_map.__file__],
+    )
+    return map_cache.cached_render(output_file, key,
+                                   lambda path: _render_overview_map(index, path, params))
+
+
+def _render_overview_map(index, output_file, params):
+    """Draw the clusters of index on the world background"""
+    import numpy as np
+
+    print("Creating world overview map...")
+    plt = lazy_deps.pyplot()
+    template = render_engine.canvas(params['base_map'], output_file)
+    fig, ax, transform = template.overlay()
+
+    zoom = params['zoom']
+    if zoom is None:
+        # Points (the unit of marker sizes) the 360 degrees of longitude span
+        west, east = ax.get_xlim()
+        width = ax.get_window_extent().width * 72.0 / fig.dpi
+        zoom = clusters.zoom_for_width(width * 360.0 / (east - west))
+    lons, lats, counts, _ = index.clusters(zoom)
+    single = counts == 1
+    extra = {'transform': transform} if transform is not None else {}
+
+    with instrument.stage('artists', clusters=len(counts), zoom=zoom):
+        ax.scatter(lons[single], lats[single], c=params['site']['color'], s=params['site']['s'],
+                   edgecolors='black', linewidths=1.0, alpha=0.8, zorder=5, **extra)
+        grouped = ~single
+        # Area grows with the digits of the count, up to the cell width
+        sizes = np.minimum(params['cluster']['s'] * (1 + np.log10(counts[grouped])),
+                           (0.9 * clusters.CELL_PX) ** 2)
+        ax.scatter(lons[grouped], lats[grouped], c=params['cluster']['color'], s=sizes,
+                   edgecolors='black', linewidths=1.0, alpha=0.8, zorder=5, **extra)
+        for lon, lat, count in zip(lons[grouped], lats[grouped], counts[grouped]):
+            ax.text(lon, lat, _count_label(count), ha='center', va='center',
+                    fontsize=params['count_fontsize'], fontweight='bold', zorder=6, **extra)
+
+    title = 'World Product Gallery / Weltproduktgalerie'
+    if fonts.has_cjk():
+        title += ' / 世界产品画廊'
+    template.set_title(ax, title, **TITLE_STYLE)
+
+    print(f"Saving overview map to {output_file} (zoom {zoom}, {len(counts)} clusters)...")
+    template.composite(fig, output_file)
+    plt.close(fig)
+    return output_file
+
+
+def write_clusters_json(index, path):
+    """Clusters of every zoom level as JSON for a web map"""
+    import numpy as np
+
+    zooms = {}
+    for z in range(clusters.MAX_CLUSTER_ZOOM + 1):
+        lons, lats, counts, products = index.clusters(z)
+        columns = [np.round(lons, 5).tolist(), np.round(lats, 5).tolist(),
+                   counts.tolist(), products.tolist()]
+        zooms[str(z)] = list(map(list, zip(*columns)))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        # dumps() uses the C encoder, dump() would stream through the Python one
+        f.write(json.dumps({'cell_px': clusters.CELL_PX, 'zooms': zooms}, separators=(',', ':')))
+    os.replace(tmp, path)
+    return path
+
+
+def build(product_dirs=None, output_file=None, zoom=None, json_file=None):
+    """Update the cluster hierarchy and render the overview; returns the output path"""
+    product_dirs = build_maps.find_product_dirs() if product_dirs is None else product_dirs
+    output_file = output_file or map_cache.output_path(OVERVIEW_DIR, OVERVIEW_OUTPUT)
+    with instrument.stage('clusters', products=len(product_dirs)):
+        index, changed = clusters.build_index(product_networks(product_dirs))
+    print(f"Cluster hierarchy: {len(index.products)} products, {index.total} locations, "
+          f"{len(changed)} updated ({', '.join(changed) or 'none'})")
+    params = dict(OVERVIEW_PARAMS, zoom=zoom) if zoom is not None else OVERVIEW_PARAMS
+    create_overview_map(index, output_file, params)
+    if json_file:
+        write_clusters_json(index, json_file)
+        print(f"✓ Clusters written to {json_file}")
+    return output_file
+
+
+def run_job():
+    """Process-pool entry point used by build_gallery.py"""
+    log = io.StringIO()
+    start = time.perf_counter()
+    result = {}
+    try:
+        with contextlib.redirect_stdout(log), instrument.stage('job', kind='overview'):
+            result['output'] = build()
+        result['ok'] = True
+    except Exception:
+        result['ok'] = False
+        result['error'] = log.getvalue() + traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('products', nargs='*',
+                        help='product directories (default: all under product-tex/)')
+    parser.add_argument('-o', '--output',
+                        help=f'image file (default: paper/{OVERVIEW_OUTPUT}, format per MAP_FORMAT)')
+    parser.add_argument('--zoom', type=int,
+                        help='cluster level (default: from the map width)')
+    parser.add_argument('--json', help='also write the clusters of every zoom level as JSON')
+    args = parser.parse_args(argv)
+
+    product_dirs = [os.path.abspath(p) for p in args.products] or None
+    print("=" * 60)
+    print("World overview map")
+    print("=" * 60)
+    start = time.perf_counter()
+    output = build(product_dirs, args.output and os.path.abspath(args.output), args.zoom, args.json)
+    print(f"\n✓ {output} ({time.perf_counter() - start:.2f}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Build or serve XYZ tile pyramids of the product networks
+Erstellt oder liefert XYZ-Kachelpyramiden der Produktnetzwerke
+构建或提供产品网络的 XYZ 瓦片金字塔
+
+    python tools/build_tiles.py build                        # every product
+    python tools/build_tiles.py build product-tex/germany/hamburg --zoom 5-12 -o site/tiles
+    python tools/build_tiles.py serve --port 8765
+
+build writes <output>/<country>/<city>/<kind>/{z}/{x}/{y}.png for every
+tile with data, over each map's zoom range (see tools/tiles.py) unless
+--zoom says otherwise. serve renders tiles on request over HTTP:
+
+    /<country>/<city>/<kind>/{z}/{x}/{y}.png   the tile (204 without data)
+    /<country>/<city>/<kind>.json               TileJSON with zoom range and bounds
+
+Both share the disk tile cache, so a pyramid built once is served without
+rendering; the server also keeps recent tiles in memory. A changed network
+file gives a new cache key on the next request and its tiles are rendered
+again.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import build_maps
+import tiles
+
+DEFAULT_OUTPUT = os.path.join(build_maps.REPO_ROOT, 'tiles')
+DEFAULT_PORT = 8765
+
+TILE_PATTERN = re.compile(r'^/(?P<product>.+)/(?P<kind>[\w-]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$')
+TILEJSON_PATTERN = re.compile(r'^/(?P<product>.+)/(?P<kind>[\w-]+)\.json$')
+
+
+def parse_zoom(text):
+    """'5-12' -> range(5, 13), '8' -> range(8, 9); levels 0 to tiles.MAX_ZOOM"""
+    low, _, high = text.partition('-')
+    try:
+        low, high = int(low), int(high or low)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid zoom '{text}', expected e.g. 8 or 5-12")
+    if not 0 <= low <= high <= tiles.MAX_ZOOM:
+        raise argparse.ArgumentTypeError(
+            f"invalid zoom '{text}', levels go from 0 to {tiles.MAX_ZOOM}, low to high")
+    return range(low, high + 1)
+
+
+def load_tilesets(product_dir, kinds=None):
+    """{kind: TileSet} for the tileable maps of a product"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        module = build_maps.load_generator(product_dir)
+    available = tiles.tile_kinds(module)
+    unknown = set(kinds or ()) - set(available)
+    if unknown:
+        raise KeyError(f"No tiles for {', '.join(sorted(unknown))} "
+                       f"(available: {', '.join(available)})")
+    return {kind: tiles.for_map(module, kind) for kind in kinds or available}
+
+
+def build(product_dirs, output_dir, zooms=None, kinds=None):
+    """Write the tile pyramids of the given products; returns the number of tiles"""
+    total = 0
+    start = time.perf_counter()
+    for product_dir in product_dirs:
+        product = build_maps.product_name(product_dir)
+        for kind, tileset in load_tilesets(product_dir, kinds).items():
+            levels = zooms or range(tileset.min_zoom, tileset.max_zoom + 1)
+            kind_start = time.perf_counter()
+            written = tileset.write_pyramid(os.path.join(output_dir, product, kind), levels)
+            tileset.close()
+            stats = tileset.stats
+            print(f"  [OK] {product} {kind}: {written} tiles, zoom {levels[0]}-{levels[-1]} "
+                  f"({stats['rendered']} rendered, {stats['disk']} from cache, "
+                  f"{time.perf_counter() - kind_start:.2f}s)")
+            total += written
+    print(f"\n{total} tiles written to {output_dir} in {time.perf_counter() - start:.2f}s")
+    return total
+
+
+class TileServer:
+    """Tile sets per (product, kind), rebuilt when their cache key changes"""
+
+    def __init__(self, product_dirs):
+        self.product_dirs = {build_maps.product_name(d): d for d in product_dirs}
+        self.tilesets = {}
+        self.lock = threading.Lock()  # pyplot is not thread-safe
+
+    def tileset(self, product, kind):
+        if product not in self.product_dirs:
+            raise KeyError(f"Unknown product: {product}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            module = build_maps.load_generator(self.product_dirs[product])
+        if kind not in tiles.tile_kinds(module):
+            raise KeyError(f"No tiles for {product} [{kind}]")
+        current = self.tilesets.get((product, kind))
+        key = tiles.tile_key(module, kind)
+        if current is None or current.key != key:
+            if current is not None:
+                current.close()
+                print(f"Data of {product} [{kind}] changed, new tile set", flush=True)
+            current = tiles.for_map(module, kind, key)
+            self.tilesets[(product, kind)] = current
+        return current
+
+    def tile(self, product, kind, z, x, y):
+        with self.lock:
+            return self.tileset(product, kind).tile(z, x, y)
+
+    def tilejson(self, product, kind, host):
+        with self.lock:
+            tileset = self.tileset(product, kind)
+        return tileset.tilejson(f"http://{host}/{product}/{kind}/{{z}}/{{x}}/{{y}}.png")
+
+
+def serve(port, product_dirs):
+    """Serve tiles over HTTP on 127.0.0.1:port until interrupted"""
+    server = TileServer(product_dirs)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body=b'', content_type='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            try:
+                match = TILE_PATTERN.match(path)
+                if match:
+                    data = server.tile(match['product'], match['kind'],
+                                       int(match['z']), int(match['x']), int(match['y']))
+                    if data is None:
+                        return self._send(204)
+                    return self._send(200, data, 'image/png')
+                match = TILEJSON_PATTERN.match(path)
+                if match:
+                    info = server.tilejson(match['product'], match['kind'],
+                                           self.headers.get('Host', f'127.0.0.1:{port}'))
+                    return self._send(200, json.dumps(info).encode('utf-8'))
+                return self._send(404, b'{"error": "not found"}')
+            except (KeyError, ValueError) as e:
+                return self._send(404, json.dumps({'error': str(e)}).encode('utf-8'))
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    print(f"Serving tiles of {len(product_dirs)} products on http://127.0.0.1:{port}/", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='write tile pyramids')
+    build_parser.add_argument('products', nargs='*',
+                              help='product directories (default: all under product-tex/)')
+    build_parser.add_argument('--kind', action='append', dest='kinds',
+                              help='map kind to tile (repeatable; default: all with a network)')
+    build_parser.add_argument('--zoom', type=parse_zoom,
+                              help="zoom levels, e.g. '5-12' (default: per map)")
+    build_parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT,
+                              help=f'output directory (default: {DEFAULT_OUTPUT})')
+
+    serve_parser = commands.add_parser('serve', help='render tiles on request over HTTP')
+    serve_parser.add_argument('products', nargs='*',
+                              help='product directories (default: all under product-tex/)')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                              help=f'local HTTP port (default: {DEFAULT_PORT})')
+    args = parser.parse_args(argv)
+
+    if args.products:
+        product_dirs = [os.path.abspath(p) for p in args.products]
+    else:
+        product_dirs = build_maps.find_product_dirs()
+
+    if args.command == 'serve':
+        serve(args.port, product_dirs)
+        return 0
+
+    print("=" * 60)
+    print("Building map tiles")
+    print("=" * 60)
+    build(product_dirs, os.path.abspath(args.output), args.zoom, args.kinds)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
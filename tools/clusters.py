@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Hierarchical grid clustering of the locations of every product in the gallery
+Hierarchische Gitter-Clusterung der Standorte aller Produkte der Galerie
+画廊全部产品地点的层级网格聚类
+
+A world map with every node of every network is slow to draw and can't be
+read. The overview draws one marker per cluster instead. The clusters come
+from a quadtree of grid cells in Web Mercator world coordinates (see
+tiles.project): at zoom z the world is 2^(z + CELL_BITS) cells across, so a
+cell is CELL_PX screen pixels wide at that zoom and holds the four cells of
+zoom z + 1 below it. Each cell keeps the number of locations, the sum of
+their coordinates (its centroid) and the number of products in it.
+
+A product's hierarchy is built bottom-up once: its locations go into the
+cells of MAX_CLUSTER_ZOOM, and each level above is the previous one grouped
+by parent cell, so the cost is the number of occupied cells, not of points.
+It is stored in <MAP_CACHE_DIR>/clusters/products/, keyed by the product's
+network files and the gazetteer.
+
+The gallery hierarchy is the cell-wise sum of all product hierarchies. The
+sums are integers (coordinates in fixed point), so when one product changes
+its old hierarchy is subtracted and the new one added, exactly, without
+reading the other products again. ClusterIndex keeps that state in
+<MAP_CACHE_DIR>/clusters/gallery.npz.
+"""
+
+import hashlib
+import json
+import math
+import os
+
+import gazetteer
+import map_cache
+import network
+import tiles
+
+CLUSTER_CACHE_DIR = os.path.join(map_cache.CACHE_DIR, 'clusters')
+GALLERY_FILE = os.path.join(CLUSTER_CACHE_DIR, 'gallery.npz')
+
+# Bump when the stored arrays change
+CLUSTER_FORMAT = 1
+
+# Cells per 256 px tile across: 2^3 = 8, so a cell is 32 px wide
+CELL_BITS = 3
+CELL_PX = 256 >> CELL_BITS
+
+# Finest level of the hierarchy
+MAX_CLUSTER_ZOOM = 16
+
+# World coordinates in [0, 1] are summed as integers in this fixed point
+FIXED_POINT = 1 << 24
+
+# Locations of one product at the same place in several networks count once
+DEDUPLICATE_DEGREES = 1e-5
+
+COLUMNS = ('keys', 'count', 'sx', 'sy', 'products')
+
+
+def _empty_level():
+    import numpy as np
+
+    return {column: np.zeros(0, dtype=np.int64) for column in COLUMNS}
+
+
+def _group(keys, columns):
+    """Sum the columns over equal keys: (unique keys, summed columns), exact for int64"""
+    import numpy as np
+
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    if not len(keys):
+        return keys, [c[order] for c in columns]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], [np.add.reduceat(c[order], starts) for c in columns]
+
+
+def _parent(keys):
+    """Cell keys one zoom level up"""
+    ix, iy = keys >> 32, keys & 0xFFFFFFFF
+    return ((ix >> 1) << 32) | (iy >> 1)
+
+
+def summarize(lons, lats, max_zoom=MAX_CLUSTER_ZOOM):
+    """
+    Cluster hierarchy of one product's locations: a list of levels for zoom
+    0..max_zoom, each a dict of int64 arrays (keys, count, sx, sy, products)
+    """
+    import numpy as np
+
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    if len(lons):
+        rounded = np.round(np.column_stack([lons, lats]) / DEDUPLICATE_DEGREES)
+        _, first = np.unique(rounded, axis=0, return_index=True)
+        lons, lats = lons[np.sort(first)], lats[np.sort(first)]
+    x, y = tiles.project(lons, lats)
+    fx = np.clip(np.round(x * FIXED_POINT), 0, FIXED_POINT - 1).astype(np.int64)
+    fy = np.clip(np.round(y * FIXED_POINT), 0, FIXED_POINT - 1).astype(np.int64)
+
+    # Finest cells straight from the fixed-point coordinates
+    shift = 24 - (max_zoom + CELL_BITS)
+    keys = ((fx >> shift) << 32) | (fy >> shift)
+    keys, (count, sx, sy) = _group(keys, [np.ones_like(fx), fx, fy])
+    levels = [None] * (max_zoom + 1)
+    for z in range(max_zoom, -1, -1):
+        levels[z] = {'keys': keys, 'count': count, 'sx': sx, 'sy': sy,
+                     'products': np.ones_like(keys)}
+        if z:
+            keys, (count, sx, sy) = _group(_parent(keys), [count, sx, sy])
+    return levels
+
+
+def merge(levels, add=(), subtract=()):
+    """Cell-wise sum of levels plus the hierarchies in add, minus those in subtract"""
+    import numpy as np
+
+    merged = []
+    for z, level in enumerate(levels):
+        parts = [level] + [h[z] for h in add] + [
+            {c: -h[z][c] if c != 'keys' else h[z][c] for c in COLUMNS} for h in subtract]
+        keys, columns = _group(np.concatenate([p['keys'] for p in parts]),
+                               [np.concatenate([p[c] for p in parts]) for c in COLUMNS[1:]])
+        kept = columns[0] > 0
+        merged.append(dict(zip(COLUMNS, [keys[kept]] + [c[kept] for c in columns])))
+    return merged
+
+
+def _unproject(x, y):
+    """Inverse of tiles.project: lon/lat in degrees"""
+    import numpy as np
+
+    return x * 360.0 - 180.0, np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y))))
+
+
+def zoom_for_width(world_px, max_zoom=MAX_CLUSTER_ZOOM):
+    """
+    Cluster level for a map on which the whole world is world_px wide, in
+    the unit cells are measured in (screen pixels, or points for print)
+    """
+    return int(min(max(math.floor(math.log2(max(world_px, 1) / 256)), 0), max_zoom))
+
+
+def product_digest(network_files):
+    """Cache key of a product's hierarchy: its network files and what resolves them"""
+    payload = {
+        'format': CLUSTER_FORMAT,
+        'cell_bits': CELL_BITS,
+        'max_zoom': MAX_CLUSTER_ZOOM,
+        'networks': sorted(map_cache.file_digest(os.path.abspath(p)) for p in network_files),
+        'gazetteer': map_cache.file_digest(gazetteer.GAZETTEER_FILE),
+        'sources': [map_cache.file_digest(p) for p in (__file__, network.__file__,
+                                                        tiles.__file__, gazetteer.__file__)],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _hierarchy_path(digest):
+    return os.path.join(CLUSTER_CACHE_DIR, 'products', digest[:2], digest + '.npz')
+
+
+def _save_levels(path, levels, meta=None):
+    import numpy as np
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {f"z{z}_{c}": level[c] for z, level in enumerate(levels) for c in COLUMNS}
+    arrays['meta'] = np.frombuffer(json.dumps(meta or {}).encode('utf-8'), dtype=np.uint8)
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def _load_levels(path):
+    """(levels, meta) from _save_levels, or (None, None) if unreadable"""
+    import numpy as np
+
+    try:
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+            zooms = sorted({int(k[1:].split('_', 1)[0]) for k in data.files if k != 'meta'})
+            levels = [{c: data[f"z{z}_{c}"] for c in COLUMNS} for z in zooms]
+    except (OSError, ValueError, KeyError):
+        return None, None
+    return levels, meta
+
+
+def product_hierarchy(network_files, digest=None):
+    """Cluster hierarchy of a product's networks, from the cache when unchanged"""
+    import numpy as np
+
+    digest = digest or product_digest(network_files)
+    path = _hierarchy_path(digest)
+    if map_cache.cache_enabled() and os.path.exists(path):
+        levels, _ = _load_levels(path)
+        if levels is not None:
+            return levels
+    nets = [network.load_network(p) for p in network_files]
+    levels = summarize(np.concatenate([n.lons for n in nets] or [np.zeros(0)]),
+                       np.concatenate([n.lats for n in nets] or [np.zeros(0)]))
+    if map_cache.cache_enabled():
+        _save_levels(path, levels)
+    return levels
+
+
+class ClusterIndex:
+    """
+    Gallery-wide cluster hierarchy, updated one product at a time.
+
+    products: product name -> digest of the hierarchy included for it
+    levels  : summed levels for zoom 0..MAX_CLUSTER_ZOOM
+    """
+
+    def __init__(self):
+        self.products = {}
+        self.levels = [_empty_level() for _ in range(MAX_CLUSTER_ZOOM + 1)]
+        self.changed = False
+
+    @classmethod
+    def load(cls, path=GALLERY_FILE):
+        """The stored index, or an empty one"""
+        index = cls()
+        if map_cache.cache_enabled() and os.path.exists(path):
+            levels, meta = _load_levels(path)
+            if levels is not None and meta.get('format') == CLUSTER_FORMAT \
+                    and len(levels) == MAX_CLUSTER_ZOOM + 1:
+                index.levels, index.products = levels, meta['products']
+        return index
+
+    def save(self, path=GALLERY_FILE):
+        if map_cache.cache_enabled() and self.changed:
+            _save_levels(path, self.levels, {'format': CLUSTER_FORMAT, 'products': self.products})
+        self.changed = False
+
+    @property
+    def digest(self):
+        """Identity of the current contents, for map cache keys"""
+        return hashlib.sha256(json.dumps(self.products, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def update(self, product, network_files):
+        """
+        Bring one product up to date; returns True if its hierarchy changed.
+        Only this product's old and new hierarchies are read.
+        """
+        digest = product_digest(network_files)
+        old = self.products.get(product)
+        if old == digest:
+            return False
+        subtract = []
+        if old is not None:
+            levels, _ = _load_levels(_hierarchy_path(old))
+            if levels is None:
+                raise StaleIndex(product)
+            subtract.append(levels)
+        self.levels = merge(self.levels, add=[product_hierarchy(network_files, digest)],
+                            subtract=subtract)
+        self.products[product] = digest
+        self.changed = True
+        return True
+
+    def remove(self, product):
+        """Drop a product that is no longer in the gallery"""
+        digest = self.products.pop(product, None)
+        if digest is None:
+            return False
+        levels, _ = _load_levels(_hierarchy_path(digest))
+        if levels is None:
+            raise StaleIndex(product)
+        self.levels = merge(self.levels, subtract=[levels])
+        self.changed = True
+        return True
+
+    def clusters(self, z):
+        """(lons, lats, counts, products) of the clusters at zoom z"""
+        level = self.levels[min(max(z, 0), MAX_CLUSTER_ZOOM)]
+        count = level['count']
+        x = level['sx'] / count / FIXED_POINT
+        y = level['sy'] / count / FIXED_POINT
+        lons, lats = _unproject(x, y)
+        return lons, lats, count, level['products']
+
+    @property
+    def total(self):
+        return int(self.levels[0]['count'].sum())
+
+
+class StaleIndex(Exception):
+    """A product's previous hierarchy is no longer cached, so it can't be subtracted"""
+
+
+def build_index(products):
+    """
+    Bring the stored gallery index up to date with products ({name: network
+    files}); returns (index, names of the products that changed)
+    """
+    index = ClusterIndex.load()
+    try:
+        changed = [name for name in sorted(products) if index.update(name, products[name])]
+        changed += [name for name in sorted(set(index.products) - set(products))
+                    if index.remove(name)]
+    except StaleIndex:
+        # Start over from the product hierarchies
+        index = ClusterIndex()
+        changed = [name for name in sorted(products) if index.update(name, products[name])]
+    index.save()
+    return index, changed
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Density aggregation of large point sets into hexagonal or square bins
+Dichteaggregation großer Punktmengen in Sechseck- oder Quadratzellen
+将大规模点集按六边形或方形网格进行密度聚合
+
+Past a few thousand retail points, one marker per location is neither
+readable nor fast. A density layer counts the points per bin with NumPy and
+draws the counts as a single artist: a PolyCollection of the non-empty
+hexagons ('hexbin') or one image of a regular lon/lat grid ('grid').
+
+The bin size follows from the map extent (BINS_ACROSS bins over its width),
+so the same style gives comparable maps at every scale. Point files are
+read in chunks of CHUNK_SIZE points and added to the bins chunk by chunk,
+so memory stays bounded by the chunk and the grid, not by the file:
+
+    CSV      header row with a lon/lng/longitude/x and a lat/latitude/y column
+    GeoJSON  FeatureCollection of Point or MultiPoint features, parsed one
+             feature at a time (also newline-delimited .geojsonl / .ndjson)
+
+NumPy and matplotlib are imported inside the functions (see lazy_deps.py).
+"""
+
+import csv
+import itertools
+import json
+import math
+import os
+
+# Bins over the width of the map extent
+BINS_ACROSS = 80
+
+# Points read from a file per chunk
+CHUNK_SIZE = 100_000
+
+LON_COLUMNS = ('lon', 'lng', 'long', 'longitude', 'x')
+LAT_COLUMNS = ('lat', 'latitude', 'y')
+
+# Bytes read at a time while streaming a GeoJSON file
+_READ_SIZE = 1 << 20
+
+
+def bin_size(extent, bins_across=BINS_ACROSS):
+    """Bin width in degrees for an extent [west, east, south, north]"""
+    west, east, _, _ = extent
+    return (east - west) / bins_across
+
+
+def _column(header, names, path):
+    lowered = [name.strip().lower() for name in header]
+    for name in names:
+        if name in lowered:
+            return lowered.index(name)
+    raise ValueError(f"{path}: no column named {' / '.join(names)} in the header")
+
+
+def _read_csv(path, chunk_size):
+    import numpy as np
+
+    with open(path, encoding='utf-8', newline='') as f:
+        first = f.readline()
+        dialect = csv.Sniffer().sniff(first, delimiters=',;\t')
+        header = next(csv.reader([first], dialect))
+        columns = (_column(header, LON_COLUMNS, path), _column(header, LAT_COLUMNS, path))
+        while True:
+            # islice hands loadtxt exactly chunk_size lines of the open file
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            block = np.loadtxt(lines, delimiter=dialect.delimiter, usecols=columns,
+                               quotechar='"', ndmin=2, dtype=float)
+            if len(block):
+                yield block[:, 0].copy(), block[:, 1].copy()
+
+
+def _feature_coords(feature):
+    """Point coordinates of one GeoJSON feature (Point or MultiPoint)"""
+    geometry = (feature or {}).get('geometry') or {}
+    kind = geometry.get('type')
+    if kind == 'Point':
+        return [geometry['coordinates'][:2]]
+    if kind == 'MultiPoint':
+        return [coords[:2] for coords in geometry['coordinates']]
+    return []
+
+
+def _iter_features(f):
+    """Features of a FeatureCollection, decoded one at a time from the stream"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    # Skip to the opening bracket of the features array
+    while True:
+        start = buffer.find('"features"')
+        bracket = buffer.find('[', start) if start >= 0 else -1
+        if bracket >= 0:
+            buffer = buffer[bracket + 1:]
+            break
+        chunk = f.read(_READ_SIZE)
+        if not chunk:
+            raise ValueError("GeoJSON file has no \"features\" array")
+        buffer += chunk
+
+    pos = 0
+    while True:
+        # Skip separators; ']' closes the array
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            feature, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            chunk = f.read(_READ_SIZE)
+            if not chunk:
+                raise
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield feature
+        pos = end
+
+
+def _iter_feature_lines(f):
+    """Features of newline-delimited GeoJSON, one per line"""
+    for line in f:
+        line = line.strip().lstrip('\x1e')  # RFC 8142 record separator
+        if line:
+            yield json.loads(line)
+
+
+def _read_geojson(path, chunk_size, lines=False):
+    import numpy as np
+
+    with open(path, encoding='utf-8') as f:
+        features = _iter_feature_lines(f) if lines else _iter_features(f)
+        coords = []
+        for feature in features:
+            coords.extend(_feature_coords(feature))
+            if len(coords) >= chunk_size:
+                block = np.asarray(coords, dtype=float)
+                coords = []
+                yield block[:, 0].copy(), block[:, 1].copy()
+        if coords:
+            block = np.asarray(coords, dtype=float)
+            yield block[:, 0].copy(), block[:, 1].copy()
+
+
+def read_points(path, chunk_size=CHUNK_SIZE):
+    """
+    Yield (lons, lats) float arrays of at most chunk_size points from a CSV
+    or GeoJSON point file, so files of any size can be aggregated.
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in ('.csv', '.tsv', '.txt'):
+        return _read_csv(path, chunk_size)
+    if suffix in ('.geojson', '.json'):
+        return _read_geojson(path, chunk_size)
+    if suffix in ('.geojsonl', '.geojsons', '.ndjson', '.jsonl'):
+        return _read_geojson(path, chunk_size, lines=True)
+    raise ValueError(f"Unsupported point file type: {path}")
+
+
+class SquareGrid:
+    """Point counts on a regular lon/lat grid over an extent"""
+
+    def __init__(self, extent, size):
+        import numpy as np
+
+        self.west, east, self.south, north = (float(v) for v in extent)
+        self.size = float(size)
+        self.nx = max(1, math.ceil((east - self.west) / self.size))
+        self.ny = max(1, math.ceil((north - self.south) / self.size))
+        self.counts = np.zeros((self.ny, self.nx), dtype=np.int64)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    @property
+    def peak(self):
+        return int(self.counts.max())
+
+    def add(self, lons, lats):
+        """Count points; points outside the grid are ignored"""
+        import numpy as np
+
+        ix = np.floor((np.asarray(lons, dtype=float) - self.west) / self.size)
+        iy = np.floor((np.asarray(lats, dtype=float) - self.south) / self.size)
+        inside = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+        cells = iy[inside].astype(np.int64) * self.nx + ix[inside].astype(np.int64)
+        self.counts += np.bincount(cells, minlength=self.nx * self.ny).reshape(self.ny, self.nx)
+
+    def draw(self, ax, transform=None, cmap='viridis', norm=None, **kwargs):
+        """Draw the non-empty cells as one image; returns the AxesImage"""
+        import numpy as np
+
+        extent = [self.west, self.west + self.nx * self.size,
+                  self.south, self.south + self.ny * self.size]
+        if transform is not None:
+            kwargs['transform'] = transform
+        image = np.ma.masked_equal(self.counts, 0)
+        # Keep the axes aspect: imshow would make it equal and move an overlay
+        return ax.imshow(image, extent=extent, origin='lower', interpolation='nearest',
+                         aspect=ax.get_aspect(), cmap=cmap, norm=norm, **kwargs)
+
+
+class HexGrid:
+    """
+    Point counts on a hexagonal grid over an extent (the two offset
+    rectangular lattices of matplotlib's hexbin), size being the hexagon
+    width in degrees
+    """
+
+    def __init__(self, extent, size):
+        import numpy as np
+
+        self.west, east, self.south, north = (float(v) for v in extent)
+        self.sx = float(size)
+        self.sy = self.sx * math.sqrt(3)  # regular hexagons on equal-aspect axes
+        self.nx = max(1, math.ceil((east - self.west) / self.sx))
+        self.ny = max(1, math.ceil((north - self.south) / self.sy))
+        self.counts1 = np.zeros((self.nx + 1) * (self.ny + 1), dtype=np.int64)
+        self.counts2 = np.zeros(self.nx * self.ny, dtype=np.int64)
+
+    @property
+    def total(self):
+        return int(self.counts1.sum() + self.counts2.sum())
+
+    @property
+    def peak(self):
+        return int(max(self.counts1.max(), self.counts2.max()))
+
+    def add(self, lons, lats):
+        """Count points; points outside the grid are ignored"""
+        import numpy as np
+
+        x = (np.asarray(lons, dtype=float) - self.west) / self.sx
+        y = (np.asarray(lats, dtype=float) - self.south) / self.sy
+        inside = (x >= 0) & (x <= self.nx) & (y >= 0) & (y <= self.ny)
+        x, y = x[inside], y[inside]
+
+        ix1, iy1 = np.round(x).astype(np.int64), np.round(y).astype(np.int64)
+        ix2, iy2 = np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+        d1 = (x - ix1) ** 2 + 3.0 * (y - iy1) ** 2
+        d2 = (x - ix2 - 0.5) ** 2 + 3.0 * (y - iy2 - 0.5) ** 2
+        # Nearest lattice; the second has no cells beyond the far edges
+        second = (d2 <= d1) & (ix2 < self.nx) & (iy2 < self.ny)
+        first = ~second
+
+        self.counts1 += np.bincount(ix1[first] * (self.ny + 1) + iy1[first],
+                                    minlength=self.counts1.size)
+        self.counts2 += np.bincount(ix2[second] * self.ny + iy2[second],
+                                    minlength=self.counts2.size)
+
+    def cells(self):
+        """(centers, counts) of the non-empty hexagons"""
+        import numpy as np
+
+        i1 = np.flatnonzero(self.counts1)
+        i2 = np.flatnonzero(self.counts2)
+        centers = np.concatenate([
+            np.column_stack([self.west + (i1 // (self.ny + 1)) * self.sx,
+                             self.south + (i1 % (self.ny + 1)) * self.sy]),
+            np.column_stack([self.west + (i2 // self.ny + 0.5) * self.sx,
+                             self.south + (i2 % self.ny + 0.5) * self.sy]),
+        ])
+        return centers, np.concatenate([self.counts1[i1], self.counts2[i2]])
+
+    def draw(self, ax, transform=None, cmap='viridis', norm=None, **kwargs):
+        """Draw the non-empty hexagons as one PolyCollection; returns it"""
+        import numpy as np
+        from matplotlib.collections import PolyCollection
+
+        centers, counts = self.cells()
+        hexagon = np.array([[0.5, -0.5], [0.5, 0.5], [0.0, 1.0],
+                            [-0.5, 0.5], [-0.5, -0.5], [0.0, -1.0]]) * [self.sx, self.sy / 3]
+        if transform is not None:
+            kwargs['transform'] = transform
+        kwargs.setdefault('linewidths', 0)  # edges would overlap and darken under alpha
+        collection = PolyCollection(centers[:, None, :] + hexagon[None, :, :],
+                                    array=counts, cmap=cmap, norm=norm, **kwargs)
+        ax.add_collection(collection, autolim=False)
+        return collection
+
+
+GRIDS = {'hexbin': HexGrid, 'grid': SquareGrid}
+
+
+def make_grid(mode, extent, size=None, bins_across=BINS_ACROSS):
+    """Empty HexGrid ('hexbin') or SquareGrid ('grid') over extent"""
+    if mode not in GRIDS:
+        raise ValueError(f"Unknown density mode '{mode}', expected one of {', '.join(GRIDS)}")
+    return GRIDS[mode](extent, size or bin_size(extent, bins_across))
+
+
+def aggregate_file(grid, path, chunk_size=CHUNK_SIZE):
+    """Add every point of a CSV/GeoJSON file to grid chunk by chunk; returns the count read"""
+    n_points = 0
+    for lons, lats in read_points(path, chunk_size):
+        grid.add(lons, lats)
+        n_points += len(lons)
+    return n_points
+
+
+def count_norm(grid, log=True):
+    """Color scale for the counts of a grid: logarithmic from 1, or linear"""
+    from matplotlib.colors import LogNorm, Normalize
+
+    if log:
+        return LogNorm(vmin=1, vmax=max(grid.peak, 2))
+    return Normalize(vmin=0, vmax=max(grid.peak, 1))
+
+
+def add_colorbar(ax, mappable, label, bounds=(0.62, 0.05, 0.34, 0.025), fontsize=8):
+    """
+    Horizontal colorbar inside the axes (bounds in axes fractions), so the
+    layout of the map is unchanged. Returns the colorbar axes.
+    """
+    cax = ax.inset_axes(bounds)
+    colorbar = ax.figure.colorbar(mappable, cax=cax, orientation='horizontal')
+    colorbar.set_label(label, fontsize=fontsize)
+    cax.tick_params(labelsize=fontsize)
+    cax.patch.set_alpha(0.9)
+    return cax
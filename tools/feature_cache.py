@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of cartopy Natural Earth features, pre-clipped per map extent
+Festplatten-Cache für cartopy-Natural-Earth-Features, pro Kartenausschnitt zugeschnitten
+按地图范围预裁剪的 cartopy Natural Earth 要素磁盘缓存
+
+cartopy loads the full Natural Earth geometries for every render and only
+then clips them to the visible extent. This module stores each feature
+already clipped to the extent and projected to the target projection as
+compressed WKB. A later render of the same extent, or of any extent
+contained in a cached one, loads only that small file.
+
+Entries live in <MAP_CACHE_DIR>/features/ next to the rendered maps.
+"""
+
+import hashlib
+import os
+
+import map_cache
+
+FEATURE_CACHE_DIR = os.path.join(map_cache.CACHE_DIR, 'features')
+
+# Clipped geometries already loaded in this process, keyed like the files
+_loaded = {}
+
+
+def _feature_id(feature, extent):
+    """'category-name-scale' for a Natural Earth feature at the given extent"""
+    scaler = getattr(feature, 'scaler', None)
+    scale = scaler.scale_from_extent(extent) if scaler is not None else feature.scale
+    return f"{feature.category}-{feature.name}-{scale}", feature.with_scale(scale)
+
+
+def _projection_id(projection):
+    """Short stable id of a cartopy projection"""
+    return hashlib.sha256(projection.proj4_init.encode('utf-8')).hexdigest()[:16]
+
+
+def _entry_dir(feature_id, projection):
+    versions = map_cache.library_versions()
+    version_id = f"cartopy{versions['cartopy']}-shapely{versions['shapely']}"
+    return os.path.join(FEATURE_CACHE_DIR, version_id, feature_id, _projection_id(projection))
+
+
+def _extent_name(extent):
+    return '_'.join(f"{value:g}" for value in extent) + '.npz'
+
+
+def _parse_extent(filename):
+    try:
+        return [float(value) for value in filename[:-len('.npz')].split('_')]
+    except ValueError:
+        return None
+
+
+def _contains(outer, inner):
+    """Whether extent outer = [west, east, south, north] contains inner"""
+    return (outer[0] <= inner[0] and outer[1] >= inner[1]
+            and outer[2] <= inner[2] and outer[3] >= inner[3])
+
+
+def _find_entry(entry_dir, extent):
+    """Path of the smallest cached extent containing extent, or None"""
+    if not os.path.isdir(entry_dir):
+        return None
+    best = None
+    for filename in os.listdir(entry_dir):
+        if not filename.endswith('.npz'):
+            continue
+        cached = _parse_extent(filename)
+        if cached is None or len(cached) != 4 or not _contains(cached, extent):
+            continue
+        area = (cached[1] - cached[0]) * (cached[3] - cached[2])
+        if best is None or area < best[0]:
+            best = (area, os.path.join(entry_dir, filename))
+    return best[1] if best else None
+
+
+def _projected_box(extent, projection):
+    """Bounding box of a lon/lat extent in the projection's coordinates"""
+    import numpy as np
+    import shapely
+    from cartopy import crs as ccrs
+
+    west, east, south, north = extent
+    lons = np.array([west, east, east, west, (west + east) / 2, (west + east) / 2])
+    lats = np.array([south, south, north, north, south, north])
+    points = projection.transform_points(ccrs.PlateCarree(), lons, lats)
+    return shapely.box(points[:, 0].min(), points[:, 1].min(),
+                       points[:, 0].max(), points[:, 1].max())
+
+
+def _clip_and_project(feature, extent, projection):
+    """Clip a feature's geometries to extent and project them"""
+    import shapely
+
+    box = shapely.box(extent[0], extent[2], extent[1], extent[3])
+    target_box = _projected_box(extent, projection)
+    geoms = []
+    for geom in feature.intersecting_geometries(extent):
+        clipped = geom.intersection(box)
+        if clipped.is_empty:
+            continue
+        if projection != feature.crs:
+            clipped = projection.project_geometry(clipped, feature.crs)
+        clipped = clipped.intersection(target_box)
+        if not clipped.is_empty:
+            geoms.append(clipped)
+    return geoms
+
+
+def _save(path, geoms):
+    """Write geometries as zlib-compressed WKB (offsets + one byte blob)"""
+    import numpy as np
+    import shapely
+
+    blobs = shapely.to_wkb(geoms) if geoms else []
+    offsets = np.cumsum([0] + [len(b) for b in blobs], dtype=np.int64)
+    data = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp, offsets=offsets, wkb=data)
+    os.replace(tmp, path)
+
+
+def _load(path):
+    import numpy as np
+    import shapely
+
+    with np.load(path) as entry:
+        offsets = entry['offsets']
+        data = entry['wkb'].tobytes()
+    blobs = [data[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    return list(shapely.from_wkb(blobs)) if blobs else []
+
+
+def clipped_geometries(feature, extent, projection):
+    """
+    Geometries of a Natural Earth feature clipped to extent in projection.
+
+    extent is [west, east, south, north] in degrees. Looks in memory first,
+    then for a cached file of the same or a containing extent, and only
+    falls back to loading the full feature from cartopy on a miss.
+    """
+    extent = [float(value) for value in extent]
+    feature_id, scaled = _feature_id(feature, extent)
+    entry_dir = _entry_dir(feature_id, projection)
+    exact = os.path.join(entry_dir, _extent_name(extent))
+
+    if exact in _loaded:
+        return _loaded[exact]
+
+    source = _find_entry(entry_dir, extent)
+    if source == exact:
+        geoms = _load(exact)
+    elif source is not None:
+        # Cut the requested extent out of a larger cached one
+        target_box = _projected_box(extent, projection)
+        geoms = [g.intersection(target_box) for g in _load(source)]
+        geoms = [g for g in geoms if not g.is_empty]
+        _save(exact, geoms)
+    else:
+        geoms = _clip_and_project(scaled, extent, projection)
+        _save(exact, geoms)
+
+    _loaded[exact] = geoms
+    return geoms
+
+
+def add_features(ax, features, extent):
+    """
+    Add Natural Earth features to a GeoAxes from the clipped-geometry cache.
+
+    features is a list of (feature, style) pairs, e.g.
+    [(cfeature.COASTLINE, {'linewidth': 0.5})]; style overrides the
+    feature's own defaults just like ax.add_feature(feature, **style).
+    """
+    projection = ax.projection
+    for feature, style in features:
+        geoms = clipped_geometries(feature, extent, projection)
+        ax.add_geometries(geoms, crs=projection, **dict(feature.kwargs, **style))
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+CJK font resolution for the trilingual map labels, cached per environment
+CJK-Schriftauswahl für die dreisprachigen Kartenbeschriftungen, je Umgebung gespeichert
+为三语地图标注解析 CJK 字体，并按环境缓存
+
+Titles, axis labels and legends carry Chinese text ("经度", "图例"). The
+default DejaVu Sans has no CJK glyphs, so without help matplotlib draws
+empty boxes and warns once per missing glyph. This module finds a CJK font
+once per environment, in the order fritz-kola.tex tries them (CJK_FONTS),
+and records the choice in <MAP_CACHE_DIR>/fonts.json. Later processes read
+that record and register the one font file with matplotlib directly: no
+font directory scan, no font manager rebuild, no fallback search.
+
+The search only opens files whose names look like a candidate
+(FONT_FILE_PATTERNS) in the usual system, user and TeX Live font
+directories, and accepts the first that has glyphs for SAMPLE_TEXT. The
+record is searched again when one of those directories changes or the
+recorded file disappears. Set MAP_CJK_FONT to a font file or family name to
+choose one yourself.
+
+Latin text keeps DejaVu Sans; the CJK font is its per-glyph fallback
+(matplotlib 3.6 and later). For PDF output a TrueType CJK font is embedded
+as a Type 42 subset of the glyphs used, so the text stays searchable and each
+glyph is stored once; MAP_FONT_SUBSET=0 keeps matplotlib's Type 3 fonts.
+"""
+
+import glob
+import json
+import os
+from functools import lru_cache
+
+import instrument
+import map_cache
+
+FONT_CACHE_FILE = os.path.join(map_cache.CACHE_DIR, 'fonts.json')
+
+# Bump when the record layout changes
+RECORD_FORMAT = 1
+
+# CJK families in order of preference, as in the \setCJKmainfont fallbacks
+# of the product documents, then other common ones
+CJK_FONTS = (
+    'Noto Sans CJK SC', 'FandolSong', 'SimSun', 'STSong', 'AR PL UMing CN',
+    'Source Han Sans SC', 'Noto Serif CJK SC', 'WenQuanYi Zen Hei',
+    'Microsoft YaHei', 'PingFang SC', 'Hiragino Sans GB',
+)
+
+# File name patterns of those families (lower case)
+FONT_FILE_PATTERNS = (
+    'notosanscjk*', 'notosanssc*', 'fandolsong*', 'simsun*', 'stsong*', 'uming*',
+    'sourcehansans*', 'notoserifcjk*', 'wqy-zenhei*', 'msyh*', 'pingfang*', 'hiragino sans gb*',
+)
+
+FONT_EXTENSIONS = ('.ttf', '.ttc', '.otf', '.otc')
+
+# Directories searched for font files; globs are expanded
+FONT_DIRS = (
+    '/usr/share/fonts', '/usr/local/share/fonts', '~/.local/share/fonts', '~/.fonts',
+    '/usr/share/texlive/texmf-dist/fonts/opentype/public/fandol',
+    '/usr/share/texmf/fonts/opentype/public/fandol',
+    '/usr/local/texlive/*/texmf-dist/fonts/opentype/public/fandol',
+    '/Library/Fonts', '/System/Library/Fonts', '~/Library/Fonts',
+    '/Library/TeX/Root/texmf-dist/fonts/opentype/public/fandol',
+    os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'),
+    os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft', 'Windows', 'Fonts'),
+)
+
+# Characters a font must have to be accepted (from the map labels)
+SAMPLE_TEXT = '经度纬度图例供应链地图制造商'
+
+# Latin text keeps the look of the existing maps
+LATIN_FONT = 'DejaVu Sans'
+
+
+def font_dirs():
+    """Existing font directories, globs expanded"""
+    dirs = []
+    for pattern in FONT_DIRS:
+        for path in sorted(glob.glob(os.path.expanduser(pattern))):
+            if os.path.isdir(path) and path not in dirs:
+                dirs.append(path)
+    return dirs
+
+
+def _dir_stamps(depth=2):
+    """
+    Modification times of the font directories and their subdirectories
+    down to depth, which change when a font package is installed or removed
+    """
+    stamps = {}
+    level = font_dirs()
+    for _ in range(depth + 1):
+        below = []
+        for path in level:
+            stamps[path] = os.stat(path).st_mtime_ns
+            with os.scandir(path) as entries:
+                below += [e.path for e in entries if e.is_dir()]
+        level = below
+    return stamps
+
+
+def _environment():
+    """What a recorded choice depends on: the candidates and the font directories"""
+    return {
+        'format': RECORD_FORMAT,
+        'candidates': list(CJK_FONTS),
+        'override': os.environ.get('MAP_CJK_FONT'),
+        'dirs': _dir_stamps(),
+    }
+
+
+def _candidate_files():
+    """Font files named like a candidate, in CJK_FONTS preference order"""
+    import fnmatch
+
+    found = []
+    for root_dir in font_dirs():
+        for root, _, files in os.walk(root_dir):
+            for name in files:
+                lower = name.lower()
+                if not lower.endswith(FONT_EXTENSIONS):
+                    continue
+                for rank, pattern in enumerate(FONT_FILE_PATTERNS):
+                    if fnmatch.fnmatch(lower, pattern):
+                        # Regular weights before bold or light ones
+                        regular = 0 if 'regular' in lower or '-' not in lower else 1
+                        found.append((rank, regular, os.path.join(root, name)))
+                        break
+    return [path for _, _, path in sorted(found)]
+
+
+def _inspect(path):
+    """(family, has all SAMPLE_TEXT glyphs, TrueType outlines) of a font file"""
+    from matplotlib import ft2font
+
+    font = ft2font.FT2Font(path)
+    covered = all(font.get_char_index(ord(c)) for c in SAMPLE_TEXT)
+    truetype = False
+    if path.lower().endswith(('.ttf', '.otf')):
+        try:
+            from fontTools.ttLib import TTFont
+            truetype = 'glyf' in TTFont(path, lazy=True)
+        except Exception:
+            truetype = False
+    return font.family_name, covered, truetype
+
+
+def _record(path, family, truetype):
+    stat = os.stat(path)
+    return {'path': path, 'family': family, 'truetype': truetype,
+            'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _override(value):
+    """Record for MAP_CJK_FONT: a font file, or a family among the candidate files"""
+    paths = [value] if os.path.isfile(value) else _candidate_files()
+    for path in paths:
+        try:
+            family, covered, truetype = _inspect(path)
+        except (OSError, RuntimeError):
+            continue
+        if path == value or family.lower() == value.lower():
+            if not covered:
+                print(f"Warning: MAP_CJK_FONT font {family} lacks some Chinese glyphs")
+            return _record(path, family, truetype)
+    print(f"Warning: MAP_CJK_FONT '{value}' not found, searching the default fonts")
+    return None
+
+
+def _search():
+    """Record of the first candidate file covering SAMPLE_TEXT, or None"""
+    for path in _candidate_files():
+        try:
+            family, covered, truetype = _inspect(path)
+        except (OSError, RuntimeError):
+            continue  # unreadable or not a font
+        if covered:
+            return _record(path, family, truetype)
+    return None
+
+
+def _valid(font):
+    """Whether a recorded font file is still the one recorded"""
+    if font is None:
+        return True
+    try:
+        stat = os.stat(font['path'])
+    except OSError:
+        return False
+    return stat.st_size == font['size'] and stat.st_mtime_ns == font['mtime_ns']
+
+
+def _write_record(record):
+    os.makedirs(os.path.dirname(FONT_CACHE_FILE), exist_ok=True)
+    tmp = f"{FONT_CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=1, ensure_ascii=False)
+    os.replace(tmp, FONT_CACHE_FILE)
+
+
+@lru_cache(maxsize=None)
+def resolve():
+    """
+    The CJK font of this environment as a dict (path, family, truetype,
+    size, mtime_ns), or None if there is none; searched at most once per
+    environment and read from FONT_CACHE_FILE after that
+    """
+    environment = _environment()
+    if map_cache.cache_enabled() and os.path.exists(FONT_CACHE_FILE):
+        try:
+            with open(FONT_CACHE_FILE, encoding='utf-8') as f:
+                record = json.load(f)
+            if record.get('environment') == environment and _valid(record.get('font')):
+                return record.get('font')
+        except (OSError, ValueError):
+            pass
+
+    with instrument.stage('font_search'):
+        override = os.environ.get('MAP_CJK_FONT')
+        font = (_override(override) if override else None) or _search()
+    if font:
+        print(f"✓ CJK font: {font['family']} ({font['path']})")
+    else:
+        print("Warning: no CJK font found, Chinese text is drawn as boxes. "
+              "Install Noto Sans CJK (e.g. fonts-noto-cjk) or set MAP_CJK_FONT.")
+    if map_cache.cache_enabled():
+        _write_record({'environment': environment, 'font': font})
+    return font
+
+
+def subset_enabled():
+    """Whether PDF output embeds a Type 42 glyph subset (MAP_FONT_SUBSET, default on)"""
+    return os.environ.get('MAP_FONT_SUBSET', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+def fingerprint():
+    """Font identity as part of map cache keys: a different font, different pixels"""
+    font = resolve()
+    return {
+        'family': font['family'] if font else None,
+        'size': font['size'] if font else None,
+        'subset': subset_enabled(),
+    }
+
+
+@lru_cache(maxsize=None)
+def configure():
+    """
+    Register the CJK font with matplotlib and make it the fallback of the
+    Latin font; returns its family name, or None. Runs once per process.
+    """
+    import warnings
+
+    import matplotlib
+    from matplotlib import font_manager
+
+    font = resolve()
+    if font is None:
+        # Boxes are expected then, the warning was printed once above
+        warnings.filterwarnings('ignore', message=r'Glyph \d+ .*missing from')
+        return None
+    font_manager.fontManager.addfont(font['path'])
+    matplotlib.rcParams['font.family'] = [LATIN_FONT, font['family']]
+    return font['family']
+
+
+def has_cjk():
+    """Whether Chinese text can be drawn in this environment"""
+    return resolve() is not None
+
+
+def vector_rc():
+    """matplotlib rc settings for saving PDF and SVG maps with the CJK font"""
+    font = resolve()
+    if font and font['truetype'] and subset_enabled():
+        return {'pdf.fonttype': 42}
+    return {}
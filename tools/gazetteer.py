@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Offline gazetteer: place names to coordinates without a network service
+Offline-Ortsverzeichnis: Ortsnamen zu Koordinaten ohne Netzwerkdienst
+离线地名库：无需网络服务将地名解析为坐标
+
+Network files may name a place instead of typing its coordinates:
+
+    {"id": "munich", "type": "distribution", "place": "München", "size": 150}
+
+Places come from data/gazetteer.tsv (name, country, lon, lat, population in
+thousands, aliases separated by |). Every name and alias is normalized
+(case-folded, diacritics removed, so "Zürich", "zurich" and "ZURICH" are the
+same key) and stored as a sorted array of keys with the row of its place.
+Exact lookup is a binary search (np.searchsorted), prefix lookup the range
+between the prefix and the prefix followed by the largest code point.
+Where a key belongs to several places the most populous comes first; a
+trailing country code picks another one: "Frankfurt, DE" or "Frankfurt (Oder)".
+
+The index is built once per gazetteer version into
+<MAP_CACHE_DIR>/gazetteer/ as plain .npy files and memory-mapped on load,
+so a build only reads the pages it searches. resolve() looks up all names of
+a network in one vectorized pass and remembers them for the process.
+"""
+
+import hashlib
+import os
+import unicodedata
+from collections import namedtuple
+
+import map_cache
+
+GAZETTEER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.tsv')
+GAZETTEER_CACHE_DIR = os.path.join(map_cache.CACHE_DIR, 'gazetteer')
+
+# Bump when the index layout changes
+INDEX_FORMAT = 1
+
+INDEX_ARRAYS = ('keys', 'rows', 'names', 'countries', 'lons', 'lats', 'population')
+
+Place = namedtuple('Place', 'name country lon lat population')
+
+# Loaded gazetteers by file digest, and resolved names by (digest, name)
+_gazetteers = {}
+_resolved = {}
+
+
+def normalize(name):
+    """Lookup key of a name: NFKD without combining marks, case-folded, single spaces"""
+    decomposed = unicodedata.normalize('NFKD', str(name))
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+
+def _split_country(name):
+    """'Frankfurt, DE' -> ('Frankfurt', 'DE'); names without a code -> (name, None)"""
+    head, sep, tail = str(name).rpartition(',')
+    tail = tail.strip()
+    if sep and len(tail) == 2 and tail.isalpha() and tail.isascii():
+        return head.strip(), tail.upper()
+    return str(name), None
+
+
+def _read_tsv(path):
+    """Rows of the gazetteer file as (name, country, lon, lat, population, aliases)"""
+    rows = []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            if len(fields) < 5:
+                raise ValueError(f"{path}:{number}: expected at least 5 tab-separated fields")
+            name, country, lon, lat, population = fields[:5]
+            aliases = [a for a in fields[5].split('|') if a] if len(fields) > 5 else []
+            rows.append((name, country.upper(), float(lon), float(lat), float(population), aliases))
+    return rows
+
+
+def _build_index(path):
+    """Sorted key array and place columns for a gazetteer file"""
+    import numpy as np
+
+    rows = _read_tsv(path)
+    keys, key_rows = [], []
+    for row, (name, _, _, _, _, aliases) in enumerate(rows):
+        for key in dict.fromkeys(normalize(n) for n in [name] + aliases):
+            keys.append(key)
+            key_rows.append(row)
+    population = np.array([r[4] for r in rows], dtype=float)
+    keys = np.array(keys, dtype=str)
+    key_rows = np.array(key_rows, dtype=np.int32)
+    # By key, and the most populous place first among equal keys
+    order = np.lexsort((-population[key_rows], keys))
+    return {
+        'keys': keys[order],
+        'rows': key_rows[order],
+        'names': np.array([r[0] for r in rows], dtype=str),
+        'countries': np.array([r[1] for r in rows], dtype=str),
+        'lons': np.array([r[2] for r in rows], dtype=float),
+        'lats': np.array([r[3] for r in rows], dtype=float),
+        'population': population,
+    }
+
+
+class Gazetteer:
+    """
+    Sorted, memory-mappable index of a gazetteer file.
+
+    keys      : sorted str array of normalized names and aliases
+    rows      : int32 array, the place row of each key
+    names, countries, lons, lats, population: one entry per place
+    """
+
+    def __init__(self, arrays, digest):
+        for name in INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.names)
+
+    def place(self, row):
+        return Place(str(self.names[row]), str(self.countries[row]), float(self.lons[row]),
+                     float(self.lats[row]), float(self.population[row]))
+
+    def _candidates(self, key):
+        """Place rows whose name or alias equals key, most populous first"""
+        import numpy as np
+
+        lo = int(np.searchsorted(self.keys, key, 'left'))
+        hi = int(np.searchsorted(self.keys, key, 'right'))
+        return [int(row) for row in self.rows[lo:hi]]
+
+    def lookup(self, name):
+        """Place for a name or alias ('Name, CC' picks a country), or None"""
+        name, country = _split_country(name)
+        for row in self._candidates(normalize(name)):
+            if country is None or self.countries[row] == country:
+                return self.place(row)
+        return None
+
+    def prefix(self, text, limit=10):
+        """Places with a name or alias starting with text, most populous first"""
+        import numpy as np
+
+        key = normalize(text)
+        lo = int(np.searchsorted(self.keys, key, 'left'))
+        hi = int(np.searchsorted(self.keys, key + '\U0010ffff', 'left'))
+        rows = np.unique(self.rows[lo:hi])
+        rows = rows[np.argsort(-self.population[rows], kind='stable')]
+        return [self.place(int(row)) for row in rows[:limit]]
+
+    def resolve(self, names):
+        """
+        Coordinates of many names at once: (lons, lats) float arrays.
+
+        Distinct names are looked up in one vectorized binary search;
+        unknown names raise a ValueError listing them with suggestions.
+        """
+        import numpy as np
+
+        names = [str(n) for n in names]
+        unique = list(dict.fromkeys(names))
+        rows = {}
+        pending = []
+        for name in unique:
+            row = _resolved.get((self.digest, name))
+            if row is None:
+                pending.append(name)
+            else:
+                rows[name] = row
+
+        if pending:
+            split = [_split_country(name) for name in pending]
+            keys = np.array([normalize(base) for base, _ in split], dtype=str)
+            lo = np.searchsorted(self.keys, keys, 'left')
+            found = (lo < len(self.keys)) & (self.keys[np.minimum(lo, len(self.keys) - 1)] == keys)
+            unknown = []
+            for i, (name, (_, country)) in enumerate(zip(pending, split)):
+                row = None
+                if found[i] and country is None:
+                    row = int(self.rows[lo[i]])
+                elif found[i]:
+                    row = next((r for r in self._candidates(keys[i])
+                                if self.countries[r] == country), None)
+                if row is None:
+                    unknown.append(name)
+                else:
+                    rows[name] = _resolved[(self.digest, name)] = row
+            if unknown:
+                raise ValueError("Unknown places: " + '; '.join(
+                    f"{name!r}" + _suggestion(self, name) for name in unknown[:20]))
+
+        index = np.array([rows[name] for name in names], dtype=np.intp)
+        return self.lons[index].copy(), self.lats[index].copy()
+
+
+def _suggestion(gazetteer, name):
+    base, _ = _split_country(name)
+    matches = gazetteer.prefix(base[:3], limit=3) if base.strip() else []
+    return f" (did you mean {', '.join(p.name for p in matches)}?)" if matches else ''
+
+
+def load(path=GAZETTEER_FILE):
+    """Gazetteer for a file, from memory, the index cache or built from the file"""
+    import numpy as np
+
+    file_digest = map_cache.file_digest(os.path.abspath(path))
+    if file_digest in _gazetteers:
+        return _gazetteers[file_digest]
+
+    digest = hashlib.sha256(f"{INDEX_FORMAT}:{file_digest}".encode('utf-8')).hexdigest()
+    index_dir = os.path.join(GAZETTEER_CACHE_DIR, digest[:16])
+    if map_cache.cache_enabled() and os.path.exists(os.path.join(index_dir, 'complete')):
+        arrays = {name: np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r')
+                  for name in INDEX_ARRAYS}
+    else:
+        arrays = _build_index(path)
+        if map_cache.cache_enabled():
+            _save_index(index_dir, arrays)
+
+    gazetteer = Gazetteer(arrays, file_digest)
+    _gazetteers[file_digest] = gazetteer
+    return gazetteer
+
+
+def _save_index(index_dir, arrays):
+    """Write the index arrays as .npy files; 'complete' marks a finished write"""
+    import numpy as np
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name, array in arrays.items():
+        tmp = os.path.join(index_dir, f"{name}.{os.getpid()}.tmp.npy")
+        np.save(tmp, array)
+        os.replace(tmp, os.path.join(index_dir, name + '.npy'))
+    with open(os.path.join(index_dir, 'complete'), 'w', encoding='utf-8') as f:
+        f.write('')
+
+
+def lookup(name):
+    """Place for a name in the bundled gazetteer, or None"""
+    return load().lookup(name)
+
+
+def resolve(names):
+    """(lons, lats) of many names in the bundled gazetteer"""
+    return load().resolve(names)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Great-circle route geometry for supply-chain maps
+Großkreis-Routengeometrie für Lieferkettenkarten
+供应链地图的大圆航线几何
+
+Straight two-point segments in lon/lat space are wrong at continental scale
+and cannot be reprojected accurately. great_circle_paths() densifies every
+edge along its great circle in one vectorized NumPy pass, with the number of
+points adapted to the edge length. Paths are memoized by endpoint pair, so a
+leg shared by several maps (e.g. Hamburg -> Munich) is computed once; the
+memo keeps the MAX_CACHED_PATHS most recently used paths.
+"""
+
+from collections import OrderedDict
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Endpoints are rounded to this many decimals (~1 cm) for the memo key
+KEY_DECIMALS = 7
+
+# Paths kept in memory; the least recently used are dropped beyond this
+MAX_CACHED_PATHS = 10000
+
+# (lon1, lat1, lon2, lat2, step) -> (n, 2) array of lon/lat vertices, oldest first
+_path_cache = OrderedDict()
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """Great-circle distance in km; arguments broadcast like NumPy arrays"""
+    import numpy as np
+
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=float))
+                              for v in (lon1, lat1, lon2, lat2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _unit_vectors(lons, lats):
+    import numpy as np
+
+    lon, lat = np.radians(lons), np.radians(lats)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _densify(start_lons, start_lats, end_lons, end_lats, step_deg, max_points):
+    """Vectorized slerp between all endpoint pairs; returns a list of arrays"""
+    import numpy as np
+
+    a = _unit_vectors(start_lons, start_lats)
+    b = _unit_vectors(end_lons, end_lats)
+    omega = np.arccos(np.clip(np.einsum('ij,ij->i', a, b), -1.0, 1.0))
+
+    # Points per edge grow with the arc length, at least the two endpoints
+    counts = np.clip(np.ceil(np.degrees(omega) / step_deg).astype(int) + 1, 2, max_points)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    edge = np.repeat(np.arange(len(counts)), counts)
+    t = (np.arange(offsets[-1]) - offsets[edge]) / (counts[edge] - 1)
+
+    w = omega[edge]
+    sin_w = np.sin(w)
+    short = sin_w < 1e-12  # coincident endpoints: fall back to linear weights
+    safe = np.where(short, 1.0, sin_w)
+    wa = np.where(short, 1.0 - t, np.sin((1.0 - t) * w) / safe)
+    wb = np.where(short, t, np.sin(t * w) / safe)
+    xyz = wa[:, None] * a[edge] + wb[:, None] * b[edge]
+
+    lons = np.degrees(np.arctan2(xyz[:, 1], xyz[:, 0]))
+    lats = np.degrees(np.arctan2(xyz[:, 2], np.hypot(xyz[:, 0], xyz[:, 1])))
+
+    # Unwrap longitudes within each path so antimeridian crossings stay continuous
+    jumps = np.zeros_like(lons)
+    jumps[1:] = np.diff(lons)
+    jumps[offsets[:-1]] = 0.0
+    correction = np.cumsum(-360.0 * np.round(jumps / 360.0))
+    correction -= np.repeat(correction[offsets[:-1]], counts)
+    lons = lons + correction
+
+    # Start at the exact input longitude (e.g. 190 rather than -170)
+    lons += np.repeat(np.asarray(start_lons, dtype=float) - lons[offsets[:-1]], counts)
+
+    coords = np.column_stack([lons, lats])
+    return np.split(coords, offsets[1:-1])
+
+
+def _cached(key):
+    path = _path_cache.get(key)
+    if path is not None:
+        _path_cache.move_to_end(key)
+    return path
+
+
+def _remember(key, path):
+    _path_cache[key] = path
+    _path_cache.move_to_end(key)
+    while len(_path_cache) > MAX_CACHED_PATHS:
+        _path_cache.popitem(last=False)
+
+
+def great_circle_paths(start_lons, start_lats, end_lons, end_lats,
+                       step_deg=0.5, max_points=1024):
+    """
+    Densified great-circle paths for all edges.
+
+    Returns a list with one (n_i, 2) lon/lat array per edge, where n_i grows
+    with the edge's arc length (one vertex per step_deg of arc, at most
+    max_points). Results are memoized by endpoint pair; a reversed pair
+    reuses the stored path.
+    """
+    import numpy as np
+
+    coords = np.round(np.column_stack([start_lons, start_lats, end_lons, end_lats])
+                      .astype(float), KEY_DECIMALS)
+    keys = [tuple(row) + (step_deg,) for row in coords.tolist()]
+
+    paths = [None] * len(keys)
+    missing = []
+    for i, key in enumerate(keys):
+        path = _cached(key)
+        if path is None:
+            reverse = _cached((key[2], key[3], key[0], key[1], step_deg))
+            if reverse is not None:
+                # Same start longitude as a computed path (-170, not 190)
+                path = reverse[::-1].copy()
+                path[:, 0] += key[0] - path[0, 0]
+        if path is None:
+            missing.append(i)
+        else:
+            paths[i] = path
+
+    if missing:
+        # Each distinct pair is densified once, however many edges share it
+        rows, inverse = np.unique(coords[missing], axis=0, return_inverse=True)
+        computed = _densify(rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3], step_deg, max_points)
+        for i, j in zip(missing, inverse.ravel()):
+            paths[i] = computed[j]
+            _remember(keys[i], paths[i])
+    return paths
+
+
+def clear_cache():
+    """Drop all memoized paths"""
+    _path_cache.clear()
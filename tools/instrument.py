@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage timing and memory instrumentation of the map pipeline
+Zeit- und Speichermessung pro Stufe der Karten-Pipeline
+地图流水线各阶段的耗时与内存测量
+
+Wrap a pipeline stage in `with instrument.stage('rasterize'):` to record its
+wall time and peak resident memory. Nothing is measured unless MAP_PROFILE
+is set (or `tools/build_maps.py --profile`):
+
+    MAP_PROFILE=1            JSON lines on stderr
+    MAP_PROFILE=<path>       JSON lines appended to <path>
+
+Each record looks like
+
+    {"stage": "rasterize", "map": "fritz-kola-supply-chain-map.png",
+     "seconds": 0.412, "peak_rss_mb": 512.3, "rss_mb": 498.1,
+     "peak_scope": "stage", "pid": 4242, "time": 1760000000.0}
+
+Fields passed to an outer stage (such as "map") are inherited by the stages
+nested in it. On Linux the peak is the high-water mark of the stage itself
+(reset through /proc/self/clear_refs); elsewhere it falls back to the peak
+of the whole process so far and "peak_scope" says "process".
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Open stages of this process, innermost last
+_stack = []
+
+
+def enabled():
+    """Whether MAP_PROFILE asks for instrumentation"""
+    return os.environ.get('MAP_PROFILE', '').lower() not in ('', '0', 'false', 'no', 'off')
+
+
+def _status_kb(field):
+    """A memory field (VmRSS, VmHWM) of /proc/self/status in kB, or None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak():
+    """Reset the kernel's RSS high-water mark; False if not supported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _process_peak_kb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform == 'darwin' else peak  # bytes on macOS
+
+
+def _emit(record):
+    line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+    target = os.environ.get('MAP_PROFILE', '1')
+    if target.lower() in ('1', 'true', 'yes', 'on'):
+        sys.stderr.write(line)
+        sys.stderr.flush()
+        return
+    # One write per record in append mode, so parallel workers do not interleave
+    fd = os.open(target, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def stage(name, **fields):
+    """Measure the enclosed block as pipeline stage name when enabled"""
+    if not enabled():
+        yield
+        return
+
+    # Fold the parent's peak so far into it before the counter is reset
+    if _stack:
+        parent = _stack[-1]
+        parent['child_peak'] = max(parent['child_peak'], _status_kb('VmHWM') or 0)
+    context = dict(_stack[-1]['fields']) if _stack else {}
+    context.update(fields)
+    frame = {'fields': context, 'child_peak': 0, 'per_stage': _reset_peak()}
+    _stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _stack.pop()
+        if frame['per_stage']:
+            peak_kb = max(_status_kb('VmHWM') or 0, frame['child_peak'])
+        else:
+            peak_kb = _process_peak_kb()
+        if _stack:
+            _stack[-1]['child_peak'] = max(_stack[-1]['child_peak'], peak_kb)
+        rss_kb = _status_kb('VmRSS')
+        record = {'stage': name}
+        record.update(context)
+        record.update({
+            'seconds': round(seconds, 6),
+            'peak_rss_mb': round(peak_kb / 1024, 1),
+            'rss_mb': round(rss_kb / 1024, 1) if rss_kb is not None else None,
+            'peak_scope': 'stage' if frame['per_stage'] else 'process',
+            'pid': os.getpid(),
+            'time': round(time.time(), 3),
+        })
+        _emit(record)
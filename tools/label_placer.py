@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Automatic, collision-free label placement
+Automatische, überlappungsfreie Beschriftung
+自动无重叠标注布局
+
+Replaces hand-tuned per-location label offsets. Labels are placed in
+priority order (largest marker first). For each label a few candidate
+positions around its point are tried; a candidate is accepted if its
+bounding box does not hit an already placed label or a marker. Placed boxes
+are kept in a uniform grid spatial index, so each test only looks at the
+boxes in the cells it covers and the whole layout runs in about O(n log n)
+(the sort) instead of comparing all pairs. Labels that fit nowhere near
+their point are moved further out with a leader line, or dropped.
+
+All geometry is done in display pixels; the drawn annotations use offsets
+in points so they survive savefig at another dpi.
+"""
+
+from collections import defaultdict
+
+# Candidate directions, preferred first: NE, NW, SE, SW, E, W, N, S
+DIRECTIONS = (
+    (1, 1), (-1, 1), (1, -1), (-1, -1),
+    (1, 0), (-1, 0), (0, 1), (0, -1),
+)
+
+# Distance multipliers: first ring next to the marker, then leader-line rings
+RINGS = (1.0,)
+LEADER_RINGS = (2.5, 4.0)
+
+
+class GridIndex:
+    """Uniform grid over axis-aligned boxes (x0, y0, x1, y1) for overlap queries"""
+
+    def __init__(self, cell_size):
+        self.cell_size = max(float(cell_size), 1.0)
+        self.cells = defaultdict(list)
+        self.boxes = []
+
+    def _cells(self, box):
+        size = self.cell_size
+        x0, y0, x1, y1 = box
+        for cx in range(int(x0 // size), int(x1 // size) + 1):
+            for cy in range(int(y0 // size), int(y1 // size) + 1):
+                yield cx, cy
+
+    def insert(self, box):
+        index = len(self.boxes)
+        self.boxes.append(box)
+        for cell in self._cells(box):
+            self.cells[cell].append(index)
+
+    def intersects(self, box):
+        x0, y0, x1, y1 = box
+        for cell in self._cells(box):
+            for index in self.cells.get(cell, ()):
+                bx0, by0, bx1, by1 = self.boxes[index]
+                if x0 < bx1 and bx0 < x1 and y0 < by1 and by0 < y1:
+                    return True
+        return False
+
+
+def _label_box(x, y, dx, dy, width, height):
+    """Box of a label whose anchor corner sits at (x + dx, y + dy)"""
+    left = x + dx - (width if dx < 0 else width / 2 if dx == 0 else 0)
+    bottom = y + dy - (height if dy < 0 else height / 2 if dy == 0 else 0)
+    return (left, bottom, left + width, bottom + height)
+
+
+def _alignment(ux, uy):
+    ha = 'left' if ux > 0 else 'right' if ux < 0 else 'center'
+    va = 'bottom' if uy > 0 else 'top' if uy < 0 else 'center'
+    return ha, va
+
+
+def place(points, sizes, radii, bounds, gap=4.0, priority=None, obstacles=()):
+    """
+    Choose label positions in display space.
+
+    points   : (n, 2) anchor positions in pixels
+    sizes    : (n, 2) label width/height in pixels
+    radii    : (n,) marker radius in pixels (markers are obstacles too)
+    bounds   : (x0, y0, x1, y1) area labels must stay inside
+    priority : optional (n,) values, higher is placed first
+    obstacles: extra (x0, y0, x1, y1) boxes labels must avoid (e.g. legend)
+
+    Returns a list with, per label, None (dropped or anchor out of bounds)
+    or a tuple
+    (dx, dy, ha, va, leader) with the pixel offset from the anchor.
+    """
+    import numpy as np
+
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    sizes = np.asarray(sizes, dtype=float).reshape(-1, 2)
+    radii = np.asarray(radii, dtype=float).reshape(-1)
+    n = len(points)
+    if n == 0:
+        return []
+
+    index = GridIndex(float(np.median(sizes[:, 0])))
+    for (x, y), r in zip(points, radii):
+        index.insert((x - r, y - r, x + r, y + r))
+    for box in obstacles:
+        index.insert(tuple(box))
+
+    order = np.argsort(-np.asarray(priority if priority is not None else radii), kind='stable')
+    bx0, by0, bx1, by1 = bounds
+    placements = [None] * n
+    for i in order:
+        x, y = points[i]
+        if not (bx0 <= x <= bx1 and by0 <= y <= by1):
+            continue  # anchor outside the axes, nothing to label
+        width, height = sizes[i]
+        base = radii[i] + gap
+        chosen = None
+        for ring, leader in [(r, False) for r in RINGS] + [(r, True) for r in LEADER_RINGS]:
+            for ux, uy in DIRECTIONS:
+                # Diagonals at 45 degrees, same distance as the straight ones
+                norm = 0.7071 if ux and uy else 1.0
+                dx, dy = ux * base * ring * norm, uy * base * ring * norm
+                box = _label_box(x, y, dx, dy, width, height)
+                if box[0] < bx0 or box[1] < by0 or box[2] > bx1 or box[3] > by1:
+                    continue
+                if index.intersects(box):
+                    continue
+                chosen = (dx, dy) + _alignment(ux, uy) + (leader,), box
+                break
+            if chosen:
+                break
+        if chosen:
+            placements[i], box = chosen
+            index.insert(box)
+    return placements
+
+
+def place_labels(ax, lons, lats, names, marker_sizes, transform=None, fontsize=8,
+                 pad=0.3, box_alpha=0.7, arrowprops=None, leader_arrowprops=None,
+                 gap=4.0, renderer=None, obstacles=()):
+    """
+    Place one label per point on ax without overlaps and draw them.
+
+    marker_sizes are scatter sizes (points^2), used as obstacles and for the
+    label distance. Labels get a white rounded box with the given pad
+    (in font sizes) and alpha. arrowprops, if given, draws an arrow for every label;
+    otherwise only labels pushed away from their point get a leader line
+    (leader_arrowprops). The figure layout should be final (e.g. after
+    tight_layout) because placement happens in display pixels. The axes
+    legend, if any, and the pixel boxes in obstacles are kept free of labels.
+    Returns the number of labels that could not be placed.
+    """
+    import matplotlib
+    import numpy as np
+    from matplotlib.font_manager import FontProperties
+
+    fig = ax.figure
+    renderer = renderer or fig.canvas.get_renderer()
+    px_per_pt = fig.dpi / 72.0
+
+    if transform is None:
+        data_transform = ax.transData
+    elif hasattr(transform, '_as_mpl_transform'):
+        data_transform = transform._as_mpl_transform(ax)
+    else:
+        data_transform = transform
+    points = data_transform.transform(np.column_stack([lons, lats]))
+
+    bbox = dict(boxstyle=f'round,pad={pad}', facecolor='white', alpha=box_alpha)
+    prop = FontProperties(size=fontsize)
+    border = 2 * pad * fontsize * px_per_pt
+    sizes = []
+    for name in names:
+        width, height, _ = renderer.get_text_width_height_descent(str(name), prop, ismath=False)
+        sizes.append((width + border, height + border))
+
+    # Nodes without a size get matplotlib's default marker, as scatter draws them
+    marker_sizes = np.asarray(marker_sizes, dtype=float)
+    marker_sizes = np.where(np.isfinite(marker_sizes), marker_sizes,
+                            matplotlib.rcParams['lines.markersize'] ** 2)
+    radii = np.sqrt(marker_sizes) / 2 * px_per_pt
+    window = ax.get_window_extent(renderer)
+    obstacles = list(obstacles)
+    legend = ax.get_legend()
+    if legend is not None:
+        extent = legend.get_window_extent(renderer)
+        obstacles.append((extent.x0, extent.y0, extent.x1, extent.y1))
+    placements = place(points, sizes, radii, (window.x0, window.y0, window.x1, window.y1),
+                       gap=gap * px_per_pt, obstacles=obstacles)
+
+    if leader_arrowprops is None:
+        leader_arrowprops = dict(arrowstyle='-', lw=0.6, color='gray', alpha=0.8)
+    dropped = 0
+    for name, lon, lat, placement in zip(names, lons, lats, placements):
+        if placement is None:
+            dropped += 1
+            continue
+        dx, dy, ha, va, leader = placement
+        props = arrowprops or (leader_arrowprops if leader else None)
+        ax.annotate(str(name), (lon, lat), xytext=(dx / px_per_pt, dy / px_per_pt),
+                    textcoords='offset points', fontsize=fontsize, ha=ha, va=va,
+                    bbox=bbox, arrowprops=props, annotation_clip=False,
+                    **({'xycoords': data_transform} if transform is not None else {}))
+    return dropped
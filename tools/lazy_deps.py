@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+On-demand loading of the heavy plotting libraries
+Bedarfsgesteuertes Laden der Plot-Bibliotheken
+按需加载绘图库
+
+matplotlib and especially cartopy (with shapely and pyproj) take hundreds of
+milliseconds to seconds to import. The map generators call these helpers only
+when a render actually needs them, so importing a generator to list or
+validate its data stays cheap. Each loader runs once per process.
+
+Set MAP_CARTOPY=0 to render the plain matplotlib maps even where cartopy is
+installed.
+"""
+
+import os
+from functools import lru_cache
+
+import fonts
+import instrument
+
+
+@lru_cache(maxsize=None)
+def pyplot():
+    """
+    Import matplotlib with the non-interactive Agg backend and the CJK font
+    of this environment (see tools/fonts.py), and return pyplot
+    """
+    with instrument.stage('import', library='matplotlib'):
+        import matplotlib
+        matplotlib.use('Agg')  # Non-interactive backend - wichtig für Server/ohne Display
+        import matplotlib.pyplot as plt
+    with instrument.stage('fonts'):
+        fonts.configure()
+    return plt
+
+
+@lru_cache(maxsize=None)
+def cartopy_modules():
+    """Return (cartopy.crs, cartopy.feature), or None if cartopy is unusable"""
+    if os.environ.get('MAP_CARTOPY', '1').lower() in ('0', 'false', 'no', 'off'):
+        print("cartopy disabled by MAP_CARTOPY, using basic map")
+        return None
+    try:
+        with instrument.stage('import', library='cartopy'):
+            import cartopy.crs as ccrs
+            import cartopy.feature as cfeature
+    except ImportError:
+        print("Warning: cartopy not available, using basic map. Install with: pip install cartopy")
+        return None
+    except Exception as e:
+        print(f"Warning: cartopy import failed: {e}, using basic map")
+        return None
+    print("Cartopy available - will use geographic features")
+    return ccrs, cfeature
+
+
+def has_cartopy():
+    """Whether cartopy can be used; probed once per process"""
+    return cartopy_modules() is not None
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed build cache for rendered maps
+Inhaltsadressierter Build-Cache für gerenderte Karten
+渲染地图的内容寻址构建缓存
+
+A map is identified by a SHA-256 hash over its input data (locations,
+routes), its render parameters (dpi, figsize, extent), the source files
+that define its styling, the installed versions of the plotting
+libraries and the CJK font in use (see fonts.py). If a PNG for that hash
+is already stored, rendering is skipped and the stored file is reused.
+
+Set MAP_CACHE_DIR to move the cache (default: <repo>/.map-cache) and
+MAP_CACHE=0 to disable it. MAP_PNG_COMPRESS (zlib level 0-9, default 6)
+trades PNG size for encoding speed. It is not part of the key: it changes
+the encoding, not the pixels, so maps written by render_daemon.py (fast
+compression) and by build_maps.py share their cache entries.
+
+MAP_FORMAT (png, pdf or svg; default png) selects the file format the maps
+are written in. The format is the suffix of the cache entry, so each
+format is cached separately.
+"""
+
+import filecmp
+import hashlib
+import json
+import os
+import shutil
+import threading
+from functools import lru_cache
+
+import instrument
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CACHE_DIR = os.environ.get('MAP_CACHE_DIR', os.path.join(REPO_ROOT, '.map-cache'))
+
+# Bump when the key layout changes so old entries are never matched
+CACHE_FORMAT = 1
+
+# File formats a map can be written in, the first is the default
+OUTPUT_FORMATS = ('png', 'pdf', 'svg')
+
+# Libraries whose version changes can alter the rendered pixels
+TRACKED_LIBRARIES = ('matplotlib', 'numpy', 'cartopy', 'shapely', 'pyproj', 'pillow')
+
+# Per thread: what the render in progress had to leave out (see mark_incomplete)
+_render_state = threading.local()
+
+
+def cache_enabled():
+    """Whether the map cache is active (MAP_CACHE=0 turns it off)"""
+    return os.environ.get('MAP_CACHE', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+@lru_cache(maxsize=None)
+def library_versions():
+    """Installed versions of the tracked libraries, read without importing them"""
+    from importlib import metadata
+    versions = {}
+    for name in TRACKED_LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def png_compress_level():
+    """zlib level for written PNGs (MAP_PNG_COMPRESS, default 6)"""
+    try:
+        return min(max(int(os.environ.get('MAP_PNG_COMPRESS', 6)), 0), 9)
+    except ValueError:
+        return 6
+
+
+def output_format():
+    """File format of rendered maps (MAP_FORMAT, default png)"""
+    fmt = os.environ.get('MAP_FORMAT', OUTPUT_FORMATS[0]).lower().lstrip('.')
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown MAP_FORMAT '{fmt}', expected one of {', '.join(OUTPUT_FORMATS)}")
+    return fmt
+
+
+def output_path(output_dir, name):
+    """
+    Path of a map output file, with an image extension set to
+    output_format(); other files (such as generated .tex tables) keep theirs
+    """
+    stem, suffix = os.path.splitext(name)
+    if suffix[1:].lower() not in OUTPUT_FORMATS:
+        return os.path.join(output_dir, name)
+    return os.path.join(output_dir, stem + '.' + output_format())
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents, recomputed only when the file changes"""
+    stat = os.stat(path)
+    return _file_digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(inputs, params, sources=()):
+    """Hash map inputs, render parameters, styling sources, library versions and fonts"""
+    import fonts
+
+    payload = {
+        'format': CACHE_FORMAT,
+        'inputs': inputs,
+        'params': params,
+        'sources': sorted(file_digest(os.path.abspath(p)) for p in sources),
+        'libraries': library_versions(),
+        'fonts': fonts.fingerprint(),
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def cache_path(key, suffix='.png'):
+    """Location of a cache entry, sharded by the first two hex digits"""
+    return os.path.join(CACHE_DIR, key[:2], key + suffix)
+
+
+def clear_rendered():
+    """
+    Remove the cached rendered maps and keep the other caches (features,
+    base maps, networks), so the next build renders every map again
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        if len(name) == 2 and all(c in '0123456789abcdef' for c in name):
+            shutil.rmtree(os.path.join(CACHE_DIR, name), ignore_errors=True)
+
+
+def _copy_atomic(src, dst):
+    """Copy src to dst through a temporary file so readers never see partial data"""
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _remove_other_formats(output_file):
+    """
+    Delete the same map in the other output formats. \\includegraphics
+    without an extension prefers .pdf over .png, so a PDF left over from an
+    earlier format would hide the map just written.
+    """
+    stem, suffix = os.path.splitext(output_file)
+    if suffix[1:].lower() not in OUTPUT_FORMATS:
+        return
+    for fmt in OUTPUT_FORMATS:
+        other = f"{stem}.{fmt}"
+        if '.' + fmt != suffix and os.path.exists(other):
+            os.remove(other)
+            print(f"Removed {os.path.basename(other)} (now written as {suffix[1:].upper()})")
+
+
+def mark_incomplete(reason):
+    """
+    Record that the render in progress in this thread lacks part of its
+    content (e.g. a feature layer failed to load); cached_render then
+    writes the map but does not store it, so the next build tries again
+    """
+    _render_state.incomplete = getattr(_render_state, 'incomplete', []) + [reason]
+
+
+def cached_render(output_file, key, render):
+    """
+    Produce output_file for the given cache key.
+
+    On a cache hit the stored file is copied to output_file (or left alone if
+    it is already identical). On a miss render(output_file) is called and the
+    result is stored under the key, unless the render was marked incomplete
+    (see mark_incomplete). Copies of the map in other output
+    formats are removed either way.
+    """
+    name = os.path.basename(output_file)
+    _remove_other_formats(output_file)
+    if not cache_enabled():
+        with instrument.stage('render', map=name):
+            return render(output_file)
+
+    suffix = os.path.splitext(output_file)[1] or '.png'
+    entry = cache_path(key, suffix)
+
+    if os.path.exists(entry):
+        if not (os.path.exists(output_file) and filecmp.cmp(entry, output_file, shallow=False)):
+            _copy_atomic(entry, output_file)
+        print(f"✓ Cache hit, reusing {os.path.basename(output_file)} ({key[:12]})")
+        return output_file
+
+    _render_state.incomplete = []
+    with instrument.stage('render', map=name):
+        result = render(output_file)
+    if _render_state.incomplete:
+        print(f"Warning: {name} is incomplete ({'; '.join(_render_state.incomplete)}), "
+              f"not caching it")
+        return result
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    _copy_atomic(output_file, entry)
+    return result
+
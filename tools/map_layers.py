@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Batched map layers for locations and supply routes
+Gebündelte Kartenebenen für Standorte und Lieferrouten
+地点与供应路线的批量地图图层
+
+Calling ax.scatter once per location and ax.plot once per route creates one
+matplotlib artist each, which does not scale past a few hundred elements.
+These helpers draw all points of a category with a single scatter call and
+all routes as a single LineCollection, both backed by NumPy arrays.
+
+Layers of more than DENSE_LAYER_SIZE elements are marked rasterized: in
+PDF or SVG output they are embedded as one image at the figure's dpi
+instead of thousands of vector paths, while everything else stays vector.
+PNG output is not affected.
+
+NumPy and matplotlib are imported inside the functions so that generators
+can import this module without paying for them (see lazy_deps.py).
+"""
+
+# Element count above which a layer is rasterized in vector output
+DENSE_LAYER_SIZE = 1000
+
+
+def fill_sizes(sizes, categories, styles):
+    """
+    Marker sizes with NaN (a node without a size) replaced by the size of
+    its category's style, or matplotlib's default marker size
+    """
+    import matplotlib
+    import numpy as np
+
+    sizes = np.asarray(sizes, dtype=float)
+    missing = ~np.isfinite(sizes)
+    if not missing.any():
+        return sizes
+    sizes = sizes.copy()
+    categories = np.asarray(categories)
+    sizes[missing] = matplotlib.rcParams['lines.markersize'] ** 2
+    for category, style in styles.items():
+        if 's' in style:
+            sizes[missing & (categories == category)] = style['s']
+    return sizes
+
+
+def plot_points(ax, lons, lats, categories, styles, sizes=None, transform=None, **common):
+    """
+    Draw points with one scatter call per category.
+
+    categories holds one key of styles per point; each style is a dict of
+    scatter arguments such as {'color': 'red', 'marker': 'o', 's': 300}.
+    sizes, if given, overrides the per-category marker size point by point
+    (NaN keeps the category's size, see fill_sizes). Categories with more
+    than DENSE_LAYER_SIZE points are rasterized unless common sets
+    'rasterized' explicitly. Returns the list of created PathCollections.
+    """
+    import numpy as np
+
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    categories = np.asarray(categories)
+    if sizes is not None:
+        sizes = np.asarray(sizes, dtype=float)
+    if transform is not None:
+        common['transform'] = transform
+
+    artists = []
+    for category, style in styles.items():
+        mask = categories == category
+        if not mask.any():
+            continue
+        kwargs = dict(common, **style)
+        if 'color' in kwargs:
+            kwargs['c'] = kwargs.pop('color')
+        if sizes is not None:
+            kwargs['s'] = fill_sizes(sizes[mask], categories[mask], {category: style})
+        kwargs.setdefault('rasterized', bool(mask.sum() > DENSE_LAYER_SIZE))
+        artists.append(ax.scatter(lons[mask], lats[mask], **kwargs))
+    return artists
+
+
+def plot_routes(ax, start_lons, start_lats, end_lons, end_lats, transform=None, **style):
+    """
+    Draw straight route segments as a single LineCollection.
+
+    style takes LineCollection arguments (colors, linewidths, linestyles,
+    alpha, zorder). Returns the collection.
+    """
+    import numpy as np
+
+    segments = np.stack([
+        np.column_stack([start_lons, start_lats]),
+        np.column_stack([end_lons, end_lats]),
+    ], axis=1).astype(float)
+    return add_paths(ax, segments, transform=transform, **style)
+
+
+def add_paths(ax, paths, transform=None, **style):
+    """
+    Add a sequence of (n_i, 2) lon/lat vertex arrays as one LineCollection.
+
+    paths may be a (n, k, 2) array or a list of arrays of varying length.
+    More than DENSE_LAYER_SIZE paths are rasterized unless style says otherwise.
+    """
+    from matplotlib.collections import LineCollection
+
+    if transform is not None:
+        style['transform'] = transform
+    style.setdefault('rasterized', len(paths) > DENSE_LAYER_SIZE)
+    collection = LineCollection(paths, **style)
+    ax.add_collection(collection, autolim=False)
+    return collection
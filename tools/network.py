@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Array-backed supply-chain network store
+Array-basierter Speicher für Liefernetzwerke
+基于数组的供应链网络存储
+
+Each product map reads its nodes and edges from a network file next to the
+generator, e.g. fritz-kola-supply-chain.json:
+
+    {
+      "nodes": [
+        {"id": "hamburg", "name": "Hamburg (Production)",
+         "type": "production", "coords": [9.9937, 53.5511], "size": 300},
+        ...
+      ],
+      "edges": [["hamburg", "berlin"], ...]
+    }
+
+Instead of "coords" a node may name a "place" ("Berlin", "München",
+"苏黎世", "Frankfurt, DE"), resolved through the offline gazetteer (see
+gazetteer.py) in one bulk lookup per file. The name defaults to the place.
+
+The file is loaded into a Network: columnar NumPy arrays (lon, lat, size,
+type codes, edge endpoints) plus an id -> index map, instead of one Python
+dict per node. Parsed networks are stored as .npz next to the rendered maps
+in the map cache, keyed by the file hash and the gazetteer's, so large
+networks are parsed and resolved once.
+"""
+
+import hashlib
+import json
+import os
+
+import gazetteer
+import map_cache
+
+NETWORK_CACHE_DIR = os.path.join(map_cache.CACHE_DIR, 'networks')
+
+# Node keys with a dedicated column; any other key becomes an extra column
+CORE_KEYS = ('id', 'name', 'type', 'coords', 'place', 'size')
+
+
+def _extra_column(values):
+    """
+    Column of an extra node key: float (NaN where missing) when every value
+    is a number or a list of numbers of one length, else str ('' where
+    missing); None when no node sets the key
+    """
+    import numpy as np
+
+    present = [v for v in values if v is not None]
+    if not present:
+        return None
+    if not any(isinstance(v, str) for v in present):
+        # Strings stay strings even when they look like numbers ("01067")
+        try:
+            width = np.size(present[0])
+            fill = np.full(width, np.nan) if width > 1 else np.nan
+            return np.array([fill if v is None else v for v in values], dtype=float)
+        except (TypeError, ValueError):
+            pass  # lists of mixed length or content
+    return np.array(['' if v is None else str(v) for v in values], dtype=str)
+
+
+class Network:
+    """
+    Nodes and edges of one map as parallel arrays.
+
+    ids, names   : arrays of str, one per node
+    types        : int array of codes into type_names
+    lons, lats   : float64 arrays
+    sizes        : float64 array (NaN where a node has no size)
+    edge_src/dst : int arrays of node indices
+    extra        : dict of additional per-node columns, float (NaN if
+                   missing) or, for descriptive keys, str ('' if missing)
+    index        : dict mapping node id -> row
+    """
+
+    def __init__(self, ids, names, type_names, types, lons, lats, sizes,
+                 edge_src, edge_dst, extra=None):
+        self.ids = ids
+        self.names = names
+        self.type_names = list(type_names)
+        self.types = types
+        self.lons = lons
+        self.lats = lats
+        self.sizes = sizes
+        self.edge_src = edge_src
+        self.edge_dst = edge_dst
+        self.extra = extra or {}
+        self.index = {node_id: i for i, node_id in enumerate(ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def n_edges(self):
+        return len(self.edge_src)
+
+    def node_types(self):
+        """Type name of every node as a str array"""
+        import numpy as np
+        return np.asarray(self.type_names, dtype=str)[self.types]
+
+    def type_mask(self, type_name):
+        """Boolean mask of the nodes of one type"""
+        if type_name not in self.type_names:
+            return self.types < 0
+        return self.types == self.type_names.index(type_name)
+
+    def edge_coords(self):
+        """(start_lons, start_lats, end_lons, end_lats) of all edges"""
+        return (self.lons[self.edge_src], self.lats[self.edge_src],
+                self.lons[self.edge_dst], self.lats[self.edge_dst])
+
+    def bounds(self):
+        """[west, east, south, north] of all nodes"""
+        return [float(self.lons.min()), float(self.lons.max()),
+                float(self.lats.min()), float(self.lats.max())]
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a Network from the parsed JSON layout"""
+        import numpy as np
+
+        nodes = data.get('nodes', [])
+        ids = np.array([str(node['id']) for node in nodes], dtype=str)
+        if len(set(ids.tolist())) != len(ids):
+            raise ValueError("Duplicate node ids in network")
+        names = np.array([str(node.get('name', node.get('place', node['id']))) for node in nodes],
+                         dtype=str)
+
+        type_names = []
+        type_codes = {}
+        types = np.empty(len(nodes), dtype=np.int32)
+        for i, node in enumerate(nodes):
+            type_name = node.get('type', '')
+            if type_name not in type_codes:
+                type_codes[type_name] = len(type_names)
+                type_names.append(type_name)
+            types[i] = type_codes[type_name]
+
+        coords = np.full((len(nodes), 2), np.nan)
+        places = []
+        for i, node in enumerate(nodes):
+            if 'coords' in node:
+                coords[i] = node['coords']
+            elif 'place' in node:
+                places.append(i)
+            else:
+                raise ValueError(f"Node {node['id']!r} has neither coords nor place")
+        if places:
+            lons, lats = gazetteer.resolve([nodes[i]['place'] for i in places])
+            coords[places, 0] = lons
+            coords[places, 1] = lats
+        sizes = np.array([node.get('size', np.nan) for node in nodes], dtype=float)
+
+        extra = {}
+        for key in sorted({k for node in nodes for k in node} - set(CORE_KEYS)):
+            column = _extra_column([node.get(key) for node in nodes])
+            if column is not None:
+                extra[key] = column
+
+        index = {node_id: i for i, node_id in enumerate(ids.tolist())}
+        edges = data.get('edges', [])
+        try:
+            pairs = np.array([[index[src], index[dst]] for src, dst in edges],
+                             dtype=np.int32).reshape(-1, 2)
+        except KeyError as e:
+            raise ValueError(f"Edge references unknown node {e}") from None
+
+        return cls(ids, names, type_names, types, coords[:, 0].copy(), coords[:, 1].copy(),
+                   sizes, pairs[:, 0].copy(), pairs[:, 1].copy(), extra)
+
+    def save_npz(self, path):
+        """Write the arrays to a compressed .npz file"""
+        import numpy as np
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {
+            'ids': self.ids, 'names': self.names,
+            'type_names': np.asarray(self.type_names, dtype=str), 'types': self.types,
+            'lons': self.lons, 'lats': self.lats, 'sizes': self.sizes,
+            'edge_src': self.edge_src, 'edge_dst': self.edge_dst,
+        }
+        for key, column in self.extra.items():
+            arrays['extra_' + key] = column
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load_npz(cls, path):
+        import numpy as np
+
+        with np.load(path) as data:
+            extra = {key[len('extra_'):]: data[key] for key in data.files
+                     if key.startswith('extra_')}
+            return cls(data['ids'], data['names'], data['type_names'].tolist(), data['types'],
+                       data['lons'], data['lats'], data['sizes'],
+                       data['edge_src'], data['edge_dst'], extra)
+
+
+def load_network(path):
+    """
+    Load a network file, reusing the parsed arrays from the cache when the
+    file is unchanged.
+    """
+    # Place names resolve through the gazetteer, so its version is part of the key
+    digest = hashlib.sha256((map_cache.file_digest(os.path.abspath(path))
+                             + map_cache.file_digest(gazetteer.GAZETTEER_FILE)).encode()).hexdigest()
+    cached = os.path.join(NETWORK_CACHE_DIR, digest[:2], digest + '.npz')
+    if map_cache.cache_enabled() and os.path.exists(cached):
+        return Network.load_npz(cached)
+
+    with open(path, encoding='utf-8') as f:
+        network = Network.from_dict(json.load(f))
+    if map_cache.cache_enabled():
+        network.save_npz(cached)
+    return network
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Long-running map render server with automatic re-rendering on edits
+Dauerhaft laufender Karten-Renderserver mit automatischem Neurendern
+常驻地图渲染服务，编辑后自动重新渲染
+
+Every run of generate_map.py pays the matplotlib and cartopy imports, the
+font cache and the feature loading again. The server does that once and
+keeps it warm: libraries, fonts, the clipped Natural Earth features and
+every product's base-map template stay in memory.
+
+    python tools/render_daemon.py serve          # start, watching all products
+    python tools/render_daemon.py render germany/hamburg supply-chain
+    python tools/render_daemon.py status
+    python tools/render_daemon.py stop
+
+While serving, the data files of each map (SUPPLY_CHAIN_NETWORK,
+SUPPLY_CHAIN_POINTS, ...) and each generate_map.py are polled. A changed
+data file re-renders only its map; a changed generator is reloaded and all
+its maps are re-rendered. Changes to the shared tools need a restart.
+
+Clients talk to the server over a TCP socket bound to 127.0.0.1 (port
+MAP_DAEMON_PORT, default 47651) with one JSON object per line. PNGs are
+written with fast compression (MAP_PNG_COMPRESS=1) unless --png-compress
+says otherwise; the pixels are identical, the files somewhat larger. The
+compression level is not part of the map cache key, so the server and
+build_maps.py reuse each other's renders.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import build_maps
+
+DEFAULT_PORT = int(os.environ.get('MAP_DAEMON_PORT', 47651))
+
+
+def _prefix(kind):
+    return kind.upper().replace('-', '_')
+
+
+def _stamp(path):
+    """(mtime_ns, size) of a file, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ThreadOutput:
+    """
+    Stand-in for sys.stdout that sends the prints of a thread inside
+    capture() to that thread's log stream and everything else to the
+    console, so the server and watcher messages never end up in the log
+    of a render running at the same time
+    """
+
+    def __init__(self, console):
+        self.console = console
+        self._local = threading.local()
+
+    def _stream(self):
+        return getattr(self._local, 'stream', None) or self.console
+
+    def write(self, text):
+        return self._stream().write(text)
+
+    def flush(self):
+        self._stream().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.console, name)
+
+    @contextlib.contextmanager
+    def capture(self, stream):
+        """Send this thread's prints to stream inside the block"""
+        saved = getattr(self._local, 'stream', None)
+        self._local.stream = stream
+        try:
+            yield stream
+        finally:
+            self._local.stream = saved
+
+
+class RenderServer:
+    """Warm render state: loaded generators, a render lock and file stamps"""
+
+    def __init__(self, product_dirs):
+        # The generators print; each render collects its own output
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        self.output = sys.stdout
+        self.product_dirs = {build_maps.product_name(d): d for d in product_dirs}
+        self.modules = {}
+        self.stamps = {}
+        self.lock = threading.Lock()  # pyplot is not thread-safe
+        self.started = time.time()
+        self.renders = 0
+
+    def log(self, message):
+        print(f"[{time.strftime('%H:%M:%S')}] {message}", file=self.output.console, flush=True)
+
+    def load(self, product, reload=False):
+        """(Re)load a product's generator and remember its watched files"""
+        product_dir = self.product_dirs[product]
+        with self.output.capture(io.StringIO()):
+            module = build_maps.load_generator(product_dir, reload=reload)
+        self.modules[product] = module
+        generator = os.path.join(product_dir, build_maps.GENERATOR_NAME)
+        self.stamps[(product, None, None)] = (generator, _stamp(generator))
+        for kind in getattr(module, 'MAPS', {}):
+            for suffix in ('_NETWORK', '_POINTS'):
+                data_file = getattr(module, _prefix(kind) + suffix, None)
+                if data_file:
+                    self.stamps[(product, kind, suffix)] = (data_file, _stamp(data_file))
+        return module
+
+    def warm_up(self):
+        """Import the libraries and load every product and base-map template"""
+        import lazy_deps
+        import render_engine
+
+        start = time.perf_counter()
+        lazy_deps.pyplot()
+        lazy_deps.has_cartopy()
+        for product in self.product_dirs:
+            try:
+                module = self.load(product)
+                for kind in getattr(module, 'MAPS', {}):
+                    style = getattr(module, _prefix(kind) + '_BASE_MAP', None)
+                    if style is not None:
+                        render_engine.select(style).prepare(style)
+            except Exception as e:
+                self.log(f"Warning: could not warm up {product}: {e}")
+        self.log(f"Warm after {time.perf_counter() - start:.2f}s "
+                 f"({len(self.product_dirs)} products)")
+
+    def resolve(self, product):
+        """Accept 'country/city' or an absolute directory path (main() makes paths absolute)"""
+        if product in self.product_dirs:
+            return product
+        path = os.path.realpath(product)
+        for name, product_dir in self.product_dirs.items():
+            if os.path.realpath(product_dir) == path:
+                return name
+        raise KeyError(f"Unknown product: {product}")
+
+    def render(self, product, kinds=None):
+        """Render maps of one product; returns a list of per-map results"""
+        product = self.resolve(product)
+        results = []
+        with self.lock:
+            module = self.modules.get(product) or self.load(product)
+            for kind in kinds or list(module.MAPS):
+                start = time.perf_counter()
+                log = io.StringIO()
+                result = {'product': product, 'kind': kind}
+                try:
+                    with self.output.capture(log):
+                        result['output'] = module.MAPS[kind](output_dir=self.product_dirs[product])
+                    result['ok'] = True
+                except Exception:
+                    result['ok'] = False
+                    result['error'] = log.getvalue() + traceback.format_exc()
+                result['seconds'] = round(time.perf_counter() - start, 3)
+                self.renders += 1
+                status = 'OK' if result['ok'] else 'FAILED'
+                self.log(f"{status} {product} [{kind}] in {result['seconds']:.2f}s")
+                if not result['ok']:
+                    self.log(result['error'].rstrip())
+                results.append(result)
+        return results
+
+    def changed(self):
+        """(product, kind) pairs whose watched file changed; kind None = generator"""
+        changes = []
+        for (product, kind, suffix), (path, stamp) in list(self.stamps.items()):
+            current = _stamp(path)
+            if current != stamp:
+                self.stamps[(product, kind, suffix)] = (path, current)
+                changes.append((product, kind))
+        return changes
+
+    def watch(self, interval):
+        """Poll the watched files and re-render what changed, until the process ends"""
+        while True:
+            time.sleep(interval)
+            by_product = {}
+            for product, kind in self.changed():
+                by_product.setdefault(product, set()).add(kind)
+            for product, kinds in by_product.items():
+                try:
+                    if None in kinds:
+                        self.log(f"{product}: generator changed, reloading")
+                        with self.lock:
+                            self.load(product, reload=True)
+                        self.render(product)
+                    else:
+                        self.log(f"{product}: data changed: {', '.join(sorted(kinds))}")
+                        self.render(product, sorted(kinds))
+                except Exception as e:
+                    self.log(f"Error re-rendering {product}: {e}")
+
+    def handle(self, request):
+        """Answer one client request"""
+        command = request.get('command')
+        if command == 'render':
+            results = self.render(request['product'], request.get('kinds') or None)
+            return {'ok': all(r['ok'] for r in results), 'results': results}
+        if command == 'status':
+            return {'ok': True, 'pid': os.getpid(), 'uptime': round(time.time() - self.started, 1),
+                    'renders': self.renders, 'products': sorted(self.product_dirs)}
+        if command == 'stop':
+            return {'ok': True, 'stopping': True}
+        return {'ok': False, 'error': f"Unknown command: {command}"}
+
+
+def serve(port, product_dirs, watch=True, interval=0.5):
+    server = RenderServer(product_dirs)
+    server.warm_up()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline().decode('utf-8'))
+                response = server.handle(request)
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response, ensure_ascii=False) + '\n').encode('utf-8'))
+            if response.get('stopping'):
+                threading.Thread(target=tcp.shutdown, daemon=True).start()
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer(('127.0.0.1', port), Handler) as tcp:
+        if watch:
+            threading.Thread(target=server.watch, args=(interval,), daemon=True).start()
+        server.log(f"Listening on 127.0.0.1:{port}" + (" (watching files)" if watch else ""))
+        try:
+            tcp.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    server.log("Stopped")
+
+
+def request(port, payload, timeout=600):
+    """Send one request to a running server and return its response"""
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as conn:
+        conn.sendall((json.dumps(payload) + '\n').encode('utf-8'))
+        with conn.makefile('rb') as reader:
+            return json.loads(reader.readline().decode('utf-8'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f'local TCP port (default: {DEFAULT_PORT}, or MAP_DAEMON_PORT)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='start the render server')
+    serve_parser.add_argument('products', nargs='*',
+                              help='product directories to serve (default: all under product-tex/)')
+    serve_parser.add_argument('--no-watch', action='store_true',
+                              help='only render on request, do not watch files')
+    serve_parser.add_argument('--interval', type=float, default=0.5,
+                              help='seconds between file checks (default: 0.5)')
+    serve_parser.add_argument('--png-compress', type=int, default=1,
+                              help='PNG zlib level while serving (default: 1, fast)')
+
+    render_parser = commands.add_parser('render', help='render maps through the server')
+    render_parser.add_argument('product', help="product as 'country/city' or its directory")
+    render_parser.add_argument('kinds', nargs='*', help='map kinds (default: all)')
+
+    commands.add_parser('status', help='show whether a server is running')
+    commands.add_parser('stop', help='stop the running server')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        os.environ['MAP_PNG_COMPRESS'] = str(args.png_compress)
+        if args.products:
+            product_dirs = [os.path.abspath(p) for p in args.products]
+        else:
+            product_dirs = build_maps.find_product_dirs()
+        serve(args.port, product_dirs, watch=not args.no_watch, interval=args.interval)
+        return 0
+
+    payload = {'command': args.command}
+    if args.command == 'render':
+        # The server has its own working directory: send paths absolute
+        product = os.path.abspath(args.product) if os.path.isdir(args.product) else args.product
+        payload.update(product=product, kinds=args.kinds)
+    try:
+        response = request(args.port, payload)
+    except OSError as e:
+        print(f"No render server on port {args.port}: {e}")
+        print("Start one with: python tools/render_daemon.py serve")
+        return 2
+
+    if args.command == 'render':
+        for result in response.get('results', []):
+            status = 'OK' if result['ok'] else 'FAILED'
+            print(f"{status:<7} {result['product']} [{result['kind']}] {result['seconds']:.2f}s")
+            if not result['ok']:
+                print(result['error'].rstrip())
+        if 'error' in response:
+            print(f"Error: {response['error']}")
+    else:
+        print(json.dumps(response, indent=2, ensure_ascii=False))
+    return 0 if response.get('ok') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
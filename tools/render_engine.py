@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Render backends for the product maps and their selection per job
+Render-Backends der Produktkarten und ihre Auswahl je Auftrag
+产品地图的渲染后端及按任务选择
+
+Every map draws its product layers (markers, routes, labels, title) on a
+canvas that a backend provides for the map's style:
+
+    cartopy   geographic axes with Natural Earth features and gridlines, as
+              a cached background template (fidelity 'geo')
+    plain     plain matplotlib lon/lat axes with grid, axis labels and
+              legend, as a cached template (fidelity 'plain')
+    agg       a bare Agg figure with a fixed layout: equal-aspect axes,
+              legend and title, no background template, no tight_layout,
+              at DRAFT_DPI (fidelity 'draft'); for previews and CI
+
+A canvas offers overlay(), set_title(), composite() and legend like
+base_map.Template, so a map's drawing code is the same for all backends.
+
+select() picks the backend of a job. An explicit choice wins: use() in
+the calling process, else MAP_BACKEND (cartopy, plain, agg or auto).
+Otherwise, or for 'auto', the fastest available backend is taken whose
+fidelity lies between the requested one and the style's own ('geo' for
+styles with geo features, 'plain' otherwise), so an automatic choice
+never draws more than the style asks for. The requested fidelity is
+MAP_FIDELITY (draft, plain or geo), by default the style's own. Speeds
+come from the last benchmark run (bench_maps.py records them in
+<MAP_CACHE_DIR>/backend-timings.json) or DEFAULT_SECONDS. When no backend
+is good enough, the best available one is used.
+
+The chosen backend is part of each map's cache key, so a draft never
+stands in for a full render.
+"""
+
+import contextlib
+import importlib.util
+import json
+import os
+
+import base_map
+import instrument
+import lazy_deps
+import map_cache
+
+# Fidelity levels, lowest first
+FIDELITIES = ('draft', 'plain', 'geo')
+
+TIMINGS_FILE = os.path.join(map_cache.CACHE_DIR, 'backend-timings.json')
+
+# Typical seconds per map of each backend, used until a benchmark recorded better
+DEFAULT_SECONDS = {'agg': 0.5, 'plain': 1.5, 'cartopy': 4.0}
+
+# Resolution of the agg backend
+DRAFT_DPI = 100
+
+# Choice made with use() in this process, ahead of the environment
+_override = {}
+
+
+def _disabled(value):
+    return (value or '').lower() in ('0', 'false', 'no', 'off')
+
+
+class DraftCanvas:
+    """
+    Fixed-layout Agg figure for the agg backend: the axes box is computed
+    from the extent (equal aspect, as the plain axes), so nothing is
+    measured and no layout pass runs before the single draw in composite()
+    """
+
+    # Figure margins [left, bottom, right, top] in figure fractions
+    MARGINS = (0.04, 0.03, 0.02, 0.08)
+
+    def __init__(self, style):
+        self.style = style
+        self.dpi = style.get('draft_dpi', DRAFT_DPI)
+        self.legend = None  # drawn on the axes, label_placer finds it there
+
+    def _position(self):
+        width, height = self.style['figsize']
+        west, east, south, north = self.style['extent']
+        left, bottom, right, top = self.MARGINS
+        box_w, box_h = width * (1 - left - right), height * (1 - bottom - top)
+        scale = min(box_w / (east - west), box_h / (north - south))
+        axes_w, axes_h = (east - west) * scale / width, (north - south) * scale / height
+        return [left + (1 - left - right - axes_w) / 2, bottom + (1 - bottom - top - axes_h) / 2,
+                axes_w, axes_h]
+
+    def overlay(self):
+        """Figure and axes for the product layers: (fig, ax, None)"""
+        plt = lazy_deps.pyplot()
+        fig = plt.figure(figsize=self.style['figsize'], dpi=self.dpi)
+        fig.patch.set_facecolor('white')
+        ax = fig.add_axes(self._position())
+        west, east, south, north = self.style['extent']
+        ax.set_xlim(west, east)
+        ax.set_ylim(south, north)
+        ax.set_xticks([])
+        ax.set_yticks([])
+        legend = self.style.get('legend')
+        if legend:
+            base_map._add_legend(plt, ax, legend)
+        return fig, ax, None
+
+    def set_title(self, ax, label, **kwargs):
+        return ax.set_title(label, **kwargs)
+
+    def composite(self, fig, output_file):
+        """Draw and save once, in the format of output_file's extension"""
+        fmt = os.path.splitext(output_file)[1][1:].lower()
+        options = {'pil_kwargs': {'compress_level': map_cache.png_compress_level()}} \
+            if fmt == 'png' else {}
+        with instrument.stage('encode', format=fmt, backend='agg'):
+            fig.savefig(output_file, format=fmt, dpi=self.dpi, facecolor='white', **options)
+        return output_file
+
+
+class Backend:
+    """A way to draw a map style: its fidelity, whether it can run here, its canvas"""
+
+    name = None
+    fidelity = None
+
+    def available(self):
+        return True
+
+    def style(self, style):
+        """The style as this backend draws it"""
+        return style
+
+    def canvas(self, style, output_file):
+        """Canvas for one map written to output_file"""
+        return base_map.for_output(self.style(style), output_file)
+
+    def prepare(self, style):
+        """Load what canvas() needs into memory ahead of time (render_daemon.py)"""
+        if map_cache.output_format() == 'png':
+            base_map.get_template(self.style(style))
+
+
+class CartopyBackend(Backend):
+    name = 'cartopy'
+    fidelity = 'geo'
+
+    def available(self):
+        # Probed without importing cartopy, so a cache hit stays cheap; a
+        # broken install still falls back to plain axes in base_map
+        return (not _disabled(os.environ.get('MAP_CARTOPY'))
+                and importlib.util.find_spec('cartopy') is not None)
+
+    def style(self, style):
+        return dict(style, geo=True)
+
+
+class PlainBackend(Backend):
+    name = 'plain'
+    fidelity = 'plain'
+
+    def style(self, style):
+        return dict(style, geo=False)
+
+
+class AggBackend(Backend):
+    name = 'agg'
+    fidelity = 'draft'
+
+    def canvas(self, style, output_file):
+        return DraftCanvas(style)
+
+    def prepare(self, style):
+        pass
+
+
+BACKENDS = {backend.name: backend for backend in (CartopyBackend(), PlainBackend(), AggBackend())}
+
+
+def _rank(fidelity):
+    if fidelity not in FIDELITIES:
+        raise ValueError(f"Unknown fidelity '{fidelity}', expected one of {', '.join(FIDELITIES)}")
+    return FIDELITIES.index(fidelity)
+
+
+def load_timings():
+    """Seconds per map of each backend from the last benchmark, or {}"""
+    try:
+        with open(TIMINGS_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_timings(timings):
+    """Store measured seconds per backend for select() (called by bench_maps.py)"""
+    os.makedirs(os.path.dirname(TIMINGS_FILE), exist_ok=True)
+    tmp = f"{TIMINGS_FILE}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(timings, f, indent=1, sort_keys=True)
+    os.replace(tmp, TIMINGS_FILE)
+
+
+def style_fidelity(style):
+    """Fidelity a style asks for: 'geo' with geo features, else 'plain'"""
+    return 'geo' if style.get('geo') else 'plain'
+
+
+def requested_fidelity(style, fidelity=None):
+    """Fidelity a job asks for: explicit, else MAP_FIDELITY, else the style's own"""
+    fidelity = fidelity or _override.get('fidelity') or os.environ.get('MAP_FIDELITY')
+    if fidelity:
+        _rank(fidelity)
+        return fidelity
+    return style_fidelity(style)
+
+
+def select(style, backend=None, fidelity=None):
+    """The Backend to render a map style with (see the module docstring)"""
+    name = (backend or _override.get('backend') or os.environ.get('MAP_BACKEND') or 'auto').lower()
+    if name != 'auto':
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown MAP_BACKEND '{name}', expected auto or one of "
+                             f"{', '.join(BACKENDS)}")
+        if BACKENDS[name].available():
+            return BACKENDS[name]
+        print(f"Warning: backend {name} not available, choosing one automatically")
+
+    top = _rank(style_fidelity(style))
+    need = min(_rank(requested_fidelity(style, fidelity)), top)
+    available = [b for b in BACKENDS.values() if b.available()]
+    good_enough = [b for b in available if need <= _rank(b.fidelity) <= top]
+    if not good_enough:
+        # Nothing meets the request: the closest below it
+        return max(available, key=lambda b: _rank(b.fidelity))
+    timings = load_timings()
+    return min(good_enough, key=lambda b: timings.get(b.name, DEFAULT_SECONDS[b.name]))
+
+
+@contextlib.contextmanager
+def use(backend=None, fidelity=None):
+    """Render with this backend and/or fidelity inside the block (None keeps the default)"""
+    saved = dict(_override)
+    if backend:
+        _override['backend'] = backend
+    if fidelity:
+        _override['fidelity'] = fidelity
+    try:
+        yield
+    finally:
+        _override.clear()
+        _override.update(saved)
+
+
+def canvas(style, output_file):
+    """Canvas of the selected backend for one map of style written to output_file"""
+    backend = select(style)
+    print(f"Rendering with the {backend.name} backend...")
+    return backend.canvas(style, output_file)
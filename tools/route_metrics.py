@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Distances and delivery paths of a supply-chain network as LaTeX tables
+Entfernungen und Lieferwege eines Liefernetzwerks als LaTeX-Tabellen
+供应链网络的距离与配送路径（LaTeX 表格）
+
+Three computations over a Network (see network.py), all in NumPy:
+
+    distance_matrix   great-circle distances between nodes, computed in row
+                      blocks of at most BLOCK_BYTES each
+    pair_summary      mean and largest distance over all node pairs, reduced
+                      block by block so the N x N matrix never exists
+    delivery_paths    shortest paths along the routes from every production
+                      site at once (multi-source Dijkstra on CSR arrays):
+                      each destination gets its nearest site and path
+
+A block is one matrix product of unit vectors (the cosine of every angle at
+BLAS speed) turned into km through the chord length, 2 R asin(|a - b| / 2),
+which equals the haversine distance without its per-pair sines and cosines.
+
+route_tables() turns them into booktabs tables with trilingual captions,
+written as a .tex file for \\input by the product document.
+"""
+
+import heapq
+import os
+
+import geodesic
+
+# Upper bound for one block of the distance matrix (float64)
+BLOCK_BYTES = 32 * 1024 * 1024
+
+
+def _block_rows(n_cols, block_bytes=BLOCK_BYTES):
+    return max(1, block_bytes // (8 * max(n_cols, 1)))
+
+
+def _block_km(row_vectors, col_vectors):
+    """Great-circle km between unit vectors, rows x columns, computed in place"""
+    import numpy as np
+
+    block = row_vectors @ col_vectors.T
+    # |a - b|^2 = 2 - 2 a.b; distance = 2 R asin(|a - b| / 2)
+    np.multiply(block, -0.5, out=block)
+    np.add(block, 0.5, out=block)
+    np.clip(block, 0.0, 1.0, out=block)
+    np.sqrt(block, out=block)
+    np.arcsin(block, out=block)
+    np.multiply(block, 2 * geodesic.EARTH_RADIUS_KM, out=block)
+    return block
+
+
+def distance_blocks(lons, lats, cols=None, block_bytes=BLOCK_BYTES):
+    """
+    Yield (start, stop, block): great-circle km from rows start:stop to all
+    columns (by default all nodes), one block of at most block_bytes at a time
+    """
+    import numpy as np
+
+    vectors = geodesic._unit_vectors(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+    col_vectors = vectors if cols is None else vectors[cols]
+    step = _block_rows(len(col_vectors), block_bytes)
+    for start in range(0, len(vectors), step):
+        stop = min(start + step, len(vectors))
+        yield start, stop, _block_km(vectors[start:stop], col_vectors)
+
+
+def distance_matrix(lons, lats, out=None, block_bytes=BLOCK_BYTES):
+    """
+    Full N x N distance matrix in km, filled block by block. out may be a
+    preallocated array or np.memmap for matrices larger than memory;
+    otherwise a float32 array is allocated.
+    """
+    import numpy as np
+
+    n = len(lons)
+    if out is None:
+        out = np.empty((n, n), dtype=np.float32)
+    for start, stop, block in distance_blocks(lons, lats, block_bytes=block_bytes):
+        out[start:stop] = block
+    return out
+
+
+def pair_summary(lons, lats, block_bytes=BLOCK_BYTES):
+    """
+    Mean and largest distance over all node pairs, and the pair (i, j) at
+    the largest, reduced over the upper triangle one row block at a time
+    """
+    import numpy as np
+
+    vectors = geodesic._unit_vectors(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+    n = len(vectors)
+    total, largest, pair = 0.0, 0.0, (0, 0)
+    step = _block_rows(n, block_bytes)
+    for start in range(0, n - 1, step):
+        stop = min(start + step, n - 1)
+        # Rows start:stop against columns start:, with the square at the
+        # front cut to its strict upper triangle (j > i)
+        block = _block_km(vectors[start:stop], vectors[start:])
+        width = stop - start
+        block[:, :width] = np.triu(block[:, :width], 1)
+        total += float(block.sum())
+        flat = int(block.argmax())
+        if block.flat[flat] > largest:
+            largest = float(block.flat[flat])
+            pair = (start + flat // block.shape[1], start + flat % block.shape[1])
+    n_pairs = n * (n - 1) // 2
+    return {'mean_km': total / n_pairs if n_pairs else 0.0, 'max_km': largest, 'max_pair': pair}
+
+
+def edge_lengths(net):
+    """Great-circle length in km of every route of a network"""
+    return geodesic.haversine_km(*net.edge_coords())
+
+
+def delivery_paths(n_nodes, edge_src, edge_dst, weights, sources, directed=True):
+    """
+    Multi-source Dijkstra over the route graph.
+
+    Returns (dist, pred, origin) arrays per node: km along the routes from
+    the nearest source (inf if unreachable), the previous node on that path
+    (-1 at sources and unreachable nodes) and the source it starts from.
+    """
+    import numpy as np
+
+    edge_src = np.asarray(edge_src, dtype=np.int64)
+    edge_dst = np.asarray(edge_dst, dtype=np.int64)
+    weights = np.asarray(weights, dtype=float)
+    if not directed:
+        edge_src, edge_dst = (np.concatenate([edge_src, edge_dst]),
+                              np.concatenate([edge_dst, edge_src]))
+        weights = np.concatenate([weights, weights])
+
+    # Compressed sparse rows: neighbours of node i are targets[offsets[i]:offsets[i + 1]]
+    order = np.argsort(edge_src, kind='stable')
+    targets = edge_dst[order].tolist()
+    lengths = weights[order].tolist()
+    offsets = np.searchsorted(edge_src[order], np.arange(n_nodes + 1)).tolist()
+
+    dist = [float('inf')] * n_nodes
+    pred = [-1] * n_nodes
+    origin = [-1] * n_nodes
+    heap = []
+    for source in sources:
+        source = int(source)
+        dist[source] = 0.0
+        origin[source] = source
+        heap.append((0.0, source))
+    heapq.heapify(heap)
+    while heap:
+        d, node = heapq.heappop(heap)
+        if d > dist[node]:
+            continue
+        for k in range(offsets[node], offsets[node + 1]):
+            target = targets[k]
+            candidate = d + lengths[k]
+            if candidate < dist[target]:
+                dist[target] = candidate
+                pred[target] = node
+                origin[target] = origin[node]
+                heapq.heappush(heap, (candidate, target))
+    return np.array(dist), np.array(pred, dtype=np.int64), np.array(origin, dtype=np.int64)
+
+
+def path_to(pred, node):
+    """Node indices from the path's source to node"""
+    path = [int(node)]
+    while pred[path[-1]] >= 0:
+        path.append(int(pred[path[-1]]))
+    return path[::-1]
+
+
+LATEX_SPECIALS = {
+    '\\': r'\textbackslash{}', '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#',
+    '_': r'\_', '{': r'\{', '}': r'\}', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}',
+}
+
+
+def latex_escape(text):
+    return ''.join(LATEX_SPECIALS.get(c, c) for c in str(text))
+
+
+def _km(value):
+    return f"{value:,.0f}".replace(',', '\\,')
+
+
+def _route(names, path, max_stops=5):
+    """'A $\\to$ B $\\to$ C', shortened in the middle for long paths"""
+    stops = [latex_escape(names[i]) for i in path]
+    if len(stops) > max_stops:
+        stops = stops[:2] + [r'\ldots'] + stops[-2:]
+    return r' $\to$ '.join(stops)
+
+
+def _stack(*lines, align='c'):
+    """Lines stacked in one cell, the way the document sets trilingual labels"""
+    return f'\\begin{{tabular}}[b]{{@{{}}{align}@{{}}}}' + r'\\'.join(lines) + r'\end{tabular}'
+
+
+def _table(caption, label, columns, header, rows, note=None):
+    lines = [
+        r'\begin{table}[H]',
+        r'\centering',
+        r'\footnotesize',
+        f'\\caption{{{caption}}}',
+        f'\\label{{{label}}}',
+        f'\\begin{{tabular}}{{{columns}}}',
+        r'\toprule',
+        ' & '.join(header) + r' \\',
+        r'\midrule',
+    ]
+    lines += [' & '.join(row) + r' \\' for row in rows]
+    lines.append(r'\bottomrule')
+    lines.append(r'\end{tabular}')
+    if note:
+        lines += [r'\\[0.5ex]', note]
+    lines.append(r'\end{table}')
+    return '\n'.join(lines)
+
+
+def route_tables(net, matrix_types=('production', 'distribution'), source_type='production',
+                 max_matrix=8, max_rows=25, directed=True, label='route'):
+    """
+    LaTeX source of the distance and delivery-path tables of a network:
+    a distance matrix between the nodes of matrix_types (at most max_matrix),
+    and the shortest delivery path from the nearest source_type site to
+    every other reachable node (at most max_rows, longest last)
+    """
+    import numpy as np
+
+    names = net.names.tolist()
+    summary = pair_summary(net.lons, net.lats)
+    route_km = edge_lengths(net)
+    parts = [f"% Generated from the {len(net)}-node network by tools/route_metrics.py; do not edit"]
+
+    hubs = np.flatnonzero(np.isin(net.node_types(), list(matrix_types)))[:max_matrix]
+    if len(hubs) > 1:
+        matrix = distance_matrix(net.lons[hubs], net.lats[hubs])
+        header = [r'\textbf{km}'] + [f'\\textbf{{{latex_escape(names[i])}}}' for i in hubs]
+        rows = [[latex_escape(names[i])] + ['--' if r == c else _km(matrix[r, c])
+                                            for c in range(len(hubs))]
+                for r, i in enumerate(hubs)]
+        parts.append(_table(
+            'Luftlinie zwischen Standorten (km) / Great-Circle Distances between Sites (km) '
+            '/ 站点间大圆距离（公里）',
+            f'tab:{label}-distances', 'l' + 'r' * len(hubs), header, rows))
+
+    sources = np.flatnonzero(net.type_mask(source_type))
+    if len(sources):
+        dist, pred, origin = delivery_paths(len(net), net.edge_src, net.edge_dst, route_km,
+                                            sources, directed=directed)
+        targets = np.flatnonzero(np.isfinite(dist) & (pred >= 0))
+        targets = targets[np.argsort(dist[targets], kind='stable')]
+        direct = geodesic.haversine_km(net.lons[origin[targets]], net.lats[origin[targets]],
+                                       net.lons[targets], net.lats[targets])
+        rows = []
+        for node, direct_km in list(zip(targets, direct))[:max_rows]:
+            path = path_to(pred, node)
+            rows.append([latex_escape(names[node]), _route(names, path), str(len(path) - 1),
+                         _km(dist[node]), _km(direct_km)])
+        notes = [
+            f"{len(net)} Standorte / sites / 站点, {net.n_edges} Routen / routes / 路线, "
+            f"{_km(route_km.sum())} km; "
+            f"Luftlinie / great-circle / 大圆距离 \\o{{}} {_km(summary['mean_km'])} km, "
+            f"max.\\ {_km(summary['max_km'])} km",
+        ]
+        if len(targets) > max_rows:
+            notes.append(f"{len(targets) - max_rows} weitere Ziele / more destinations / 个其他目的地")
+        unreachable = len(net) - len(targets) - len(sources)
+        if unreachable:
+            notes.append(f"{unreachable} nicht erreichbar / unreachable / 不可达")
+        header = [_stack('Ziel', 'Destination', '目的地', align='l'),
+                  _stack('Route', 'Route', '路线', align='l'),
+                  _stack('Etappen', 'Legs', '段', align='r'),
+                  _stack('Strecke', 'Path', '路径 (km)', align='r'),
+                  _stack('Luftlinie', 'Direct', '直线 (km)', align='r')]
+        parts.append(_table(
+            'Kürzeste Lieferwege ab Produktion / Shortest Delivery Paths from Production '
+            '/ 从生产基地出发的最短配送路径',
+            f'tab:{label}-paths', 'lp{5.5cm}rrr', header, rows,
+            note='{\\scriptsize ' + '; '.join(notes) + '}'))
+    return '\n\n'.join(parts) + '\n'
+
+
+def write_route_tables(net, output_file, **options):
+    """Write route_tables() to output_file; returns output_file"""
+    tmp = f"{output_file}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(route_tables(net, **options))
+    os.replace(tmp, output_file)
+    return output_file
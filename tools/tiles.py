@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+XYZ map tiles of a product network, rendered on demand and cached
+XYZ-Kartenkacheln eines Produktnetzwerks, bei Bedarf gerendert und gespeichert
+产品网络的 XYZ 地图瓦片，按需渲染并缓存
+
+A printed map has one fixed extent. For a zoomable web map the network is
+cut into the usual 256 px Web Mercator tiles ({z}/{x}/{y}.png, as used by
+Leaflet and OpenLayers), drawn as transparent overlays on any base layer.
+
+    tileset = tiles.for_map(module, 'supply-chain')
+    png = tileset.tile(8, 133, 82)        # PNG bytes, or None without data
+    tileset.write_pyramid('out/', range(4, 11))
+
+A TileSet keeps one 256 px figure with a route collection and a marker
+collection per node type. A tile moves the axes limits to it and fills the
+collections with only the routes and markers whose bounding boxes reach
+into it, so it costs one Agg draw of its own elements and no layout pass.
+Markers and lines keep their screen size at every zoom.
+
+Only tiles that intersect data are rendered. tiles_with_data(z) finds them
+without drawing: nodes (padded by their marker radius) and routes (sampled
+every eighth of a tile, padded by half a sample step and the line width)
+are projected to tile indices in one vectorized pass. Other tiles are None,
+and so is a tile that still comes out blank (a gap in a dashed route).
+
+Rendered tiles are kept in an in-memory LRU of TILE_MEMORY tiles and on
+disk under <MAP_CACHE_DIR>/tiles/<key>/{z}/{x}/{y}.png, blank ones as
+empty files. The key covers the network, its styles, the tile parameters
+and the tooling sources like the map cache key, so changed data starts a
+fresh pyramid.
+"""
+
+import math
+import os
+from collections import OrderedDict
+
+import geodesic
+import instrument
+import lazy_deps
+import map_cache
+import map_layers
+import network
+
+TILE_SIZE = 256
+TILE_CACHE_DIR = os.path.join(map_cache.CACHE_DIR, 'tiles')
+
+# Rendered tiles kept in memory per tile set
+TILE_MEMORY = 1024
+
+# Web Mercator is cut off at this latitude
+MAX_LATITUDE = 85.05112878
+
+# Tile parameters; a generator may override them per map kind in <KIND>_TILES
+DEFAULT_TILES = {
+    'min_zoom': None,  # default: the zoom at which the network spans about one tile
+    'max_zoom': None,  # default: min_zoom + 6
+    'route_step_deg': 0.1,
+    'marker_scale': 0.5,  # marker area relative to the printed map
+    'points': {'alpha': 0.8, 'edgecolors': 'black', 'linewidths': 1.0, 'zorder': 5},
+    'routes': {'colors': 'blue', 'linestyles': '--', 'linewidths': 1.5, 'alpha': 0.6,
+               'zorder': 3},
+}
+
+# Highest zoom level served
+MAX_ZOOM = 20
+
+
+def project(lons, lats):
+    """Web Mercator world coordinates in [0, 1], y growing southwards"""
+    import numpy as np
+
+    lons = np.asarray(lons, dtype=float)
+    lats = np.clip(np.asarray(lats, dtype=float), -MAX_LATITUDE, MAX_LATITUDE)
+    x = lons / 360.0 + 0.5
+    y = 0.5 - np.log(np.tan(np.pi / 4 + np.radians(lats) / 2)) / (2 * np.pi)
+    return x, y
+
+
+def tile_extent(z, x, y):
+    """[west, east, south, north] of a tile in degrees"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return [x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0, lat(y + 1), lat(y)]
+
+
+def fit_zoom(extent, tiles_across=1):
+    """Largest zoom at which extent [west, east, south, north] spans about tiles_across tiles"""
+    x0, y0 = project(extent[0], extent[3])
+    x1, y1 = project(extent[1], extent[2])
+    span = max(float(x1 - x0), float(y1 - y0), 1e-9)
+    return int(min(max(math.floor(math.log2(tiles_across / span)), 0), MAX_ZOOM))
+
+
+def _segment_samples(paths, spacing):
+    """Points along (n_i, 2) world-coordinate paths, at most spacing apart"""
+    import numpy as np
+
+    starts = np.concatenate([p[:-1] for p in paths if len(p) > 1] or [np.empty((0, 2))])
+    ends = np.concatenate([p[1:] for p in paths if len(p) > 1] or [np.empty((0, 2))])
+    steps = np.maximum(np.ceil(np.hypot(*(ends - starts).T) / spacing), 1).astype(np.int64)
+    # Segment i contributes steps[i] + 1 points, both ends included
+    counts = steps + 1
+    index = np.repeat(np.arange(len(steps)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    t = (np.arange(counts.sum()) - first) / steps[index]
+    return starts[index] + t[:, None] * (ends - starts)[index]
+
+
+class LRU:
+    """Least recently used mapping with a fixed number of entries"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class TileSet:
+    """
+    Tiles of one network in one style.
+
+    net    : Network (see network.py)
+    styles : marker style per node type, as for map_layers.plot_points
+    key    : cache key; tiles are stored under TILE_CACHE_DIR/<key>
+    params : DEFAULT_TILES, updated with the map's <KIND>_TILES
+    """
+
+    def __init__(self, net, styles, key, params=None, memory=TILE_MEMORY):
+        import numpy as np
+
+        self.net = net
+        self.styles = styles
+        self.key = key
+        self.params = dict(DEFAULT_TILES, **(params or {}))
+        self.memory = LRU(memory)
+        self.cache_dir = os.path.join(TILE_CACHE_DIR, key[:16])
+        self.stats = {'memory': 0, 'disk': 0, 'rendered': 0, 'empty': 0}
+
+        self.xs, self.ys = project(net.lons, net.lats)
+        lonlat_paths = geodesic.great_circle_paths(*net.edge_coords(),
+                                                   step_deg=self.params['route_step_deg'])
+        self.paths = [np.column_stack(project(p[:, 0], p[:, 1])) for p in lonlat_paths]
+        self.sizes = map_layers.fill_sizes(net.sizes, net.node_types(), styles) \
+            * self.params['marker_scale']
+
+        self.extent = net.bounds()
+        self.min_zoom = self.params['min_zoom']
+        if self.min_zoom is None:
+            self.min_zoom = fit_zoom(self.extent)
+        self.max_zoom = self.params['max_zoom']
+        if self.max_zoom is None:
+            self.max_zoom = min(self.min_zoom + 6, MAX_ZOOM)
+        self._with_data = {}
+        self._figure = None
+        self._path_boxes = None
+
+    # -- which tiles have data ------------------------------------------------
+
+    def _pads(self):
+        """
+        How far markers and routes reach beyond their coordinates, in pixels
+        (at 72 dpi, 1 pt = 1 px), with room for edges, caps and antialiasing
+        """
+        import numpy as np
+
+        marker = float(np.sqrt(self.sizes.max()) / 2) if len(self.sizes) else 0.0
+        marker += self.params['points'].get('linewidths', 1.0) + 2
+        line = float(np.max(self.params['routes'].get('linewidths', 1.0))) + 3
+        return marker, line
+
+    def tiles_with_data(self, z):
+        """Sorted set of tile indices x * 2**z + y at zoom z that intersect data"""
+        import numpy as np
+
+        if z in self._with_data:
+            return self._with_data[z]
+        n = 2 ** z
+        pixel = 1.0 / (n * TILE_SIZE)  # one pixel in world units
+        marker_pad, line_pad = self._pads()
+        spacing = 0.125 / n  # an eighth of a tile
+
+        groups = [(self.xs, self.ys, marker_pad * pixel)]
+        if self.paths:
+            samples = _segment_samples(self.paths, spacing)
+            groups.append((samples[:, 0], samples[:, 1], spacing / 2 + line_pad * pixel))
+        keys = []
+        for xs, ys, pad in groups:
+            # pad is below one tile, so the padded box touches at most 2 x 2 tiles
+            for dx in (-pad, pad):
+                for dy in (-pad, pad):
+                    tx = np.clip(np.floor((xs + dx) * n), 0, n - 1).astype(np.int64)
+                    ty = np.clip(np.floor((ys + dy) * n), 0, n - 1).astype(np.int64)
+                    keys.append(tx * n + ty)
+        result = np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+        self._with_data[z] = result
+        return result
+
+    def has_data(self, z, x, y):
+        import numpy as np
+
+        keys = self.tiles_with_data(z)
+        i = int(np.searchsorted(keys, x * 2 ** z + y))
+        return i < len(keys) and keys[i] == x * 2 ** z + y
+
+    def count(self, zooms):
+        """Number of tiles with data over the given zoom levels"""
+        return sum(len(self.tiles_with_data(z)) for z in zooms)
+
+    # -- rendering -------------------------------------------------------------
+
+    def _axes(self):
+        """
+        One transparent 256 px figure with a route collection and one
+        marker collection per node type, created once; render() fills them
+        with the elements of each tile
+        """
+        import numpy as np
+
+        if self._figure is None:
+            plt = lazy_deps.pyplot()
+            fig = plt.figure(figsize=(TILE_SIZE / 72, TILE_SIZE / 72), dpi=72)
+            fig.patch.set_alpha(0)
+            ax = fig.add_axes([0, 0, 1, 1])
+            ax.set_axis_off()
+            ax.patch.set_alpha(0)
+            with instrument.stage('artists', nodes=len(self.net), edges=self.net.n_edges):
+                routes = map_layers.add_paths(ax, [], rasterized=False, **self.params['routes'])
+                types = self.net.node_types()
+                markers = []
+                for type_name, style in self.styles.items():
+                    members = np.flatnonzero(types == type_name)
+                    if len(members):
+                        artist, = map_layers.plot_points(
+                            ax, self.xs[members], self.ys[members], types[members],
+                            {type_name: style}, sizes=self.sizes[members], rasterized=False,
+                            **self.params['points'])
+                        markers.append((artist, members))
+            self._figure = (fig, ax, routes, markers)
+        return self._figure
+
+    def _cull(self, z, x, y):
+        """Fill the collections with the routes and markers reaching into a tile"""
+        import numpy as np
+
+        _, _, routes, markers = self._figure
+        n = 2 ** z
+        marker_pad, line_pad = self._pads()
+        pixel = 1.0 / (n * TILE_SIZE)
+
+        def inside(x0, y0, x1, y1, pad):
+            return ((x1 >= x / n - pad) & (x0 <= (x + 1) / n + pad)
+                    & (y1 >= y / n - pad) & (y0 <= (y + 1) / n + pad))
+
+        if self._path_boxes is None and self.paths:
+            self._path_boxes = np.array([[p[:, 0].min(), p[:, 1].min(), p[:, 0].max(), p[:, 1].max()]
+                                         for p in self.paths])
+        if self.paths:
+            hit = np.flatnonzero(inside(*self._path_boxes.T, line_pad * pixel))
+            routes.set_segments([self.paths[i] for i in hit])
+        for artist, members in markers:
+            xs, ys = self.xs[members], self.ys[members]
+            hit = inside(xs, ys, xs, ys, marker_pad * pixel)
+            artist.set_offsets(np.column_stack([xs[hit], ys[hit]]))
+            artist.set_sizes(self.sizes[members][hit])
+
+    def render(self, z, x, y):
+        """PNG bytes of one tile, drawn now; b'' if it is blank"""
+        import io
+
+        import numpy as np
+        from PIL import Image
+
+        fig, ax, _, _ = self._axes()
+        self._cull(z, x, y)
+        n = 2 ** z
+        ax.set_xlim(x / n, (x + 1) / n)
+        ax.set_ylim((y + 1) / n, y / n)  # world y grows southwards
+        with instrument.stage('tile', z=z):
+            fig.canvas.draw()
+            pixels = np.asarray(fig.canvas.buffer_rgba())
+            if not pixels[..., 3].any():
+                return b''
+            image = Image.fromarray(pixels)
+            buffer = io.BytesIO()
+            image.save(buffer, format='png', compress_level=map_cache.png_compress_level())
+        return buffer.getvalue()
+
+    def _path(self, z, x, y):
+        return os.path.join(self.cache_dir, str(z), str(x), f"{y}.png")
+
+    def tile(self, z, x, y):
+        """PNG bytes of a tile from memory, disk or a fresh render; None without data"""
+        if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValueError(f"No tile {z}/{x}/{y}")
+        data = self.memory.get((z, x, y))
+        if data is not None:
+            self.stats['memory'] += 1
+            return data or None
+        if not self.has_data(z, x, y):
+            self.stats['empty'] += 1
+            return None
+
+        path = self._path(z, x, y)
+        if map_cache.cache_enabled() and os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.stats['disk'] += 1
+        else:
+            data = self.render(z, x, y)
+            self.stats['rendered'] += 1
+            if map_cache.cache_enabled():
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+        self.memory.put((z, x, y), data)
+        return data or None
+
+    def write_pyramid(self, output_dir, zooms=None):
+        """Write {z}/{x}/{y}.png for every tile with data; returns the number written"""
+        zooms = range(self.min_zoom, self.max_zoom + 1) if zooms is None else zooms
+        written = 0
+        for z in zooms:
+            n = 2 ** z
+            for key in self.tiles_with_data(z).tolist():
+                x, y = divmod(key, n)
+                data = self.tile(z, x, y)
+                if data is None:
+                    continue
+                path = os.path.join(output_dir, str(z), str(x), f"{y}.png")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                written += 1
+        return written
+
+    def tilejson(self, url):
+        """TileJSON description of the tile set; url contains {z}/{x}/{y}"""
+        return {
+            'tilejson': '2.2.0',
+            'tiles': [url],
+            'minzoom': self.min_zoom,
+            'maxzoom': self.max_zoom,
+            'bounds': [self.extent[0], self.extent[2], self.extent[1], self.extent[3]],
+        }
+
+    def close(self):
+        if self._figure is not None:
+            lazy_deps.pyplot().close(self._figure[0])
+            self._figure = None
+
+
+def _prefix(kind):
+    return kind.upper().replace('-', '_')
+
+
+def tile_kinds(module):
+    """Map kinds of a generator that can be tiled: those with a network and marker styles"""
+    return [kind for kind in getattr(module, 'MAPS', {})
+            if getattr(module, _prefix(kind) + '_NETWORK', None)
+            and getattr(module, _prefix(kind) + '_STYLES', None)]
+
+
+def tile_key(module, kind):
+    """Cache key of a map kind's tiles; cheap, so callers can check for changes"""
+    import gazetteer
+
+    prefix = _prefix(kind)
+    params = getattr(module, prefix + '_TILES', None) or {}
+    return map_cache.cache_key(
+        inputs={'network': map_cache.file_digest(getattr(module, prefix + '_NETWORK')),
+                'styles': getattr(module, prefix + '_STYLES')},
+        params=dict(DEFAULT_TILES, **params, tile_size=TILE_SIZE),
+        sources=[__file__, geodesic.__file__, map_layers.__file__, network.__file__,
+                 gazetteer.__file__, gazetteer.GAZETTEER_FILE],
+    )
+
+
+def for_map(module, kind, key=None, memory=TILE_MEMORY):
+    """TileSet of one map kind of a loaded generator module"""
+    prefix = _prefix(kind)
+    net = network.load_network(getattr(module, prefix + '_NETWORK'))
+    return TileSet(net, getattr(module, prefix + '_STYLES'), key or tile_key(module, kind),
+                   getattr(module, prefix + '_TILES', None), memory=memory)